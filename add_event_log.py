@@ -0,0 +1,52 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Creates the event_log table behind event_stream.EventBroadcaster.
+
+    Every process (gunicorn worker) appends its events here and LISTENs on the
+    'event_log' channel, so a change made in one worker reaches the SSE clients
+    connected to any other. Rows older than a day are pruned by the listeners.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS event_log (
+                seq BIGSERIAL PRIMARY KEY,
+                channel VARCHAR(100) NOT NULL,
+                event_type VARCHAR(50) NOT NULL,
+                data JSONB NOT NULL DEFAULT '{}',
+                created_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_event_log_channel_seq ON event_log (channel, seq);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_event_log_created_at ON event_log (created_at);")
+
+        conn.commit()
+        logger.info("Successfully created event_log table.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,75 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Routine tables that get the counts; both naming schemes are in use, depending on the deployment
+ROUTINE_TABLES = ('routine', 'anna_routine')
+# Count triggers installed by an earlier version of this script
+MEDIA_TABLES = ('routine_media', 'anna_routine_media')
+
+def migrate_database():
+    """Adds image_count/video_count to the routine tables and backfills them from the media rows.
+
+    Media rows are written to Supabase anna_routine_media while the calendar reads
+    the counts from the local routine table, so a trigger on either side cannot keep
+    them in step, nor can one transaction. The application applies one UPDATE per media
+    write instead (media_upload.update_media_counts), deriving has_images/has_videos
+    from the counts, and recounts from the media rows when it fails and periodically
+    (media_upload.media_count_reconciler). This script drops the count triggers an
+    earlier version installed, so nothing is counted twice, and recounts every routine.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        for media in MEDIA_TABLES:
+            cursor.execute("SELECT to_regclass(%s);", (media,))
+            if cursor.fetchone()[0]:
+                for operation in ('insert', 'delete', 'update'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {media}_counts_{operation} ON {media};")
+            cursor.execute(f"DROP FUNCTION IF EXISTS {media}_maintain_counts();")
+
+        cursor.execute("SELECT to_regclass('routine');")
+        if not cursor.fetchone()[0]:
+            logger.info("Skipping: table 'routine' not found.")
+            conn.commit()
+            return
+
+        for routine in ROUTINE_TABLES:
+            cursor.execute(f"""
+                ALTER TABLE IF EXISTS {routine}
+                    ADD COLUMN IF NOT EXISTS image_count INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS video_count INTEGER NOT NULL DEFAULT 0;
+            """)
+
+        from supabase_tools import supabase
+        from media_upload import count_media, write_media_counts
+        counts = count_media(supabase)
+        backfilled = write_media_counts(cursor, counts)
+        logger.info(f"Backfilled media counts for {backfilled} rows of 'routine' "
+                    f"from {sum(counts.values())} Supabase media rows.")
+
+        conn.commit()
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,50 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tables holding images that get WebP derivatives (see media_derivatives.py); both the
+# original names and the anna_-prefixed ones are used, depending on the deployment
+MEDIA_TABLES = ('routine_media', 'anna_routine_media', 'image_bank', 'anna_image_bank')
+
+def migrate_database():
+    """Adds thumbnail_url and preview_url next to the original URL of every media table.
+
+    Both columns stay NULL until the derivative job has run, and readers fall back
+    to the original, so existing rows keep working without a backfill.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        for table in MEDIA_TABLES:
+            cursor.execute(f"""
+                ALTER TABLE IF EXISTS {table}
+                    ADD COLUMN IF NOT EXISTS thumbnail_url TEXT,
+                    ADD COLUMN IF NOT EXISTS preview_url TEXT;
+            """)
+
+        conn.commit()
+        logger.info("Successfully added 'thumbnail_url' and 'preview_url' to the media tables.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
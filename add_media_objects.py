@@ -0,0 +1,65 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Creates the media_objects table: one row per stored file in the 'conteudo' bucket.
+
+    Objects are named by the SHA-256 of their content (see media_upload.py). Every media
+    row or image bank entry pointing at an object holds one reference; uploads of content
+    that is already stored reuse the object, and the last release removes it. An entry
+    is created before its upload and only marked stored once the upload finished, so a
+    concurrent upload of the same content never reuses an object that is not there.
+
+    The table lives in the local database (DATABASE_URL) while the rows it counts are
+    in Supabase (anna_routine_media, image_bank), so the two cannot change in one
+    transaction: the application deletes a row before releasing its reference, so a
+    failure in between leaves an object with one reference too many (wasted space)
+    and never a row pointing at a removed object.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS media_objects (
+                content_hash TEXT PRIMARY KEY,
+                object_name TEXT NOT NULL,
+                content_type TEXT,
+                size BIGINT,
+                ref_count INTEGER NOT NULL DEFAULT 1 CHECK (ref_count >= 0),
+                stored BOOLEAN NOT NULL DEFAULT FALSE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+        # Tables created before the column: their entries were all uploaded
+        cursor.execute("ALTER TABLE media_objects ADD COLUMN IF NOT EXISTS stored BOOLEAN NOT NULL DEFAULT TRUE;")
+        cursor.execute("ALTER TABLE media_objects ALTER COLUMN stored SET DEFAULT FALSE;")
+        # Deletes find the entry from the media URL, i.e. by object name
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_media_objects_object_name ON media_objects (object_name);")
+
+        conn.commit()
+        logger.info("Successfully created 'media_objects' table.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,85 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    ('contact_id', 'VARCHAR(100)'),
+    ('archived_at', 'TIMESTAMP'),
+    ('consolidated_into', 'INTEGER REFERENCES memories(id) ON DELETE SET NULL'),
+    ('window_start', 'TIMESTAMP'),
+    ('window_end', 'TIMESTAMP'),
+    ('source_count', 'INTEGER NOT NULL DEFAULT 1'),
+    ('decayed_importance', 'REAL')
+)
+
+def migrate_database():
+    """Adds the columns used by memory_consolidation.py to the memories table.
+
+    Conversation memories get the contact they belong to (backfilled from their
+    context), summaries get their time window and source count, and every memory
+    gets a time-decayed importance. Raw rows folded into a summary are archived.
+    Partial indexes cover the job's pending rows and the searched working set.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        for column, definition in COLUMNS:
+            cursor.execute(f"ALTER TABLE memories ADD COLUMN IF NOT EXISTS {column} {definition};")
+        logger.info("Added consolidation columns to 'memories' table.")
+
+        # save_conversation_memory wrote "Session: <session>, User: <user>" as the context
+        cursor.execute("""
+            UPDATE memories
+            SET contact_id = substring(context FROM 'User: (.*)$')
+            WHERE memory_type = 'conversation' AND contact_id IS NULL;
+        """)
+        cursor.execute("""
+            UPDATE memories
+            SET decayed_importance = importance_score
+            WHERE decayed_importance IS NULL;
+        """)
+        logger.info(f"Backfilled {cursor.rowcount} memories.")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_memories_pending_conversations
+            ON memories (contact_id, created_at)
+            WHERE memory_type = 'conversation' AND archived_at IS NULL;
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_memories_working_set
+            ON memories (decayed_importance DESC)
+            WHERE archived_at IS NULL AND is_active;
+        """)
+        # One summary per contact and window: re-running the job updates it in place
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_memories_summary_window
+            ON memories (contact_id, window_start)
+            WHERE memory_type = 'summary';
+        """)
+
+        conn.commit()
+        logger.info("Successfully prepared 'memories' table for consolidation.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
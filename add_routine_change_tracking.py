@@ -0,0 +1,112 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Adds change tracking (change_seq + tombstones) to the routine table.
+
+    Every insert/update stamps the row with the next value of routine_change_seq and
+    the id of the writing transaction (change_txid); every delete leaves a tombstone
+    with both, so /admin/api/activities/changes can answer "what changed since cursor N".
+
+    Writers do not wait for each other, so transactions commit out of sequence order.
+    The cursor is therefore a transaction id: the xmin of a snapshot, below which
+    every transaction has finished. A reader only hands out changes of transactions
+    below it, ordered by (change_txid, change_seq). Rerun this script to upgrade an
+    installed trigger (an earlier version serialized writers with an advisory lock).
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        cursor.execute("CREATE SEQUENCE IF NOT EXISTS routine_change_seq;")
+        # Recreated below; dropped first so the backfills do not fire them
+        cursor.execute("DROP TRIGGER IF EXISTS routine_track_change_write ON routine;")
+        cursor.execute("DROP TRIGGER IF EXISTS routine_track_change_delete ON routine;")
+
+        cursor.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = 'routine' AND column_name = 'change_seq';
+        """)
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE routine ADD COLUMN change_seq BIGINT;")
+            cursor.execute("UPDATE routine SET change_seq = nextval('routine_change_seq');")
+            logger.info("Added 'change_seq' column to 'routine' table.")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_routine_change_seq ON routine (change_seq);")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS routine_tombstones (
+                routine_id UUID PRIMARY KEY,
+                change_seq BIGINT NOT NULL DEFAULT nextval('routine_change_seq'),
+                deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_routine_tombstones_change_seq ON routine_tombstones (change_seq);")
+
+        # Existing changes predate every cursor handed out from now on
+        for table in ('routine', 'routine_tombstones'):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS change_txid BIGINT NOT NULL DEFAULT 0;")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_change_txid ON {table} (change_txid, change_seq);")
+        cursor.execute("ALTER TABLE routine_tombstones ALTER COLUMN change_txid SET DEFAULT txid_current();")
+
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION routine_track_change()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO routine_tombstones (routine_id, change_seq, change_txid, deleted_at)
+                    VALUES (OLD.id, nextval('routine_change_seq'), txid_current(), NOW())
+                    ON CONFLICT (routine_id) DO UPDATE
+                    SET change_seq = EXCLUDED.change_seq, change_txid = EXCLUDED.change_txid,
+                        deleted_at = EXCLUDED.deleted_at;
+                    RETURN OLD;
+                END IF;
+
+                IF TG_OP = 'INSERT' THEN
+                    DELETE FROM routine_tombstones WHERE routine_id = NEW.id;
+                END IF;
+                NEW.change_seq := nextval('routine_change_seq');
+                NEW.change_txid := txid_current();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        cursor.execute("""
+            CREATE TRIGGER routine_track_change_write
+            BEFORE INSERT OR UPDATE ON routine
+            FOR EACH ROW EXECUTE FUNCTION routine_track_change();
+        """)
+        cursor.execute("""
+            CREATE TRIGGER routine_track_change_delete
+            AFTER DELETE ON routine
+            FOR EACH ROW EXECUTE FUNCTION routine_track_change();
+        """)
+
+        conn.commit()
+        logger.info("Successfully installed change tracking on 'routine' table.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,38 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Adds the (date DESC, time_start, id) index used by the paginated activity list."""
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.autocommit = True
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_routine_list_order
+            ON routine (date DESC, time_start ASC, id ASC);
+        """)
+        logger.info("Successfully created 'ix_routine_list_order' index on 'routine' table.")
+
+    except Exception as e:
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
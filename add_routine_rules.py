@@ -0,0 +1,79 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Creates the recurring routine tables (routine_rules + routine_rule_exceptions).
+
+    A rule stores one repeating activity with an RRULE (see routine_recurrence.py);
+    occurrences are never materialized. Exceptions hold per-occurrence overrides or
+    cancellations, keyed by the rule and the occurrence's original date.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS routine_rules (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                activity TEXT NOT NULL,
+                category TEXT NOT NULL,
+                time_start TIME NOT NULL,
+                time_end TIME NOT NULL,
+                status TEXT NOT NULL DEFAULT 'upcoming',
+                description TEXT,
+                location TEXT,
+                rrule TEXT NOT NULL,
+                dtstart DATE NOT NULL,
+                until DATE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+        # Window lookups: dtstart <= end AND (until IS NULL OR until >= start)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_routine_rules_window ON routine_rules (dtstart, until);")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS routine_rule_exceptions (
+                rule_id UUID NOT NULL REFERENCES routine_rules (id) ON DELETE CASCADE,
+                occurrence_date DATE NOT NULL,
+                cancelled BOOLEAN NOT NULL DEFAULT FALSE,
+                date DATE,
+                time_start TIME,
+                time_end TIME,
+                activity TEXT,
+                location TEXT,
+                description TEXT,
+                status TEXT,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                PRIMARY KEY (rule_id, occurrence_date)
+            );
+        """)
+        # Occurrences moved into a window are found by their new date
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_routine_rule_exceptions_date ON routine_rule_exceptions (date);")
+
+        conn.commit()
+        logger.info("Successfully created 'routine_rules' and 'routine_rule_exceptions' tables.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
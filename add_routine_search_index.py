@@ -0,0 +1,93 @@
+import os
+import psycopg2
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Adds a Portuguese full-text search index to the routine table.
+
+    Creates the pt_unaccent text search configuration (portuguese stemming on
+    accent-folded words), a weighted search_vector column kept up to date by a
+    trigger, and a GIN index over it. Used by routine_search.py.
+    """
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent;")
+
+        cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent';")
+        if not cursor.fetchone():
+            cursor.execute("CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = portuguese);")
+            cursor.execute("""
+                ALTER TEXT SEARCH CONFIGURATION pt_unaccent
+                ALTER MAPPING FOR hword, hword_part, word
+                WITH unaccent, portuguese_stem;
+            """)
+            logger.info("Created text search configuration 'pt_unaccent'.")
+
+        cursor.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = 'routine' AND column_name = 'search_vector';
+        """)
+        has_column = cursor.fetchone() is not None
+        if not has_column:
+            cursor.execute("ALTER TABLE routine ADD COLUMN search_vector TSVECTOR;")
+            logger.info("Added 'search_vector' column to 'routine' table.")
+
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION routine_search_vector_update()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('pt_unaccent', COALESCE(NEW.activity, '')), 'A') ||
+                    setweight(to_tsvector('pt_unaccent', COALESCE(NEW.description, '')), 'B') ||
+                    setweight(to_tsvector('pt_unaccent', COALESCE(NEW.location, '')), 'C') ||
+                    setweight(to_tsvector('pt_unaccent', COALESCE(NEW.category, '')), 'D');
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        cursor.execute("DROP TRIGGER IF EXISTS routine_search_vector_trigger ON routine;")
+        cursor.execute("""
+            CREATE TRIGGER routine_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF activity, description, location, category ON routine
+            FOR EACH ROW EXECUTE FUNCTION routine_search_vector_update();
+        """)
+
+        if not has_column:
+            # Backfill through the trigger
+            cursor.execute("UPDATE routine SET activity = activity;")
+            logger.info("Backfilled 'search_vector' for existing routines.")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_routine_search_vector
+            ON routine USING GIN (search_vector);
+        """)
+
+        conn.commit()
+        logger.info("Successfully installed full-text search on 'routine' table.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,85 @@
+import os
+import sys
+import psycopg2
+import logging
+from dotenv import load_dotenv
+from query_paths import TRIGRAM_INDEXES, CONVERSATION_FTS_INDEX
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEXT_TYPES = ('text', 'character varying')
+
+def migrate_database(database_url=None):
+    """Adds pg_trgm GIN indexes for the ILIKE '%term%' searches of the agent tools.
+
+    A leading wildcard cannot use a btree index, so without these every search
+    reads the whole table. Indexes are only created for tables and text columns
+    present in this database (the Supabase and local schemas differ; see
+    query_paths.py for which tool uses which index). Also indexes the full-text
+    search over the conversation memories working set.
+
+    Run it once per database: `python add_trigram_indexes.py` for DATABASE_URL and
+    `python add_trigram_indexes.py "$SUPABASE_DB_URL"` for the Supabase tables.
+    """
+    database_url = database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL environment variable not set.")
+        return
+
+    conn = None
+    try:
+        conn = psycopg2.connect(database_url)
+        cursor = conn.cursor()
+
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        indexed = set()
+
+        for index, table, column in TRIGRAM_INDEXES:
+            cursor.execute("""
+                SELECT data_type
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s;
+            """, (table, column))
+            row = cursor.fetchone()
+            if not row or row[0] not in TEXT_TYPES:
+                logger.info(f"Skipped '{index}': no text column {table}.{column}.")
+                continue
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table} USING GIN ({column} gin_trgm_ops);")
+            indexed.add(table)
+            logger.info(f"Created trigram index '{index}' on {table}.{column}.")
+
+        index, table, statement = CONVERSATION_FTS_INDEX
+        cursor.execute("""
+            SELECT count(*)
+            FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+              AND column_name IN ('content', 'archived_at', 'is_active');
+        """, (table,))
+        has_columns = cursor.fetchone()[0] == 3
+        cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent';")
+        has_config = cursor.fetchone() is not None
+        if has_columns and has_config:
+            cursor.execute(statement)
+            indexed.add(table)
+            logger.info(f"Created full-text index '{index}' on {table}.content.")
+        else:
+            logger.info(f"Skipped '{index}': run add_memory_consolidation.py and add_routine_search_index.py first.")
+
+        for table in sorted(indexed):
+            cursor.execute(f"ANALYZE {table};")
+        conn.commit()
+        logger.info("Successfully added trigram indexes.")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error migrating database: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database(sys.argv[1] if len(sys.argv) > 1 else None)
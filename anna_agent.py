@@ -6,7 +6,8 @@ from google.genai import types
 from database_tools import (get_anna_routines, get_anna_routine_media,
                             search_memories, get_recent_conversations,
                             get_profile_info, search_content,
-                            save_conversation_memory)
+                            save_conversation_memory, search_image_bank,
+                            search_memories_semantic)
 
 
 def create_anna_agent(config: dict):
@@ -25,14 +26,18 @@ def create_anna_agent(config: dict):
     # Get tools enabled settings
     tools_enabled = config.get('tools_enabled', {'routines': True, 'memories': True, 'media': True})
     
+    # 'keyword' (BM25 index) or 'semantic' (vector similarity) memory lookup
+    memory_search = config.get('memory_search', os.getenv('ANNA_MEMORY_SEARCH', 'keyword'))
+    
     # Build tools list based on configuration
     tools = []
     if tools_enabled.get('routines', True):
         tools.extend([get_anna_routines, get_anna_routine_media])
     if tools_enabled.get('memories', True):
-        tools.extend([search_memories, get_recent_conversations, save_conversation_memory])
+        memory_tool = search_memories_semantic if memory_search == 'semantic' else search_memories
+        tools.extend([memory_tool, get_recent_conversations, save_conversation_memory])
     if tools_enabled.get('media', True):
-        tools.extend([search_content])
+        tools.extend([search_content, search_image_bank])
     
     # Always include profile info
     tools.append(get_profile_info)
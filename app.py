@@ -1,21 +1,25 @@
 import os
 import logging
-import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 import uuid
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 from anna_agent import create_anna_agent
-from google.genai.types import Content, Part
-from google.adk.events import Event
 from ai_routine_engine import RoutineSuggestionEngine
 from whatsapp_integration import whatsapp_manager
-from chat_session_manager_postgres import chat_session_manager
+from conversation_pipeline import conversation_pipeline
+from event_stream import admin_events
+from knowledge_index import knowledge_index  # noqa: F401 - subscribes to admin events
+from memory_vectors import memory_vectors  # noqa: F401 - subscribes to admin events
+from memory_consolidation import memory_consolidator
+from media_upload import media_count_reconciler
+from json_provider import init_json_provider
+from response_compression import init_compression, matching_etag
 
 # Configure logging with detailed agent debugging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -32,6 +36,10 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+# Fast JSON serialization (orjson when installed) and gzip/brotli responses
+init_json_provider(app)
+init_compression(app)
+
 # Configure the database with error handling
 database_url = os.environ.get("DATABASE_URL")
 if not database_url:
@@ -111,6 +119,9 @@ def initialize_agent_before_request():
     if not agent_initialized:
         initialize_database()
         init_agent()
+        memory_consolidator.ensure_worker()
+        media_count_reconciler.ensure_worker()
+        admin_events.connect()
         agent_initialized = True
 
 @app.route('/')
@@ -134,166 +145,31 @@ def chat():
         contact_name = data.get('name', 'Usuário Web')
         channel = data.get('channel', 'chat')
         
-        # Get or create chat session
-        chat_session_id = chat_session_manager.get_or_create_session(
-            contact_phone=contact_phone,
-            contact_name=contact_name, 
-            channel=channel
-        )
-        
-        # Save user message
-        chat_session_manager.save_message(
-            session_id=chat_session_id,
-            sender_phone=contact_phone,
-            sender_name=contact_name,
-            content=user_message,
-            is_from_bot=False
-        )
-        
         # Get or create Flask session ID for ADK
         if 'session_id' not in session:
             session['session_id'] = f"session_{os.urandom(8).hex()}"
         
         flask_session_id = session['session_id']
-        user_id = contact_phone
         
         # Get agent_id from request
         agent_id = data.get('agent_id')
 
-        # Run the agent asynchronously
-        response = asyncio.run(run_anna_agent(user_message, user_id, flask_session_id, agent_id))
-        
-        # Save Anna's response
-        if response:
-            chat_session_manager.save_message(
-                session_id=chat_session_id,
-                sender_phone='anna_bot',
-                sender_name='Anna',
-                content=response,
-                is_from_bot=True
-            )
+        # Run the turn through the shared session/history/persistence pipeline
+        result = conversation_pipeline.run_turn(
+            user_message=user_message,
+            contact_phone=contact_phone,
+            contact_name=contact_name,
+            channel=channel,
+            session_id=flask_session_id,
+            agent_id=agent_id
+        )
         
-        return jsonify({
-            'response': response,
-            'session_id': flask_session_id,
-            'chat_session_id': chat_session_id
-        })
+        return jsonify(result)
         
     except Exception as e:
         logging.error(f"Error in chat endpoint: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-async def run_anna_agent(user_message: str, user_id: str, session_id: str, agent_id: str = None):
-    """Run Anna agent with the user message"""
-    try:
-        from google.adk.runners import Runner
-        from google.adk.sessions import InMemorySessionService
-        from supabase_tools import get_agent_config_by_id
-
-        # Get agent configuration
-        if agent_id:
-            config = get_agent_config_by_id(agent_id)
-        else:
-            # Fallback to default active agent
-            from supabase_tools import get_active_agent_configuration
-            config = get_active_agent_configuration()
-
-        if not config:
-            raise Exception("Agent configuration not found")
-
-        # Create agent with the selected configuration
-        agent_to_run = create_anna_agent(config)
-        
-        # Create session service and session
-        session_service = InMemorySessionService()
-        session_obj = await session_service.create_session(
-            app_name="anna_chat", 
-            user_id=user_id, 
-            session_id=session_id
-        )
-        
-        # Load conversation history from database
-        await load_conversation_history(session_obj, user_id, session_id)
-        
-        # Create runner
-        runner = Runner(agent=agent_to_run, app_name="anna_chat", session_service=session_service)
-        agent_logger.debug(f"Anna agent initialized for session {session_id} with agent {agent_to_run.name}")
-        
-        # Create user content
-        content = Content(role='user', parts=[Part(text=user_message)])
-        agent_logger.debug(f"Processing user message: {user_message[:100]}...")
-        
-        # Run agent and collect response
-        events = runner.run_async(user_id=user_id, session_id=session_id, new_message=content)
-        
-        final_response = ""
-        event_count = 0
-        async for event in events:
-            event_count += 1
-            agent_logger.debug(f"Agent event {event_count}: {type(event).__name__}")
-            
-            # Check for function call events safely
-            try:
-                if hasattr(event, 'function_call') and event.function_call:
-                    agent_logger.debug(f"Function call event detected")
-            except AttributeError:
-                pass
-            
-            # Check for final response safely
-            try:
-                if hasattr(event, 'is_final_response') and event.is_final_response():
-                    if hasattr(event, 'content') and event.content and hasattr(event.content, 'parts') and event.content.parts:
-                        final_response = event.content.parts[0].text if len(event.content.parts) > 0 else ""
-                        agent_logger.debug(f"Final response generated: {final_response[:100]}...")
-                    break
-            except (AttributeError, IndexError):
-                pass
-        
-        agent_logger.info(f"Agent processing completed for session {session_id} with {event_count} events")
-        
-        # Save conversation to database
-        if final_response:
-            await save_conversation_turn(user_id, session_id, user_message, final_response)
-        
-        return final_response or "Desculpe, não consegui processar sua mensagem no momento."
-        
-    except Exception as e:
-        logging.error(f"Error running Anna agent: {e}")
-        return "Desculpe, ocorreu um erro interno. Tente novamente em alguns instantes."
-
-async def load_conversation_history(session_obj, user_id: str, session_id: str):
-    """Load conversation history from chat sessions into ADK session"""
-    try:
-        # Get chat sessions for this user/phone
-        sessions = chat_session_manager.get_contact_sessions(user_id)
-        
-        # Load messages from the most recent session
-        if sessions:
-            latest_session = sessions[0]  # Most recent session
-            messages = chat_session_manager.get_session_messages(latest_session['id'], limit=20)
-            
-            # Add messages to ADK session history
-            for msg in messages:
-                if msg['is_from_bot']:
-                    # Assistant message
-                    assistant_content = Content(role='model', parts=[Part(text=msg['content'])])
-                    session_obj.events.append(Event(author='model', content=assistant_content))
-                else:
-                    # User message
-                    user_content = Content(role='user', parts=[Part(text=msg['content'])])
-                    session_obj.events.append(Event(author='user', content=user_content))
-                    
-            logging.info(f"Loaded {len(messages)} messages for ADK session {session_id}")
-        
-    except Exception as e:
-        logging.error(f"Error loading conversation history: {e}")
-
-async def save_conversation_turn(user_id: str, session_id: str, user_message: str, assistant_response: str):
-    """Save conversation turn - handled by ChatSessionManager in main chat endpoint"""
-    # This function is no longer needed as messages are saved directly in chat endpoint
-    logging.info(f"Conversation turn handled by ChatSessionManager for session {session_id}")
-    pass
-
 # Admin routes
 @app.route('/admin')
 def admin():
@@ -307,66 +183,111 @@ def config():
 
 @app.route('/admin/api/activities')
 def admin_get_activities():
-    """Get all activities for calendar display from PostgreSQL"""
+    """Get activities in the visible calendar window for FullCalendar from PostgreSQL
+    
+    Accepts FullCalendar's `start`/`end` (end exclusive) and answers with a strong
+    ETag derived from the window's row count and max(updated_at), so unchanged
+    views are revalidated with a 304 instead of being re-serialized. Recurring
+    routines are expanded for the window. The X-Change-Cursor header seeds delta
+    sync via /admin/api/activities/changes (materialized routines only).
+    """
     try:
         from models import Routine
-        
-        routines = db.session.query(Routine).order_by(Routine.date.asc()).all()
-        
-        # Format for FullCalendar
-        events = []
-        for activity in routines:
-            # Format date and time properly for FullCalendar
-            date_str = activity.date.isoformat() if activity.date else ''
-            time_start_str = activity.time_start.strftime('%H:%M:%S') if activity.time_start else '00:00:00'
-            time_end_str = activity.time_end.strftime('%H:%M:%S') if activity.time_end else '23:59:59'
-            
-            events.append({
-                'id': str(activity.id),  # Convert UUID to string
-                'title': activity.activity,
-                'start': f"{date_str}T{time_start_str}",
-                'end': f"{date_str}T{time_end_str}",
-                'className': f"fc-event-{activity.category}",
-                'extendedProps': {
-                    'category': activity.category,
-                    'status': activity.status,
-                    'location': activity.location,
-                    'description': activity.description,
-                    'has_images': activity.has_images or False,
-                    'has_videos': activity.has_videos or False
-                }
-            })
-        
-        return jsonify(events)
+        from datetime import datetime
+        from sqlalchemy import func
+        import hashlib
+        
+        filters = []
+        start = request.args.get('start')
+        end = request.args.get('end')
+        if start:
+            filters.append(Routine.date >= datetime.strptime(start[:10], '%Y-%m-%d').date())
+        if end:
+            filters.append(Routine.date < datetime.strptime(end[:10], '%Y-%m-%d').date())
+        
+        # Cheap fingerprint of the window, answered from the date index, plus the recurrence tables
+        from routine_recurrence import recurrence_fingerprint
+        count, last_update = db.session.query(
+            func.count(Routine.id), func.max(Routine.updated_at)
+        ).filter(*filters).one()
+        fingerprint = (f"{start}|{end}|{count}|{last_update.isoformat() if last_update else ''}"
+                       f"|{recurrence_fingerprint()}")
+        etag = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+        
+        # Taken before reading rows, so replaying changes from it is always safe
+        cursor = get_routine_change_cursor()
+        
+        # The client may hold the gzip/br variant, whose tag carries an encoding suffix
+        cached_etag = matching_etag(etag)
+        if cached_etag:
+            response = app.response_class(status=304)
+            response.set_etag(cached_etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.headers['X-Change-Cursor'] = str(cursor)
+            return response
+        
+        # Only the columns the calendar renders, serialized straight from row tuples
+        from routine_read_model import select_activities, activities_to_events
+        events = activities_to_events(select_activities(*filters, order_by=[Routine.date.asc()]))
+        
+        # Recurring routines are expanded for the window only (FullCalendar always sends one)
+        if start and end:
+            from datetime import timedelta
+            from routine_recurrence import expand_occurrences, occurrence_to_event
+            events.extend(occurrence_to_event(row) for row in expand_occurrences(
+                datetime.strptime(start[:10], '%Y-%m-%d').date(),
+                datetime.strptime(end[:10], '%Y-%m-%d').date() - timedelta(days=1)
+            ))
+        
+        response = jsonify(events)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Change-Cursor'] = str(cursor)
+        return response
     except Exception as e:
         logging.error(f"Error getting activities: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/api/events')
+def admin_event_stream():
+    """Server-Sent Events stream of admin data changes
+    
+    Event types: routine, media, memory, image, chat_session and client. Routine
+    events only carry the id; clients pull the rows via /admin/api/activities/changes.
+    Reconnects resume from Last-Event-ID, or receive `resync` when too far behind.
+    The response ends after SSE_MAX_SECONDS so a worker thread is never held by an
+    idle tab; EventSource reconnects on its own (see gunicorn.conf.py).
+    """
+    last_seq = request.headers.get('Last-Event-ID', type=int)
+    return Response(
+        admin_events.stream(last_seq=last_seq),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/admin/api/activities/<activity_id>')
 def admin_get_activity(activity_id):
     """Get specific activity details from PostgreSQL"""
     try:
         from models import Routine
         
-        routine = db.session.query(Routine).filter(Routine.id == activity_id).first()
+        from routine_read_model import select_activities, activity_to_dict
+        from routine_recurrence import parse_occurrence_id, get_occurrence, occurrence_to_dict
         
-        if not routine:
+        # Occurrence of a recurring routine: '<rule id>:<date>'
+        occurrence = parse_occurrence_id(activity_id)
+        if occurrence:
+            row = get_occurrence(*occurrence)
+            if not row:
+                return jsonify({'error': 'Activity not found'}), 404
+            return jsonify(occurrence_to_dict(row))
+        
+        rows = select_activities(Routine.id == activity_id, limit=1)
+        
+        if not rows:
             return jsonify({'error': 'Activity not found'}), 404
             
-        activity_data = {
-            'id': str(routine.id),  # Convert UUID to string
-            'date': routine.date.isoformat() if routine.date else None,
-            'time_start': routine.time_start.strftime('%H:%M') if routine.time_start else None,
-            'time_end': routine.time_end.strftime('%H:%M') if routine.time_end else None,
-            'activity': routine.activity,
-            'category': routine.category,
-            'location': routine.location,
-            'description': routine.description,
-            'status': routine.status,
-            'has_images': routine.has_images,
-            'has_videos': routine.has_videos,
-            'created_at': routine.created_at.isoformat() if routine.created_at else None
-        }
+        activity_data = activity_to_dict(rows[0])
         
         return jsonify(activity_data)
     except Exception as e:
@@ -383,39 +304,75 @@ def admin_get_activities_by_date(date):
         # Convert date string to date object for database query
         date_obj = datetime.strptime(date, '%Y-%m-%d').date()
         
-        routines = db.session.query(Routine).filter(
-            Routine.date == date_obj
-        ).order_by(Routine.time_start.asc()).all()
-        
-        activities = []
-        for routine in routines:
-            activity_data = {
-                'id': str(routine.id),  # Convert UUID to string
-                'date': routine.date.isoformat() if routine.date else None,
-                'time_start': routine.time_start.strftime('%H:%M') if routine.time_start else None,
-                'time_end': routine.time_end.strftime('%H:%M') if routine.time_end else None,
-                'activity': routine.activity,
-                'category': routine.category,
-                'location': routine.location,
-                'description': routine.description,
-                'status': routine.status,
-                'has_images': routine.has_images,
-                'has_videos': routine.has_videos
-            }
-            activities.append(activity_data)
+        from routine_read_model import select_activities, activities_to_dicts
+        from routine_recurrence import expand_occurrences, occurrence_to_dict
+        
+        activities = activities_to_dicts(select_activities(
+            Routine.date == date_obj, order_by=[Routine.time_start.asc()]
+        ))
+        
+        # Recurring routines occurring that day, merged in time order
+        occurrences = [occurrence_to_dict(row) for row in expand_occurrences(date_obj, date_obj)]
+        if occurrences:
+            activities = sorted(activities + occurrences, key=lambda activity: activity['time_start'] or '')
         
         return jsonify(activities)
     except Exception as e:
         logging.error(f"Error getting activities by date: {e}")
         return jsonify({'error': str(e)}), 500
 
+def list_sort_key(row):
+    """List view order (date DESC, time_start ASC, id ASC) for rows in ACTIVITY_FIELDS order
+    
+    Ids compare as text, which matches PostgreSQL's uuid ordering and places
+    occurrence ids ('<rule uuid>:<date>') consistently among routine ids.
+    """
+    return (-row[3].toordinal(), row[4], str(row[0]))
+
+def encode_list_cursor(row):
+    """Opaque keyset cursor for the list view: position after (date, time_start, id)"""
+    import base64
+    import json
+    
+    position = [row[3].isoformat(), row[4].strftime('%H:%M:%S'), str(row[0])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_list_cursor(cursor):
+    """Inverse of encode_list_cursor; raises ValueError on a malformed cursor
+    
+    The id comes back as text: a routine uuid or an occurrence id.
+    """
+    import base64
+    import json
+    from datetime import datetime
+    from routine_recurrence import parse_occurrence_id
+    
+    try:
+        date_str, time_str, routine_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        occurrence = parse_occurrence_id(routine_id)
+        routine_id = f"{occurrence[0]}:{occurrence[1].isoformat()}" if occurrence else str(uuid.UUID(routine_id))
+        return (datetime.strptime(date_str, '%Y-%m-%d').date(),
+                datetime.strptime(time_str, '%H:%M:%S').time(),
+                routine_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
 @app.route('/admin/api/activities/list')
 def admin_get_activities_list():
-    """Get all activities for list view with filtering support"""
+    """Get one page of activities for the list view, grouped by date, with filtering support
+    
+    Keyset pagination on (date DESC, time_start ASC, id): pass `cursor` from the
+    previous page's `next_cursor` and an optional `limit` (page size). Occurrences
+    of recurring routines are merged into the same order. The body is streamed
+    group by group as {"groups": {date: [...]}, "next_cursor", "has_more"}; a date
+    can continue on the next page.
+    """
     try:
         from models import Routine
-        from datetime import datetime
-        from sqlalchemy import func
+        from datetime import datetime, date, timedelta
+        from sqlalchemy import and_, or_
+        from flask import stream_with_context
+        from routine_read_model import activity_columns, activity_to_dict, dumps
         
         # Get filter parameters
         category_filter = request.args.get('category')
@@ -423,9 +380,11 @@ def admin_get_activities_list():
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
         search_term = request.args.get('search')
+        cursor = request.args.get('cursor')
+        page_size = max(1, min(request.args.get('limit', 50, type=int), 500))
         
-        # Start with base query
-        query = db.session.query(Routine)
+        # Only the columns the list renders
+        query = db.session.query(*activity_columns())
         
         # Apply filters
         if category_filter:
@@ -443,44 +402,178 @@ def admin_get_activities_list():
             query = query.filter(Routine.date <= date_to_obj)
             
         if search_term:
-            query = query.filter(
-                func.lower(Routine.activity).contains(search_term.lower()) |
-                func.lower(Routine.description).contains(search_term.lower()) |
-                func.lower(Routine.location).contains(search_term.lower())
-            )
-        
-        # Order by date and time
-        routines = query.order_by(Routine.date.desc(), Routine.time_start.asc()).all()
+            # Full-text match on the GIN-indexed search_vector
+            from routine_search import routine_search_filter
+            query = query.filter(routine_search_filter(search_term))
         
-        # Group by date
-        activities_by_date = {}
-        for routine in routines:
-            date_str = routine.date.isoformat() if routine.date else 'sem-data'
+        if cursor:
+            try:
+                after_date, after_time, after_id = decode_list_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            # An occurrence id starts with its rule's uuid, which orders it the same way here
+            query = query.filter(or_(
+                Routine.date < after_date,
+                and_(Routine.date == after_date, or_(
+                    Routine.time_start > after_time,
+                    and_(Routine.time_start == after_time, Routine.id > uuid.UUID(after_id[:36]))
+                ))
+            ))
+        
+        # One extra row tells whether another page exists
+        rows = query.order_by(
+            Routine.date.desc(), Routine.time_start.asc(), Routine.id.asc()
+        ).limit(page_size + 1).all()
+        
+        # Merge in recurring occurrences between this page's last possible date and its
+        # first one; open-ended series are listed up to HORIZON_DAYS ahead
+        from routine_recurrence import HORIZON_DAYS, expand_occurrences, occurrence_to_dict
+        high = date.today() + timedelta(days=HORIZON_DAYS)
+        if date_to:
+            high = min(high, date_to_obj)
+        if cursor:
+            high = min(high, after_date)
+        if len(rows) > page_size:
+            low = rows[-1].date
+        else:
+            low = date_from_obj if date_from else date.min
+        
+        occurrences = []
+        if low <= high:
+            occurrences = expand_occurrences(low, high, category=category_filter, status=status_filter,
+                                             search=search_term)
+            if cursor:
+                after_key = list_sort_key((after_id, None, None, after_date, after_time))
+                occurrences = [row for row in occurrences if list_sort_key(row) > after_key]
+        if occurrences:
+            rows = sorted(list(rows) + occurrences, key=list_sort_key)[:page_size + 1]
+        
+        def generate():
+            yield '{"groups":{'
+            current_date = None
+            group = []
+            last_row = None
+            has_more = len(rows) > page_size
+            
+            for routine in rows[:page_size]:
+                last_row = routine
+                
+                date_str = routine[3].isoformat() if routine[3] else 'sem-data'
+                if date_str != current_date:
+                    # Rows are ordered by date, so each group is complete once the date changes
+                    if current_date is not None:
+                        yield f"{dumps(current_date)}:{dumps(group)},"
+                    current_date = date_str
+                    group = []
+                
+                group.append(occurrence_to_dict(routine) if len(routine) > 12 else activity_to_dict(routine))
             
-            if date_str not in activities_by_date:
-                activities_by_date[date_str] = []
+            if current_date is not None:
+                yield f"{dumps(current_date)}:{dumps(group)}"
             
-            activity_data = {
-                'id': str(routine.id),
-                'date': routine.date.isoformat() if routine.date else None,
-                'time_start': routine.time_start.strftime('%H:%M') if routine.time_start else None,
-                'time_end': routine.time_end.strftime('%H:%M') if routine.time_end else None,
-                'activity': routine.activity,
-                'category': routine.category,
-                'location': routine.location,
-                'description': routine.description,
-                'status': routine.status,
-                'has_images': routine.has_images or False,
-                'has_videos': routine.has_videos or False,
-                'created_at': routine.created_at.isoformat() if routine.created_at else None
-            }
-            activities_by_date[date_str].append(activity_data)
-        
-        return jsonify(activities_by_date)
+            next_cursor = encode_list_cursor(last_row) if has_more else None
+            yield f'}},"next_cursor":{dumps(next_cursor)},"has_more":{dumps(has_more)}}}'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json')
     except Exception as e:
         logging.error(f"Error getting activities list: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/api/activities/search')
+def admin_search_activities():
+    """Ranked full-text search over activities (Portuguese, accent-insensitive)"""
+    try:
+        from routine_search import search_routines
+        
+        results = search_routines(
+            request.args.get('q', ''),
+            limit=min(request.args.get('limit', 20, type=int), 200),
+            category=request.args.get('category') or None,
+            status=request.args.get('status') or None,
+            date_from=request.args.get('date_from') or None,
+            date_to=request.args.get('date_to') or None
+        )
+        return jsonify({'success': True, 'total': len(results), 'results': results})
+    except Exception as e:
+        logging.error(f"Error searching activities: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def get_routine_change_cursor():
+    """Current position of the routine change stream: the oldest transaction still running
+    
+    Every change carries the id of the transaction that wrote it (change_txid, see
+    add_routine_change_tracking.py). Transactions commit out of order, but all of
+    those below the snapshot's xmin have finished, so their changes are final and
+    the next ones to show up have an id at or above it.
+    """
+    return db.session.execute(db.text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+@app.route('/admin/api/activities/changes')
+def admin_get_activity_changes():
+    """Get routines changed or deleted since a change cursor (delta sync)
+    
+    Returns `changed` activities and `deleted` ids written by transactions from
+    `since` up to the current cursor, plus the cursor to send next time. Changes of
+    transactions still running wait for the next call. `has_more` asks the client
+    to call again right away; `reset` means the cursor is unknown and a full reload
+    is required.
+    """
+    try:
+        from models import Routine, RoutineTombstone
+        from routine_read_model import select_activities, activities_to_dicts
+        
+        current = get_routine_change_cursor()
+        since = request.args.get('since', type=int)
+        if since is None or since > current:
+            return jsonify({
+                'cursor': current,
+                'changed': [],
+                'deleted': [],
+                'has_more': False,
+                'reset': since is not None
+            })
+        
+        limit = min(request.args.get('limit', 500, type=int), 2000)
+        
+        # Activity columns plus change_txid as the trailing column
+        routines = select_activities(
+            Routine.change_txid >= since, Routine.change_txid < current,
+            order_by=[Routine.change_txid.asc(), Routine.change_seq.asc()], limit=limit,
+            extra=[Routine.change_txid]
+        )
+        tombstones = db.session.query(RoutineTombstone).filter(
+            RoutineTombstone.change_txid >= since, RoutineTombstone.change_txid < current
+        ).order_by(RoutineTombstone.change_txid.asc(), RoutineTombstone.change_seq.asc()).limit(limit).all()
+        
+        # The cursor is a transaction id, so pages end on whole transactions: stop before
+        # the lowest transaction where either stream was cut off
+        has_more = False
+        cutoff = current
+        if len(routines) == limit:
+            cutoff = min(cutoff, routines[-1][-1])
+            has_more = True
+        if len(tombstones) == limit:
+            cutoff = min(cutoff, tombstones[-1].change_txid)
+            has_more = True
+        if cutoff == since:
+            # One transaction larger than a page: send it whole
+            cutoff = since + 1
+            routines = select_activities(Routine.change_txid == since, extra=[Routine.change_txid])
+            tombstones = db.session.query(RoutineTombstone).filter(RoutineTombstone.change_txid == since).all()
+        changed = activities_to_dicts(routine for routine in routines if routine[-1] < cutoff)
+        tombstones = [tombstone for tombstone in tombstones if tombstone.change_txid < cutoff]
+        
+        return jsonify({
+            'cursor': cutoff,
+            'changed': changed,
+            'deleted': [str(tombstone.routine_id) for tombstone in tombstones],
+            'has_more': has_more,
+            'reset': False
+        })
+    except Exception as e:
+        logging.error(f"Error getting activity changes: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/admin/api/activities/filters')
 def admin_get_filter_options():
     """Get available filter options for list view"""
@@ -509,6 +602,11 @@ def admin_get_activity_media(activity_id):
     """Get media for specific activity"""
     try:
         from supabase_tools import supabase
+        from routine_recurrence import parse_occurrence_id
+        
+        # Occurrences of recurring routines have no media of their own
+        if parse_occurrence_id(activity_id):
+            return jsonify([])
         response = supabase.table('anna_routine_media').select('*').eq('routine_id', activity_id).execute()
         return jsonify(response.data)
     except Exception as e:
@@ -578,6 +676,10 @@ def admin_create_activity():
 @app.route('/admin/api/activities/<activity_id>', methods=['PUT'])
 def admin_update_activity(activity_id):
     """Update existing activity in PostgreSQL"""
+    # Both PUT handlers share this URL and Flask only routes to the first one
+    if request.mimetype == 'multipart/form-data':
+        return admin_update_activity_supabase(activity_id)
+    
     try:
         from models import Routine
         from datetime import datetime
@@ -589,6 +691,16 @@ def admin_update_activity(activity_id):
             
         logging.info(f"Updating activity {activity_id} with data: {data}")
         
+        # Editing one occurrence of a recurring routine stores an override for it
+        from routine_recurrence import parse_occurrence_id
+        occurrence = parse_occurrence_id(activity_id)
+        if occurrence:
+            try:
+                save_occurrence_exception(*occurrence, data)
+            except LookupError:
+                return jsonify({'error': 'Activity not found'}), 404
+            return jsonify({'success': True, 'message': 'Atividade atualizada com sucesso!'})
+        
         # Find the activity
         routine = db.session.query(Routine).filter(Routine.id == activity_id).first()
         
@@ -616,6 +728,7 @@ def admin_update_activity(activity_id):
         
         db.session.commit()
         logging.info(f"Activity {activity_id} updated successfully")
+        admin_events.publish('routine', {'action': 'updated', 'id': str(routine.id)})
         
         return jsonify({
             'success': True, 
@@ -633,6 +746,16 @@ def admin_delete_activity(activity_id):
     try:
         from models import Routine
         
+        # Deleting one occurrence of a recurring routine cancels just that date
+        from routine_recurrence import parse_occurrence_id
+        occurrence = parse_occurrence_id(activity_id)
+        if occurrence:
+            try:
+                save_occurrence_exception(*occurrence, cancel=True)
+            except LookupError:
+                return jsonify({'error': 'Activity not found'}), 404
+            return jsonify({'success': True, 'message': 'Ocorrência cancelada com sucesso!'})
+        
         # Use dual sync system for delete
         from dual_database_sync import dual_sync
         
@@ -652,86 +775,544 @@ def admin_delete_activity(activity_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+ACTIVITY_BATCH_MAX = 500
+ACTIVITY_TEXT_FIELDS = ('activity', 'category', 'location', 'description', 'status')
+
+def parse_activity_operation(item):
+    """Validate one /admin/api/activities/batch item and convert its fields
+
+    Returns {'op', 'id', 'fields'} for DualDatabaseSync.sync_routine_batch; raises
+    ValueError with a user-facing message when the item is invalid.
+    """
+    from datetime import datetime
+
+    if not isinstance(item, dict):
+        raise ValueError('Operação inválida')
+    action = item.get('op')
+    if action not in ('create', 'update', 'delete'):
+        raise ValueError(f"Operação desconhecida: {action}")
+
+    activity_id = None
+    if action != 'create':
+        try:
+            activity_id = str(uuid.UUID(str(item.get('id'))))
+        except ValueError:
+            raise ValueError('ID de atividade inválido')
+
+    data = item.get('data') or {}
+    fields = {}
+    if action == 'create':
+        for field in ('date', 'activity', 'category'):
+            if not data.get(field):
+                raise ValueError(f'Campo obrigatório: {field}')
+    if action != 'delete':
+        if 'date' in data:
+            fields['date'] = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        for field in ('time_start', 'time_end'):
+            if data.get(field):
+                fields[field] = datetime.strptime(data[field][:5], '%H:%M').time()
+            elif field in data:
+                raise ValueError(f'Campo obrigatório: {field}')
+        for field in ACTIVITY_TEXT_FIELDS:
+            if field in data:
+                fields[field] = data[field]
+        if action == 'create':
+            # Same defaults as admin_create_activity
+            fields.setdefault('time_start', datetime.strptime('00:00', '%H:%M').time())
+            fields.setdefault('time_end', datetime.strptime('23:59', '%H:%M').time())
+            fields.setdefault('location', '')
+            fields.setdefault('description', '')
+
+    return {'op': action, 'id': activity_id, 'fields': fields}
+
+@app.route('/admin/api/activities/batch', methods=['POST'])
+def admin_batch_activities():
+    """Create, update and delete many activities in one request
+
+    Body: {"operations": [{"op": "create"|"update"|"delete", "id": ..., "data": {...}}],
+    "atomic": false}. All valid operations share one PostgreSQL transaction (one
+    savepoint each) and one bulk Supabase upsert/delete. With "atomic", any failure
+    rolls the whole batch back. Results come back per item, in request order.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        items = payload.get('operations') if isinstance(payload, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'No operations provided'}), 400
+        if len(items) > ACTIVITY_BATCH_MAX:
+            return jsonify({'error': f'Máximo de {ACTIVITY_BATCH_MAX} operações por lote'}), 400
+        atomic = bool(payload.get('atomic'))
+
+        results = [None] * len(items)
+        operations = []
+        positions = []
+        for index, item in enumerate(items):
+            try:
+                operations.append(parse_activity_operation(item))
+                positions.append(index)
+            except (ValueError, TypeError) as e:
+                action = item.get('op') if isinstance(item, dict) else None
+                results[index] = {'index': index, 'op': action, 'id': None, 'success': False, 'error': str(e)}
+
+        if atomic and len(operations) < len(items):
+            return jsonify({'success': False, 'applied': 0, 'failed': len(items), 'results': [
+                result or {'index': index, 'op': items[index].get('op'), 'id': items[index].get('id'),
+                           'success': False, 'skipped': True,
+                           'error': 'Not applied: another operation in the batch is invalid'}
+                for index, result in enumerate(results)
+            ]}), 400
+
+        if operations:
+            from dual_database_sync import dual_sync
+            for position, result in zip(positions, dual_sync.sync_routine_batch(operations, atomic=atomic)):
+                result['index'] = position
+                results[position] = result
+
+        succeeded = sum(1 for result in results if result['success'])
+        logging.info(f"Activity batch: {succeeded}/{len(items)} operations applied")
+        return jsonify({
+            'success': succeeded == len(items),
+            'applied': succeeded,
+            'failed': len(items) - succeeded,
+            'results': results
+        })
+
+    except Exception as e:
+        logging.error(f"Error applying activity batch: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+ACTIVITY_COPY_MAX_DAYS = 366
+
+@app.route('/admin/api/activities/copy', methods=['POST'])
+def admin_copy_activities():
+    """Copy every activity in a date range to another range, server-side
+
+    Body: {"source_start", "source_end", "target_start"} as YYYY-MM-DD (source
+    range inclusive), optional "categories" list and "skip_existing" (default
+    true: activities already present on the target day are not duplicated).
+    """
+    try:
+        from datetime import datetime
+        from dual_database_sync import dual_sync
+
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        for field in ('source_start', 'source_end', 'target_start'):
+            if not data.get(field):
+                return jsonify({'error': f'Campo obrigatório: {field}'}), 400
+
+        try:
+            source_start, source_end, target_start = (
+                datetime.strptime(data[field], '%Y-%m-%d').date()
+                for field in ('source_start', 'source_end', 'target_start')
+            )
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Datas devem estar no formato YYYY-MM-DD'}), 400
+        if source_end < source_start:
+            return jsonify({'error': 'source_end deve ser igual ou posterior a source_start'}), 400
+        if (source_end - source_start).days >= ACTIVITY_COPY_MAX_DAYS:
+            return jsonify({'error': f'Intervalo máximo de {ACTIVITY_COPY_MAX_DAYS} dias'}), 400
+        if target_start == source_start:
+            return jsonify({'error': 'target_start deve ser diferente de source_start'}), 400
+
+        categories = data.get('categories') or None
+        if categories is not None and (not isinstance(categories, list)
+                                       or not all(isinstance(category, str) for category in categories)):
+            return jsonify({'error': 'categories deve ser uma lista'}), 400
+
+        result = dual_sync.sync_routine_copy(
+            source_start, source_end, target_start,
+            categories=categories,
+            skip_existing=data.get('skip_existing', True) is not False
+        )
+        return jsonify({'success': True, **result})
+
+    except Exception as e:
+        logging.error(f"Error copying activities: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def parse_rule_fields(data, partial=False):
+    """Validate and convert /admin/api/routine-rules fields; raises ValueError with a user-facing message"""
+    from datetime import datetime
+    from routine_recurrence import parse_rrule
+
+    if not partial:
+        for field in ('activity', 'category', 'rrule', 'dtstart', 'time_start', 'time_end'):
+            if not data.get(field):
+                raise ValueError(f'Campo obrigatório: {field}')
+
+    fields = {}
+    if 'rrule' in data:
+        parse_rrule(data['rrule'])
+        fields['rrule'] = data['rrule'].upper().removeprefix('RRULE:')
+    if 'dtstart' in data:
+        fields['dtstart'] = datetime.strptime(data['dtstart'], '%Y-%m-%d').date()
+    if 'until' in data:
+        fields['until'] = datetime.strptime(data['until'], '%Y-%m-%d').date() if data['until'] else None
+    for field in ('time_start', 'time_end'):
+        if field in data:
+            if not data[field]:
+                raise ValueError(f'Campo obrigatório: {field}')
+            fields[field] = datetime.strptime(data[field][:5], '%H:%M').time()
+    for field in ACTIVITY_TEXT_FIELDS:
+        if field in data:
+            fields[field] = data[field]
+    return fields
+
+def rule_to_dict(rule):
+    return {
+        'id': str(rule.id),
+        'activity': rule.activity,
+        'category': rule.category,
+        'time_start': rule.time_start.isoformat('minutes') if rule.time_start else None,
+        'time_end': rule.time_end.isoformat('minutes') if rule.time_end else None,
+        'status': rule.status,
+        'location': rule.location,
+        'description': rule.description,
+        'rrule': rule.rrule,
+        'dtstart': rule.dtstart.isoformat() if rule.dtstart else None,
+        'until': rule.until.isoformat() if rule.until else None,
+        'created_at': rule.created_at.isoformat() if rule.created_at else None,
+        'updated_at': rule.updated_at.isoformat() if rule.updated_at else None
+    }
+
+def get_routine_rule(rule_id):
+    """RoutineRule by id, or None (also for ids that are not uuids)"""
+    from models import RoutineRule
+
+    try:
+        return db.session.get(RoutineRule, uuid.UUID(str(rule_id)))
+    except ValueError:
+        return None
+
+def save_occurrence_exception(rule_id, occurrence_date, data=None, cancel=False):
+    """Override, cancel or (with data {'reset': true}) restore one occurrence of a rule
+
+    Raises LookupError when the rule has no occurrence on that date and ValueError
+    for invalid override values.
+    """
+    from datetime import datetime
+    from models import RoutineRuleException
+    from routine_recurrence import is_occurrence
+
+    rule = get_routine_rule(rule_id)
+    if not rule or not is_occurrence(rule.rrule, rule.dtstart, occurrence_date, rule.until):
+        raise LookupError('Occurrence not found')
+
+    data = data or {}
+    exception = db.session.get(RoutineRuleException, (rule.id, occurrence_date))
+    if data.get('reset'):
+        if exception:
+            db.session.delete(exception)
+    else:
+        if not exception:
+            exception = RoutineRuleException(rule_id=rule.id, occurrence_date=occurrence_date)
+            db.session.add(exception)
+        if cancel or data.get('cancelled'):
+            exception.cancelled = True
+        else:
+            exception.cancelled = False
+            if data.get('date'):
+                exception.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+            for field in ('time_start', 'time_end'):
+                if data.get(field):
+                    setattr(exception, field, datetime.strptime(data[field][:5], '%H:%M').time())
+            for field in ('activity', 'location', 'description', 'status'):
+                if field in data:
+                    setattr(exception, field, data[field])
+
+    db.session.commit()
+    admin_events.publish('routine', {'action': 'rules', 'rule_id': str(rule.id)})
+
+@app.route('/admin/api/routine-rules')
+def admin_get_routine_rules():
+    """List recurring routine definitions"""
+    try:
+        from models import RoutineRule
+
+        rules = db.session.query(RoutineRule).order_by(RoutineRule.dtstart.desc()).all()
+        return jsonify({'success': True, 'rules': [rule_to_dict(rule) for rule in rules]})
+    except Exception as e:
+        logging.error(f"Error getting routine rules: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/routine-rules', methods=['POST'])
+def admin_create_routine_rule():
+    """Create a recurring routine
+
+    Body: activity, category, time_start, time_end, dtstart (YYYY-MM-DD), rrule
+    (e.g. "FREQ=WEEKLY;BYDAY=MO,WE,FR") and optional until, location, description.
+    """
+    try:
+        from models import RoutineRule
+
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        try:
+            fields = parse_rule_fields(data)
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+
+        rule = RoutineRule(**fields)
+        db.session.add(rule)
+        db.session.commit()
+        logging.info(f"Routine rule created: {rule.id} ({rule.rrule})")
+        admin_events.publish('routine', {'action': 'rules', 'rule_id': str(rule.id)})
+
+        return jsonify({'success': True, 'rule': rule_to_dict(rule)})
+    except Exception as e:
+        logging.error(f"Error creating routine rule: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/routine-rules/<rule_id>', methods=['PUT'])
+def admin_update_routine_rule(rule_id):
+    """Update a recurring routine (every occurrence); exceptions that no longer
+    match an occurrence of the new rule are dropped"""
+    try:
+        from routine_recurrence import is_occurrence
+
+        rule = get_routine_rule(rule_id)
+        if not rule:
+            return jsonify({'error': 'Rule not found'}), 404
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        try:
+            fields = parse_rule_fields(data, partial=True)
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+
+        for key, value in fields.items():
+            setattr(rule, key, value)
+        for exception in list(rule.exceptions):
+            if not is_occurrence(rule.rrule, rule.dtstart, exception.occurrence_date, rule.until):
+                db.session.delete(exception)
+
+        db.session.commit()
+        admin_events.publish('routine', {'action': 'rules', 'rule_id': str(rule.id)})
+        return jsonify({'success': True, 'rule': rule_to_dict(rule)})
+    except Exception as e:
+        logging.error(f"Error updating routine rule: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/routine-rules/<rule_id>', methods=['DELETE'])
+def admin_delete_routine_rule(rule_id):
+    """Delete a recurring routine, or with ?from=YYYY-MM-DD end it before that date"""
+    try:
+        from datetime import datetime, timedelta
+
+        rule = get_routine_rule(rule_id)
+        if not rule:
+            return jsonify({'error': 'Rule not found'}), 404
+
+        from_date = request.args.get('from')
+        if from_date:
+            try:
+                from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'from deve estar no formato YYYY-MM-DD'}), 400
+
+        if from_date and from_date > rule.dtstart:
+            # "This and following": keep the past of the series
+            rule.until = from_date - timedelta(days=1)
+            for exception in list(rule.exceptions):
+                if exception.occurrence_date >= from_date:
+                    db.session.delete(exception)
+        else:
+            db.session.delete(rule)
+
+        db.session.commit()
+        admin_events.publish('routine', {'action': 'rules', 'rule_id': rule_id})
+        return jsonify({'success': True})
+    except Exception as e:
+        logging.error(f"Error deleting routine rule: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/routine-rules/<rule_id>/occurrences/<occurrence_date>', methods=['PUT', 'DELETE'])
+def admin_update_routine_occurrence(rule_id, occurrence_date):
+    """Change one occurrence of a recurring routine
+
+    PUT overrides date, time_start, time_end, activity, location, description or
+    status for that occurrence only ({"cancelled": true} skips it, {"reset": true}
+    restores it); DELETE cancels it.
+    """
+    try:
+        from datetime import datetime
+
+        try:
+            day = datetime.strptime(occurrence_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Data inválida'}), 400
+
+        data = request.get_json(silent=True) if request.method == 'PUT' else None
+        if request.method == 'PUT' and not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        try:
+            save_occurrence_exception(rule_id, day, data, cancel=request.method == 'DELETE')
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+        except (ValueError, TypeError) as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'success': True})
+    except Exception as e:
+        logging.error(f"Error updating routine occurrence: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/admin/api/activities/<activity_id>', methods=['PUT'])
 def admin_update_activity_supabase(activity_id):
-    """Update an existing activity with Supabase storage"""
+    """Update an existing activity with Supabase storage (multipart form with media_files)
+    
+    The fields are written to local PostgreSQL first (dual_sync), so the change
+    gets a change_seq and reaches delta sync, search and the calendar, then to
+    Supabase anna_routine, which the media endpoints read. Only the submitted
+    fields change; the status is kept unless the form sends one.
+    """
     from supabase_tools import supabase
-    import uuid
+    from dual_database_sync import dual_sync
+    from models import Routine
+    from datetime import datetime
     
     try:
         # Parse the multipart data
         activity_data = {
-            'date': request.form.get('date'),
-            'time_start': request.form.get('time_start'),
-            'time_end': request.form.get('time_end'),
-            'activity': request.form.get('activity'),
-            'category': request.form.get('category'),
-            'location': request.form.get('location'),
-            'description': request.form.get('description'),
-            'status': 'upcoming'
+            key: request.form[key]
+            for key in ('date', 'time_start', 'time_end', 'activity', 'category', 'location', 'description', 'status')
+            if key in request.form
         }
+        for key in ('date', 'time_start', 'time_end', 'activity', 'category', 'status'):
+            if key in activity_data and not activity_data[key]:
+                return jsonify({'error': f'Campo obrigatório: {key}'}), 400
         
-        # Update activity
-        supabase.table('anna_routine').update(activity_data).eq('id', activity_id).execute()
-        
-        # Handle new media files
-        media_files = request.files.getlist('media_files')
-        has_new_media = False
-        
-        for file in media_files:
-            if file and file.filename:
-                try:
-                    # Upload to Supabase storage
-                    file_extension = file.filename.split('.')[-1]
-                    file_name = f"{uuid.uuid4()}.{file_extension}"
-                    
-                    # Upload file
-                    file.seek(0)  # Reset file pointer
-                    storage_response = supabase.storage.from_('conteudo').upload(file_name, file.read())
-                    
-                    # Get public URL
-                    file_url = supabase.storage.from_('conteudo').get_public_url(file_name)
-                    
-                    # Determine media type
-                    media_type = 'video' if file.content_type and file.content_type.startswith('video/') else 'image'
-                    
-                    # Save media record
-                    media_data = {
-                        'routine_id': activity_id,
-                        'media_url': file_url,
-                        'media_type': media_type,
-                        'description': f"Mídia da atividade: {activity_data['activity']}"
-                    }
-                    
-                    supabase.table('anna_routine_media').insert(media_data).execute()
-                    has_new_media = True
-                    
-                except Exception as file_error:
-                    logging.error(f"Error uploading file {file.filename}: {file_error}")
-                    continue
-        
-        # Update media flags if new media was added
-        if has_new_media:
-            # Check current media
-            media_response = supabase.table('anna_routine_media').select('media_type').eq('routine_id', activity_id).execute()
-            
-            has_images = any(item['media_type'] == 'image' for item in media_response.data)
-            has_videos = any(item['media_type'] == 'video' for item in media_response.data)
-            
-            supabase.table('anna_routine').update({
-                'has_images': has_images,
-                'has_videos': has_videos
-            }).eq('id', activity_id).execute()
+        # Update activity: local routine table (change tracking) and Supabase
+        local_data = dict(activity_data)
+        try:
+            if 'date' in local_data:
+                local_data['date'] = datetime.strptime(local_data['date'], '%Y-%m-%d').date()
+            for key in ('time_start', 'time_end'):
+                if key in local_data:
+                    local_data[key] = datetime.strptime(local_data[key][:5], '%H:%M').time()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if activity_data:
+            if not dual_sync.sync_routine_update(activity_id, local_data):
+                return jsonify({'error': 'Não foi possível salvar a atividade'}), 500
+            supabase.table('anna_routine').update(activity_data).eq('id', activity_id).execute()
+        
+        activity = activity_data.get('activity')
+        if not activity:
+            routine = db.session.query(Routine.activity).filter(Routine.id == uuid.UUID(str(activity_id))).first()
+            activity = routine.activity if routine else ''
+        
+        # New media: spooled to disk, uploaded in parallel, recorded in one insert
+        from media_upload import upload_routine_media
+        upload = upload_routine_media(
+            request.files.getlist('media_files'), activity_id,
+            description=f"Mídia da atividade: {activity}"
+        )
         
-        return jsonify({'success': True})
+        admin_events.publish('routine', {'action': 'updated', 'id': activity_id})
+        return jsonify({'success': True, 'media': upload['media'], 'upload_errors': upload['errors']})
         
     except Exception as e:
         logging.error(f"Error updating activity: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/api/uploads', methods=['POST'])
+def admin_init_upload():
+    """Start a resumable chunked upload of one media file for an activity"""
+    from chunked_upload import init_upload, UploadError
+
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Corpo JSON inválido'}), 400
+        for field in ('routine_id', 'filename', 'size'):
+            if not data.get(field):
+                return jsonify({'error': f'Campo obrigatório: {field}'}), 400
+
+        # Media is keyed by the local routine id (the one /admin/api/activities/create returns)
+        from models import Routine
+        routine = db.session.query(Routine.activity).filter(
+            Routine.id == uuid.UUID(str(data['routine_id']))
+        ).first()
+        if not routine:
+            return jsonify({'error': 'Atividade não encontrada'}), 404
+
+        upload = init_upload(
+            data['routine_id'], secure_filename(data['filename']) or 'upload', int(data['size']),
+            content_type=data.get('content_type'),
+            description=f"Mídia da atividade: {routine.activity}"
+        )
+        return jsonify(upload), 201
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error starting upload: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def admin_put_upload_chunk(upload_id, index):
+    """Store one chunk (raw body) of a chunked upload; X-Chunk-SHA256 carries its hash"""
+    from chunked_upload import store_chunk, UploadError
+
+    try:
+        chunk = store_chunk(upload_id, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+        return jsonify(chunk)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        logging.error(f"Error storing upload chunk: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/uploads/<upload_id>/complete', methods=['POST'])
+def admin_complete_upload(upload_id):
+    """Finish a chunked upload; assembly and storage run in the background"""
+    from chunked_upload import complete_upload, UploadError
+
+    try:
+        return jsonify(complete_upload(upload_id)), 202
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        logging.error(f"Error completing upload: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/api/uploads/<upload_id>', methods=['GET', 'DELETE'])
+def admin_upload_status(upload_id):
+    """Status of a chunked upload (missing chunks while uploading), or abort it"""
+    from chunked_upload import get_upload_status, delete_upload, UploadError
+
+    try:
+        if request.method == 'DELETE':
+            delete_upload(upload_id)
+            return jsonify({'success': True})
+        return jsonify(get_upload_status(upload_id))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        logging.error(f"Error reading upload status: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/admin/api/media/<media_id>', methods=['DELETE'])
 def admin_delete_media(media_id):
-    """Delete specific media file"""
+    """Delete specific media file
+    
+    The row goes first, then its reference to the stored object (media_objects, in
+    local PostgreSQL, counts the Supabase anna_routine_media and image_bank rows
+    pointing at each object) and its WebP derivatives; a failure after the row is
+    gone only leaves an unreferenced file in the bucket, never a row without its file.
+    """
     try:
         from supabase_tools import supabase
         
@@ -739,28 +1320,32 @@ def admin_delete_media(media_id):
         media_response = supabase.table('anna_routine_media').select('*').eq('id', media_id).single().execute()
         media = media_response.data
         
-        # Delete from storage
-        file_name = media['media_url'].split('/')[-1]
-        try:
-            supabase.storage.from_('conteudo').remove([file_name])
-        except:
-            pass  # Continue even if file deletion fails
-        
-        # Delete media record
+        # Delete media record, then the routine's counts and flags
         supabase.table('anna_routine_media').delete().eq('id', media_id).execute()
-        
-        # Update activity media flags
         routine_id = media['routine_id']
-        remaining_media = supabase.table('anna_routine_media').select('media_type').eq('routine_id', routine_id).execute()
-        
-        has_images = any(item['media_type'] == 'image' for item in remaining_media.data)
-        has_videos = any(item['media_type'] == 'video' for item in remaining_media.data)
-        
-        supabase.table('anna_routine').update({
-            'has_images': has_images,
-            'has_videos': has_videos
-        }).eq('id', routine_id).execute()
+        from media_upload import update_media_counts
+        update_media_counts(supabase, routine_id,
+                            images=-(media['media_type'] == 'image'),
+                            videos=-(media['media_type'] == 'video'))
+        
+        # Release the original: removed from storage only when no other media row or
+        # image bank entry still points at the same content
+        from media_upload import object_name, release_object
+        from media_derivatives import derivative_objects
+        file_name = object_name(media['media_url']) or media['media_url'].split('/')[-1]
+        stale = derivative_objects(media)
+        try:
+            if release_object(supabase, file_name) is None:
+                stale.append(file_name)  # Uploaded before deduplication
+        except Exception as e:
+            logging.error(f"Error releasing media object {file_name} of deleted media {media_id}: {e}")
+        if stale:
+            try:
+                supabase.storage.from_('conteudo').remove(stale)
+            except Exception as e:
+                logging.error(f"Error removing files {stale} of deleted media {media_id}: {e}")
         
+        admin_events.publish('media', {'action': 'deleted', 'id': media_id, 'routine_id': routine_id})
         return jsonify({'success': True})
         
     except Exception as e:
@@ -832,6 +1417,8 @@ def create_memory():
         }
         
         result = save_anna_memory(memory_data)
+        if result.get('success'):
+            admin_events.publish('memory', {'action': 'created', 'id': result['memory'].get('id'), 'memory': result['memory']})
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error creating memory: {e}")
@@ -854,6 +1441,8 @@ def update_memory(memory_id):
         }
         
         result = update_anna_memory(memory_id, memory_data)
+        if result.get('success'):
+            admin_events.publish('memory', {'action': 'updated', 'id': memory_id, 'memory': result['memory']})
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error updating memory: {e}")
@@ -865,11 +1454,23 @@ def delete_memory(memory_id):
     try:
         from supabase_tools import delete_anna_memory
         result = delete_anna_memory(memory_id)
+        if result.get('success'):
+            admin_events.publish('memory', {'action': 'deleted', 'id': memory_id})
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error deleting memory: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/api/memories/consolidate', methods=['POST'])
+def consolidate_memories():
+    """Fold closed conversation windows into summaries now, instead of waiting for the worker"""
+    try:
+        from memory_consolidation import consolidate
+        return jsonify({'success': True, **consolidate()})
+    except Exception as e:
+        logging.error(f"Error consolidating memories: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # Image bank management API routes
 @app.route('/admin/api/images')
 def get_image_bank():
@@ -899,6 +1500,16 @@ def create_image_bank_entry():
         }
         
         result = save_anna_image(image_data)
+        if result.get('success'):
+            admin_events.publish('image', {'action': 'created', 'id': result['image'].get('id'), 'image': result['image']})
+            # Entries pointing at a stored object keep it alive like routine media does
+            from media_upload import object_name, retain_object
+            try:
+                retain_object(object_name(image_data['image_url']))
+            except Exception as e:
+                logging.error(f"Error retaining media object: {e}")
+            from media_derivatives import schedule_derivatives
+            schedule_derivatives('image_bank', result['image'].get('id'), url=image_data['image_url'], channel='image')
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error creating image: {e}")
@@ -920,7 +1531,23 @@ def update_image_bank_entry(image_id):
             'is_active': data.get('is_active', True)
         }
         
+        # Derivatives only have to be redone when the picture itself changes
+        from supabase_tools import supabase
+        previous = supabase.table('image_bank').select('image_url, thumbnail_url').eq('id', image_id).execute().data
+        
         result = update_anna_image(image_id, image_data)
+        if result.get('success'):
+            admin_events.publish('image', {'action': 'updated', 'id': image_id, 'image': result['image']})
+            if previous and previous[0]['image_url'] != image_data['image_url']:
+                from media_upload import object_name, retain_object, release_object
+                try:
+                    retain_object(object_name(image_data['image_url']))
+                    release_object(supabase, object_name(previous[0]['image_url']))
+                except Exception as e:
+                    logging.error(f"Error updating media object references: {e}")
+            if not previous or previous[0]['image_url'] != image_data['image_url'] or not previous[0].get('thumbnail_url'):
+                from media_derivatives import schedule_derivatives
+                schedule_derivatives('image_bank', image_id, url=image_data['image_url'], channel='image')
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error updating image: {e}")
@@ -930,8 +1557,23 @@ def update_image_bank_entry(image_id):
 def delete_image_bank_entry(image_id):
     """Delete image bank entry"""
     try:
-        from supabase_tools import delete_anna_image
+        from supabase_tools import supabase, delete_anna_image
+        from media_upload import object_name, release_object
+        from media_derivatives import derivative_objects
+        image = supabase.table('image_bank').select('image_url, thumbnail_url, preview_url').eq('id', image_id).execute().data
+        
         result = delete_anna_image(image_id)
+        if result.get('success'):
+            admin_events.publish('image', {'action': 'deleted', 'id': image_id})
+            if image:
+                # Originals outside the index (external URLs) are left alone, as before
+                try:
+                    release_object(supabase, object_name(image[0]['image_url']))
+                    stale = derivative_objects(image[0])
+                    if stale:
+                        supabase.storage.from_('conteudo').remove(stale)
+                except Exception as e:
+                    logging.error(f"Error removing image objects: {e}")
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error deleting image: {e}")
@@ -948,24 +1590,36 @@ def upload_image():
             return jsonify({'success': False, 'error': 'Nenhum arquivo selecionado'}), 400
         
         if file and file.filename and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            from supabase_tools import create_anna_image
+            from supabase_tools import supabase, create_anna_image
+            from media_upload import spool_upload, upload_spooled, discard_object
+            from media_derivatives import schedule_derivatives
             
-            # For now, we'll use a placeholder URL since we don't have actual file storage
-            # In a real implementation, you'd upload to Supabase Storage or similar
             filename = secure_filename(file.filename) if file.filename else 'unnamed'
-            
-            # Create image record with placeholder URL
-            image_data = {
-                'name': filename.split('.')[0],
-                'description': f'Imagem enviada: {filename}',
-                'when_to_use': 'Imagem personalizada enviada pelo usuário',
-                'image_url': f'https://via.placeholder.com/400x300/333/fff?text={filename}',
-                'keywords': ['upload', 'personalizada'],
-                'is_active': True
-            }
-            
-            # Save to database
-            result = create_anna_image(image_data)
+            spooled = spool_upload(file)
+            try:
+                uploaded = upload_spooled(supabase, spooled)
+                if 'error' in uploaded:
+                    return jsonify({'success': False, 'error': uploaded['error']}), 500
+                
+                image_data = {
+                    'name': filename.split('.')[0],
+                    'description': f'Imagem enviada: {filename}',
+                    'when_to_use': 'Imagem personalizada enviada pelo usuário',
+                    'image_url': uploaded['url'],
+                    'keywords': ['upload', 'personalizada'],
+                    'is_active': True
+                }
+                
+                # Save to database; thumbnails are made from the local copy
+                result = create_anna_image(image_data)
+                if result.get('success'):
+                    admin_events.publish('image', {'action': 'created', 'id': result['image_id'], 'image': result['data']})
+                    schedule_derivatives('image_bank', result['image_id'], path=spooled['path'],
+                                         url=uploaded['url'], channel='image')
+                else:
+                    discard_object(supabase, uploaded['object_name'])
+            finally:
+                os.unlink(spooled['path'])
             return jsonify(result)
         else:
             return jsonify({'success': False, 'error': 'Tipo de arquivo não suportado'}), 400
@@ -1061,6 +1715,7 @@ def ai_create_suggested_activity():
         
         db.session.add(new_activity)
         db.session.commit()
+        admin_events.publish('routine', {'action': 'created', 'id': str(new_activity.id)})
         
         return jsonify({'success': True, 'activity_id': new_activity.id})
     except Exception as e:
@@ -1099,6 +1754,7 @@ def save_config():
             global anna_agent
             config = get_config().get_json()
             anna_agent = create_anna_agent(config)
+            conversation_pipeline.invalidate_agents()
             logging.info("Agent reloaded with new configuration.")
             
             return jsonify({
@@ -1169,6 +1825,7 @@ def toggle_client_status(client_id):
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', client_id).execute()
         
+        admin_events.publish('client', {'action': 'updated', 'id': client_id, 'ativo': ativo})
         return jsonify({'success': True})
     except Exception as e:
         logging.error(f"Error toggling client status: {e}")
@@ -1326,7 +1983,7 @@ def whatsapp_initialize():
 def whatsapp_status():
     """Get WhatsApp connection status"""
     try:
-        status = whatsapp_manager.get_connection_status()
+        status = whatsapp_manager.get_connection_status(request.args.get('instance'))
         return jsonify(status)
     except Exception as e:
         logging.error(f"Error getting WhatsApp status: {e}")
@@ -1334,20 +1991,51 @@ def whatsapp_status():
 
 @app.route('/whatsapp/api/qr-code', methods=['GET'])
 def whatsapp_qr_code():
-    """Get QR code for WhatsApp connection"""
+    """Get QR code for WhatsApp connection (served from the connection cache)"""
     try:
         if not whatsapp_manager.evolution_client:
             return jsonify({'success': False, 'error': 'WhatsApp not configured'}), 400
             
-        qr_result = whatsapp_manager.evolution_client.get_qr_code()
         return jsonify({
             'success': True,
-            'qr_code': qr_result.get('base64')
+            'qr_code': whatsapp_manager.get_qr_code(request.args.get('instance'))
         })
     except Exception as e:
         logging.error(f"Error getting QR code: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/whatsapp/api/events')
+def whatsapp_events():
+    """Server-Sent Events stream with WhatsApp connection status and QR code changes
+    
+    Each connection starts with the current status and ends after SSE_MAX_SECONDS;
+    the page's EventSource reconnects (and falls back to polling on errors).
+    """
+    instance = whatsapp_manager.get_instance(request.args.get('instance'))
+    cache = instance.connection_cache if instance else whatsapp_manager.connection_cache
+    if instance:
+        cache.ensure_poller()
+    
+    initial = [{'type': 'whatsapp_status', 'data': cache.snapshot()}]
+    return Response(
+        cache.events.stream(initial=initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/whatsapp/api/instances', methods=['GET'])
+def whatsapp_instances():
+    """List registered WhatsApp instances with health and throughput stats"""
+    try:
+        return jsonify({
+            'success': True,
+            'default_instance': whatsapp_manager.default_instance,
+            'instances': whatsapp_manager.get_instances_overview()
+        })
+    except Exception as e:
+        logging.error(f"Error listing WhatsApp instances: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/whatsapp/api/send-message', methods=['POST'])
 def whatsapp_send_message():
     """Send message via WhatsApp"""
@@ -1359,7 +2047,7 @@ def whatsapp_send_message():
         if not phone_number or not message:
             return jsonify({'status': 'error', 'error': 'Phone number and message are required'}), 400
             
-        result = whatsapp_manager.send_message(phone_number, message)
+        result = whatsapp_manager.send_message(phone_number, message, data.get('instance_name'))
         return jsonify(result)
         
     except Exception as e:
@@ -1377,6 +2065,9 @@ def whatsapp_webhook():
             
         # Process webhook with Anna
         result = whatsapp_manager.process_webhook(webhook_data)
+        if result.get('retry'):
+            # The turn did not finish: an error status makes Evolution API send the event again
+            return jsonify({'error': result['error']}), 503
         
         return jsonify({'status': 'success', 'processed': result.get('processed', False)})
         
@@ -1418,6 +2109,8 @@ def admin_create_memory():
         }
         
         response = supabase.table('anna_memories').insert(memory_data).execute()
+        if response.data:
+            admin_events.publish('memory', {'action': 'created', 'id': response.data[0].get('id'), 'memory': response.data[0]})
         return jsonify({
             'success': True,
             'memory': response.data[0] if response.data else None
@@ -1461,6 +2154,8 @@ def admin_create_image():
         }
         
         response = supabase.table('anna_image_bank').insert(image_data).execute()
+        if response.data:
+            admin_events.publish('image', {'action': 'created', 'id': response.data[0].get('id'), 'image': response.data[0]})
         return jsonify({
             'success': True,
             'image': response.data[0] if response.data else None
@@ -0,0 +1,112 @@
+"""
+Benchmark: serialização JSON e bytes trafegados nas respostas do admin
+Compara o encoder padrão do Flask (json.dumps com sort_keys) com o orjson usado por
+json_provider.py, e mede o tamanho das respostas sem compressão, com gzip e com brotli.
+
+Uso: python benchmark_json_responses.py [linhas]
+"""
+
+import sys
+import json
+import gzip
+import time
+import uuid
+import random
+from datetime import datetime, timedelta
+
+from benchmark_routine_serialization import make_rows
+from routine_read_model import activities_to_dicts, activities_to_events
+from response_compression import GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_payloads(count):
+    """Payloads shaped like the admin endpoints' responses"""
+    rng = random.Random(7)
+    rows = make_rows(count)
+    activities = activities_to_dicts(rows)
+
+    groups = {}
+    for activity in activities:
+        groups.setdefault(activity['date'], []).append(activity)
+
+    clients = [{
+        'phone_number': f"5511{rng.randint(10000000, 99999999)}",
+        'nome': f"Cliente {i}",
+        'ativo': bool(i % 4),
+        'total_mensagens': rng.randint(0, 5000),
+        'ultima_conversa': (datetime(2024, 1, 1) + timedelta(hours=i)).isoformat()
+    } for i in range(max(count // 20, 1))]
+
+    memories = [{
+        'id': str(uuid.uuid4()),
+        'title': f"Memória {i}",
+        'content': "Conversa sobre treino, alimentação e agenda da semana. " * 3,
+        'tags': ['rotina', 'saude'] if i % 2 else ['trabalho'],
+        'created_at': (datetime(2024, 1, 1) + timedelta(minutes=i)).isoformat()
+    } for i in range(max(count // 10, 1))]
+
+    return {
+        'activities/list': {'groups': groups, 'next_cursor': None, 'has_more': False},
+        'activities (calendar)': activities_to_events(rows),
+        'clients': {'success': True, 'clients': clients},
+        'memories': {'success': True, 'memories': memories},
+    }
+
+
+def timed(func, repeat=5):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def stdlib_encode(payload):
+    # What Flask's DefaultJSONProvider does in production (compact, sorted keys)
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_encode(payload):
+    # Same options as json_provider.OrjsonJSONProvider with sort_keys on
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"orjson: {'yes' if orjson else 'no'} | brotli: {'yes' if brotli else 'no (gzip only)'}")
+
+    for name, payload in make_payloads(count).items():
+        print(f"\n{name}")
+        old, body = timed(lambda: stdlib_encode(payload))
+        print(f"  {'json.dumps (Flask default)':<32} {old * 1000:9.1f} ms")
+        if orjson:
+            new, fast_body = timed(lambda: orjson_encode(payload))
+            assert json.loads(body) == json.loads(fast_body), "payloads differ"
+            print(f"  {'orjson (json_provider)':<32} {new * 1000:9.1f} ms   x{old / new:.2f}")
+            body = fast_body
+
+        print(f"  {'identity':<32} {len(body) / 1024:9.1f} KiB")
+        took, compressed = timed(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), repeat=3)
+        print(f"  {f'gzip -{GZIP_LEVEL}':<32} {len(compressed) / 1024:9.1f} KiB"
+              f"   {len(compressed) / len(body):6.1%}   {took * 1000:7.1f} ms")
+        if brotli:
+            took, compressed = timed(lambda: brotli.compress(body, quality=BROTLI_QUALITY), repeat=3)
+            print(f"  {f'brotli q{BROTLI_QUALITY}':<32} {len(compressed) / 1024:9.1f} KiB"
+                  f"   {len(compressed) / len(body):6.1%}   {took * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
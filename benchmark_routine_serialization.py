@@ -0,0 +1,190 @@
+"""
+Benchmark: serialização de atividades (Routine) no admin
+Compara o caminho antigo (objetos ORM + dicts montados com strftime + json) com o
+read model projetado (tuplas + routine_read_model + orjson quando instalado).
+
+Uso: python benchmark_routine_serialization.py [linhas]
+Com SQLAlchemy instalado, também mede a carga a partir de um SQLite em memória
+(objetos ORM com identity map vs. tuplas projetadas).
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+from datetime import date, time as dt_time, datetime, timedelta
+from types import SimpleNamespace
+
+import routine_read_model
+from routine_read_model import ACTIVITY_FIELDS, activities_to_dicts, activities_to_events, dumps
+
+CATEGORIES = ['trabalho', 'fitness', 'pessoal', 'social', 'saude', 'educacao']
+
+
+def make_rows(count):
+    """Synthetic rows in ACTIVITY_FIELDS order"""
+    rng = random.Random(42)
+    start = date(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        hour = rng.randint(6, 21)
+        rows.append((
+            uuid.uuid4(),
+            f"Atividade {i}",
+            rng.choice(CATEGORIES),
+            start + timedelta(days=i % 730),
+            dt_time(hour, rng.choice([0, 15, 30, 45])),
+            dt_time(hour + 1, 0),
+            'upcoming',
+            'São Paulo' if i % 3 else None,
+            f"Descrição da atividade {i}",
+            bool(i % 5 == 0),
+            bool(i % 7 == 0),
+            datetime(2024, 1, 1, 12, 0) + timedelta(minutes=i),
+            2 if i % 5 == 0 else 0,
+            1 if i % 7 == 0 else 0
+        ))
+    return rows
+
+
+def legacy_activity(routine):
+    """Dict exactly as the endpoints built it before the read model"""
+    return {
+        'id': str(routine.id),
+        'date': routine.date.isoformat() if routine.date else None,
+        'time_start': routine.time_start.strftime('%H:%M') if routine.time_start else None,
+        'time_end': routine.time_end.strftime('%H:%M') if routine.time_end else None,
+        'activity': routine.activity,
+        'category': routine.category,
+        'location': routine.location,
+        'description': routine.description,
+        'status': routine.status,
+        'has_images': routine.has_images or False,
+        'has_videos': routine.has_videos or False,
+        'image_count': routine.image_count or 0,
+        'video_count': routine.video_count or 0,
+        'created_at': routine.created_at.isoformat() if routine.created_at else None
+    }
+
+
+def legacy_event(activity):
+    date_str = activity.date.isoformat() if activity.date else ''
+    time_start_str = activity.time_start.strftime('%H:%M:%S') if activity.time_start else '00:00:00'
+    time_end_str = activity.time_end.strftime('%H:%M:%S') if activity.time_end else '23:59:59'
+    return {
+        'id': str(activity.id),
+        'title': activity.activity,
+        'start': f"{date_str}T{time_start_str}",
+        'end': f"{date_str}T{time_end_str}",
+        'className': f"fc-event-{activity.category}",
+        'extendedProps': {
+            'category': activity.category,
+            'status': activity.status,
+            'location': activity.location,
+            'description': activity.description,
+            'has_images': activity.has_images or False,
+            'has_videos': activity.has_videos or False,
+            'image_count': activity.image_count or 0,
+            'video_count': activity.video_count or 0
+        }
+    }
+
+
+def timed(label, func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<44} {best * 1000:9.1f} ms")
+    return best, result
+
+
+def bench_serialization(rows):
+    objects = [SimpleNamespace(**dict(zip(ACTIVITY_FIELDS, row))) for row in rows]
+
+    print(f"List/detail shape ({len(rows)} rows)")
+    old, old_body = timed("legacy: objects + strftime + json.dumps",
+                          lambda: json.dumps([legacy_activity(o) for o in objects]))
+    new, new_body = timed("read model: tuples + activity_to_dict + dumps",
+                          lambda: dumps(activities_to_dicts(rows)))
+    assert json.loads(old_body) == json.loads(new_body), "payloads differ"
+    print(f"  speedup x{old / new:.2f}")
+
+    print(f"Calendar shape ({len(rows)} rows)")
+    old, old_body = timed("legacy: objects + strftime + json.dumps",
+                          lambda: json.dumps([legacy_event(o) for o in objects]))
+    new, new_body = timed("read model: tuples + activity_to_event + dumps",
+                          lambda: dumps(activities_to_events(rows)))
+    assert json.loads(old_body) == json.loads(new_body), "payloads differ"
+    print(f"  speedup x{old / new:.2f}")
+
+
+def bench_database(rows):
+    try:
+        from sqlalchemy import create_engine, select, Column, String, Text, Date, Time, Boolean, DateTime, Integer
+        from sqlalchemy.orm import DeclarativeBase, Session
+    except ImportError:
+        print("SQLAlchemy not installed: skipping the database load comparison")
+        return
+
+    class Base(DeclarativeBase):
+        pass
+
+    class Routine(Base):
+        __tablename__ = 'routine'
+        id = Column(String(36), primary_key=True)
+        activity = Column(Text)
+        category = Column(Text)
+        date = Column(Date)
+        time_start = Column(Time)
+        time_end = Column(Time)
+        status = Column(Text)
+        location = Column(Text)
+        description = Column(Text)
+        has_images = Column(Boolean)
+        has_videos = Column(Boolean)
+        created_at = Column(DateTime)
+        image_count = Column(Integer)
+        video_count = Column(Integer)
+        updated_at = Column(DateTime)
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(Routine.__table__.insert(), [
+            {**dict(zip(ACTIVITY_FIELDS, row)), 'id': str(row[0]), 'updated_at': row[11]} for row in rows
+        ])
+        session.commit()
+
+    columns = [getattr(Routine, field) for field in ACTIVITY_FIELDS]
+    print(f"Load + serialize from SQLite ({len(rows)} rows)")
+
+    def legacy():
+        with Session(engine) as session:
+            return json.dumps([legacy_activity(r) for r in session.query(Routine).order_by(Routine.date).all()])
+
+    def read_model():
+        with Session(engine) as session:
+            return dumps(activities_to_dicts(
+                session.execute(select(*columns).order_by(Routine.date)).tuples().all()
+            ))
+
+    old, _ = timed("legacy: ORM objects (identity map)", legacy)
+    new, _ = timed("read model: projected tuples", read_model)
+    print(f"  speedup x{old / new:.2f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"orjson: {'yes' if routine_read_model.orjson else 'no (stdlib json fallback)'}")
+    rows = make_rows(count)
+    bench_serialization(rows)
+    bench_database(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,19 +28,9 @@ class ChatSessionManager:
 
     @contextmanager
     def get_db_connection(self) -> Generator[psycopg2.extensions.connection, None, None]:
-        """Context manager para conexões com o banco"""
-        conn = None
-        try:
-            conn = psycopg2.connect(self.database_url)
+        """Context manager para conexões com o banco (pool compartilhado com dual_sync)"""
+        with dual_sync.get_postgres_connection() as conn:
             yield conn
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            logger.error(f"Erro na conexão com o banco: {e}")
-            raise
-        finally:
-            if conn:
-                conn.close()
 
     def get_or_create_session(self, contact_phone: str, contact_name: Optional[str] = None, 
                              channel: str = 'chat', contact_avatar: Optional[str] = None) -> str:
@@ -101,6 +91,36 @@ class ChatSessionManager:
             logger.error(f"Erro ao salvar mensagem: {e}")
             return False
 
+    def save_turn(self, session_id: str, contact_phone: str, user_message: str, 
+                  bot_response: str, contact_name: Optional[str] = None, 
+                  channel: str = 'chat') -> bool:
+        """
+        Salva a mensagem do usuário e a resposta da Anna em lote (uma transação por banco)
+        """
+        try:
+            messages = [{
+                'sender_phone': contact_phone,
+                'sender_name': contact_name or contact_phone,
+                'content': user_message,
+                'is_from_bot': False
+            }]
+            if bot_response:
+                messages.append({
+                    'sender_phone': 'anna_bot',
+                    'sender_name': 'Anna',
+                    'content': bot_response,
+                    'is_from_bot': True
+                })
+            
+            success = dual_sync.sync_messages(session_id, contact_phone, channel, messages)
+            if success:
+                logger.info(f"Turno salvo para sessão {session_id} ({len(messages)} mensagens)")
+            return success
+            
+        except Exception as e:
+            logger.error(f"Erro ao salvar turno: {e}")
+            return False
+
     def get_session_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
         """
         Busca mensagens de uma sessão de chat
@@ -131,6 +151,32 @@ class ChatSessionManager:
             logger.error(f"Erro ao buscar mensagens: {e}")
             return []
 
+    def get_recent_session_messages(self, session_id: str, limit: int = 20) -> List[Dict]:
+        """
+        Busca as últimas mensagens de uma sessão, em ordem cronológica
+        """
+        try:
+            with self.get_db_connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    SELECT content, is_from_bot
+                    FROM (
+                        SELECT id, content, is_from_bot, created_at
+                        FROM messages 
+                        WHERE chat_session_id = %s 
+                        ORDER BY created_at DESC, id DESC 
+                        LIMIT %s
+                    ) recent
+                    ORDER BY created_at ASC, id ASC
+                """, (session_id, limit))
+                
+                return [{'content': row[0], 'is_from_bot': row[1]} for row in cursor.fetchall()]
+                
+        except Exception as e:
+            logger.error(f"Erro ao buscar mensagens recentes: {e}")
+            return []
+
     def get_contact_sessions(self, contact_phone: str, channel: Optional[str] = None) -> List[Dict]:
         """
         Busca todas as sessões de um contato
@@ -0,0 +1,167 @@
+"""
+Check Query Indexes - Confere com EXPLAIN que as buscas das ferramentas do agente usam índices
+Semeia as tabelas de query_paths.py numa transação (desfeita no fim), desliga a varredura
+sequencial para o planejador escolher um índice sempre que houver um utilizável e falha se
+alguma consulta ainda fizer Seq Scan na sua tabela, ou se não puder ser conferida (tabela ou
+coluna ausente). Cada execução confere as consultas de um banco: o local (DATABASE_URL) ou o
+Supabase (SUPABASE_DB_URL, a string de conexão PostgreSQL do projeto)
+
+Uso: python check_query_indexes.py [--database local|supabase] [--database-url URL] [--seed N]
+"""
+
+import os
+import sys
+import argparse
+import logging
+import psycopg2
+from psycopg2 import errors
+from dotenv import load_dotenv
+from query_paths import QUERY_PATHS, TRIGRAM_INDEXES
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE_PARAMS = {'pattern': '%treino%', 'tsquery': 'treino:*', 'limit': 10}
+SEED_ROWS = 5000
+SEARCHED_COLUMNS = {(table, column) for _, table, column in TRIGRAM_INDEXES} | {('routine', 'activity')}
+
+
+def _value(column: str, data_type: str, max_length, searched: bool) -> str:
+    """SQL expression for row i of the seed (generate_series(1, N) AS i)"""
+    if data_type in ('text', 'character varying', 'character'):
+        # One row in a hundred mentions the sample term, like a real search
+        text = "CASE WHEN mod(i, 100) = 0 THEN 'treino de perna ' ELSE '' END || md5(i::text)" if searched else "md5(i::text)"
+        return f"left({text}, {max_length})" if max_length else text
+    if data_type in ('integer', 'bigint', 'smallint'):
+        return "mod(i, 5) + 1"
+    if data_type in ('numeric', 'real', 'double precision'):
+        return "1"
+    if data_type == 'boolean':
+        return "TRUE"
+    if data_type == 'uuid':
+        return "gen_random_uuid()"
+    if data_type == 'date':
+        return "current_date"
+    if data_type.startswith('timestamp'):
+        return "now()"
+    if data_type.startswith('time'):
+        return "current_time"
+    if data_type in ('json', 'jsonb'):
+        return "'{}'"
+    if data_type == 'ARRAY':
+        return "'{}'"
+    return None
+
+
+def seed_table(cursor, table: str, rows: int) -> str:
+    """Insert rows synthetic rows; returns a short status (the caller's transaction is rolled back)"""
+    cursor.execute("""
+        SELECT column_name, data_type, character_maximum_length, is_nullable, column_default
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (table,))
+    columns = cursor.fetchall()
+    if not columns:
+        return 'missing'
+
+    names, values = [], []
+    for name, data_type, max_length, nullable, default in columns:
+        searched = (table, name) in SEARCHED_COLUMNS
+        required = nullable == 'NO' and default is None
+        if not (required or searched or name in ('is_active', 'created_at')):
+            continue
+        value = _value(name, data_type, max_length, searched)
+        if value is None:
+            if required:
+                return f'not seeded (no value for {name} {data_type})'
+            continue
+        names.append(name)
+        values.append(value)
+
+    cursor.execute("SAVEPOINT seed")
+    try:
+        cursor.execute(f"""
+            INSERT INTO {table} ({', '.join(names)})
+            SELECT {', '.join(values)} FROM generate_series(1, %s) AS i
+        """, (rows,))
+        cursor.execute(f"ANALYZE {table}")
+        cursor.execute("RELEASE SAVEPOINT seed")
+        return f'+{rows} rows'
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT seed")
+        return f"not seeded ({str(e).strip().splitlines()[0]})"
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def check_path(cursor, path) -> dict:
+    """EXPLAIN one query path; 'fail' when it scans its table sequentially, 'skip' when it cannot run"""
+    cursor.execute("SAVEPOINT explain")
+    try:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {path['sql']}", SAMPLE_PARAMS)
+        plan = cursor.fetchone()[0][0]['Plan']
+        cursor.execute("RELEASE SAVEPOINT explain")
+    except (errors.UndefinedTable, errors.UndefinedColumn, errors.UndefinedObject) as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT explain")
+        return {'status': 'skip', 'detail': str(e).strip().splitlines()[0]}
+
+    nodes = list(plan_nodes(plan))
+    used = sorted({node['Index Name'] for node in nodes if node.get('Index Name')})
+    sequential = any(node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == path['table'] for node in nodes)
+    missing = [index for index in path['indexes'] if index not in used]
+    if sequential:
+        return {'status': 'fail', 'detail': f"Seq Scan on {path['table']}; missing {', '.join(missing) or '-'}"}
+    if missing:
+        return {'status': 'warn', 'detail': f"uses {', '.join(used) or 'no index'}, not {', '.join(missing)}"}
+    return {'status': 'ok', 'detail': f"uses {', '.join(used)}"}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', choices=('local', 'supabase'), default='local',
+                        help='which query paths to check (see query_paths.py)')
+    parser.add_argument('--database-url', help='connection string (default: DATABASE_URL or SUPABASE_DB_URL)')
+    parser.add_argument('--seed', type=int, default=SEED_ROWS, help='synthetic rows per table (0 = as is)')
+    args = parser.parse_args()
+
+    variable = 'DATABASE_URL' if args.database == 'local' else 'SUPABASE_DB_URL'
+    database_url = args.database_url or os.environ.get(variable)
+    if not database_url:
+        logger.error(f"{variable} environment variable not set (or pass --database-url).")
+        return 2
+    paths = [path for path in QUERY_PATHS if path['database'] == args.database]
+
+    conn = psycopg2.connect(database_url)
+    try:
+        cursor = conn.cursor()
+        if args.seed > 0:
+            for table in sorted({path['table'] for path in paths}):
+                logger.info(f"seed  {table}: {seed_table(cursor, table, args.seed)}")
+
+        # Any usable index now beats a sequential scan, whatever the table size
+        cursor.execute("SET LOCAL enable_seqscan = off")
+
+        failures = 0
+        for path in paths:
+            result = check_path(cursor, path)
+            # A path that could not be explained is not known to be indexed
+            failures += result['status'] in ('fail', 'skip')
+            logger.info(f"{result['status']:5} {path['tool']} [{path['table']}]: {result['detail']}")
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if failures:
+        logger.error(f"{failures} of {len(paths)} {args.database} query path(s) scan sequentially or could not "
+                     f"be checked; run add_trigram_indexes.py (and the migrations it needs) against this database")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
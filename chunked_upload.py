@@ -0,0 +1,442 @@
+"""
+Chunked Upload - Upload retomável de vídeos grandes das atividades
+Protocolo init / put-chunk / complete: cada bloco é verificado por SHA-256 e gravado numa
+pasta de staging local, a montagem é feita no kernel (copy_file_range/sendfile) e o envio
+ao Supabase Storage roda em segundo plano. O estado fica num manifest.json por upload, então
+qualquer worker do gunicorn responde a qualquer requisição e um envio interrompido é retomado
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from media_upload import CHUNK_SIZE, UPLOAD_WORKERS, file_sha256, upload_spooled, record_uploads
+from event_stream import admin_events
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = os.getenv('UPLOAD_STAGING_DIR') or os.path.join(tempfile.gettempdir(), 'anna-uploads')
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', str(2 * 1024 * 1024 * 1024)))
+SESSION_TTL = 24 * 60 * 60  # Unfinished uploads older than this are removed
+# A processing job touches its heartbeat this often; one silent for PROCESSING_TIMEOUT
+# belonged to a worker that died (restart, deploy, OOM) and is picked up again
+PROCESSING_HEARTBEAT = 15
+PROCESSING_TIMEOUT = int(os.getenv('UPLOAD_PROCESSING_TIMEOUT', '120'))
+MAX_PROCESSING_ATTEMPTS = 3
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Background pushes to storage; sized like the regular upload pool
+_push_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='chunked-upload')
+
+# Uploads queued or running in this process; their heartbeats are kept fresh by _keep_alive
+_active = set()
+_active_lock = threading.Lock()
+_keeper = None
+
+
+class UploadError(Exception):
+    """Invalid upload request; status is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _session_dir(upload_id: str) -> str:
+    if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+        raise UploadError('Upload não encontrado', 404)
+    return os.path.join(STAGING_DIR, upload_id)
+
+
+def _chunk_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"chunk-{index:06d}")
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    """Replace the manifest atomically, so readers in other workers never see a partial file"""
+    manifest['updated_at'] = time.time()
+    temp_path = os.path.join(directory, f"manifest.{uuid.uuid4().hex}.tmp")
+    with open(temp_path, 'w') as handle:
+        json.dump(manifest, handle)
+    os.replace(temp_path, os.path.join(directory, 'manifest.json'))
+
+
+def _read_manifest(upload_id: str) -> Dict[str, Any]:
+    directory = _session_dir(upload_id)
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        raise UploadError('Upload não encontrado', 404)
+
+
+def _chunk_length(manifest: Dict[str, Any], index: int) -> int:
+    """Expected size of a chunk; only the last one may be shorter"""
+    if index < manifest['total_chunks'] - 1:
+        return manifest['chunk_size']
+    return manifest['size'] - manifest['chunk_size'] * (manifest['total_chunks'] - 1)
+
+
+def _received_chunks(directory: str, manifest: Dict[str, Any]) -> List[int]:
+    """Chunks already on disk; a chunk file only exists once its hash has been verified"""
+    return [index for index in range(manifest['total_chunks'])
+            if os.path.exists(_chunk_path(directory, index))]
+
+
+def _assembled_path(directory: str, manifest: Dict[str, Any]) -> str:
+    extension = os.path.splitext(manifest['filename'])[1].lower()
+    return os.path.join(directory, f"assembled{extension}")
+
+
+def _heartbeat_age(directory: str, manifest: Dict[str, Any]) -> float:
+    """Seconds since the processing job last showed signs of life"""
+    try:
+        last = os.stat(os.path.join(directory, 'processing.heartbeat')).st_mtime
+    except FileNotFoundError:
+        last = manifest.get('updated_at', 0)
+    return time.time() - last
+
+
+def _keep_alive() -> None:
+    while True:
+        time.sleep(PROCESSING_HEARTBEAT)
+        with _active_lock:
+            upload_ids = list(_active)
+        for upload_id in upload_ids:
+            try:
+                os.utime(os.path.join(STAGING_DIR, upload_id, 'processing.heartbeat'))
+            except OSError:
+                pass
+
+
+def _queue(upload_id: str) -> None:
+    """Hand an upload to the background pool; it counts as alive from now on, even while queued"""
+    global _keeper
+    with open(os.path.join(_session_dir(upload_id), 'processing.heartbeat'), 'w'):
+        pass
+    with _active_lock:
+        _active.add(upload_id)
+        if _keeper is None:
+            _keeper = threading.Thread(target=_keep_alive, name='chunked-upload-heartbeat', daemon=True)
+            _keeper.start()
+    _push_pool.submit(_process_upload, upload_id)
+
+
+def _recover_stale(upload_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick up a 'processing' upload whose job died with its worker; returns the current manifest
+
+    The job is queued again when the chunks (or the assembled file) are still on disk,
+    otherwise the upload is marked 'failed' so the client can send it again or delete it.
+    Only one worker wins the claim for a given attempt, so a stale upload is re-queued once.
+    """
+    directory = _session_dir(upload_id)
+    if manifest['status'] != 'processing' or _heartbeat_age(directory, manifest) < PROCESSING_TIMEOUT:
+        return manifest
+
+    attempt = manifest.get('attempt', 1) + 1
+    try:
+        os.close(os.open(os.path.join(directory, f"recover-{attempt}.lock"), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return _read_manifest(upload_id)
+
+    recoverable = (len(_received_chunks(directory, manifest)) == manifest['total_chunks']
+                   or os.path.exists(_assembled_path(directory, manifest)))
+    if attempt > MAX_PROCESSING_ATTEMPTS or not recoverable:
+        reason = 'tentativas esgotadas' if recoverable else 'arquivo perdido'
+        logger.error(f"Upload {upload_id} stalled while processing ({reason}); marking it failed")
+        manifest.update({'status': 'failed', 'error': f'Processamento interrompido ({reason}); envie o arquivo novamente'})
+        _write_manifest(directory, manifest)
+        admin_events.publish('media', {
+            'action': 'upload_failed',
+            'routine_id': manifest['routine_id'],
+            'upload_id': upload_id,
+            'status': 'failed'
+        })
+        return manifest
+
+    logger.warning(f"Upload {upload_id} stalled while processing; queueing attempt {attempt}")
+    manifest['attempt'] = attempt
+    _write_manifest(directory, manifest)
+    _queue(upload_id)
+    return manifest
+
+
+def cleanup_stale_uploads(max_age: int = SESSION_TTL) -> int:
+    """Remove staging directories untouched for max_age seconds and recover stalled jobs
+
+    Returns how many directories were removed.
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(STAGING_DIR))
+    except FileNotFoundError:
+        return 0
+
+    for entry in entries:
+        if not entry.is_dir() or not UPLOAD_ID_PATTERN.match(entry.name):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+            else:
+                _recover_stale(entry.name, _read_manifest(entry.name))
+        except (OSError, ValueError, UploadError):
+            pass
+    return removed
+
+
+def init_upload(routine_id: str, filename: str, size: int, content_type: Optional[str] = None,
+                description: Optional[str] = None) -> Dict[str, Any]:
+    """Open an upload session and return its id, the chunk size and the number of chunks"""
+    if size <= 0:
+        raise UploadError('Tamanho do arquivo inválido')
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError(f'Arquivo maior que o limite de {MAX_UPLOAD_SIZE} bytes', 413)
+
+    cleanup_stale_uploads()
+
+    upload_id = uuid.uuid4().hex
+    directory = os.path.join(STAGING_DIR, upload_id)
+    os.makedirs(directory)
+
+    content_type = content_type or 'application/octet-stream'
+    manifest = {
+        'upload_id': upload_id,
+        'routine_id': routine_id,
+        'filename': filename,
+        'content_type': content_type,
+        'media_type': 'video' if content_type.startswith('video/') else 'image',
+        'description': description,
+        'size': size,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'total_chunks': -(-size // UPLOAD_CHUNK_SIZE),
+        'status': 'uploading',
+        'created_at': time.time()
+    }
+    _write_manifest(directory, manifest)
+    logger.info(f"Upload {upload_id} started: {filename} ({size} bytes, {manifest['total_chunks']} chunks)")
+    return get_upload_status(upload_id)
+
+
+def store_chunk(upload_id: str, index: int, stream, expected_sha256: str) -> Dict[str, Any]:
+    """Write one chunk from a request stream, verifying its length and SHA-256
+
+    The body is hashed while it is copied to a temporary file, CHUNK_SIZE at a time, and
+    only renamed into place once it matches, so a stored chunk is always a good chunk and
+    re-sending one (after a dropped connection) is harmless.
+    """
+    manifest = _read_manifest(upload_id)
+    directory = _session_dir(upload_id)
+    if manifest['status'] != 'uploading':
+        raise UploadError('Upload já finalizado', 409)
+    if index < 0 or index >= manifest['total_chunks']:
+        raise UploadError('Índice de bloco inválido')
+    expected_sha256 = (expected_sha256 or '').lower()
+    if not SHA256_PATTERN.match(expected_sha256):
+        raise UploadError('Cabeçalho X-Chunk-SHA256 ausente ou inválido')
+
+    expected_length = _chunk_length(manifest, index)
+    digest = hashlib.sha256()
+    length = 0
+    temp_path = os.path.join(directory, f"chunk-{index:06d}.{uuid.uuid4().hex}.part")
+    try:
+        with open(temp_path, 'wb') as part:
+            while True:
+                block = stream.read(min(CHUNK_SIZE, expected_length - length + 1))
+                if not block:
+                    break
+                length += len(block)
+                if length > expected_length:
+                    raise UploadError('Bloco maior que o esperado')
+                digest.update(block)
+                part.write(block)
+
+        if length != expected_length:
+            raise UploadError(f'Bloco incompleto: {length} de {expected_length} bytes')
+        if digest.hexdigest() != expected_sha256:
+            raise UploadError('Hash do bloco não confere', 422)
+
+        os.replace(temp_path, _chunk_path(directory, index))
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    return {'upload_id': upload_id, 'index': index, 'size': length}
+
+
+def _copy_fd(source_fd: int, target_fd: int, length: int) -> None:
+    """Append length bytes from source_fd to target_fd without going through user space
+
+    copy_file_range keeps the copy inside the kernel (and can share extents on filesystems
+    that support reflinks); sendfile does the same on older kernels. Both advance the file
+    offsets, so chunks are simply appended in order.
+    """
+    remaining = length
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(source_fd, target_fd, remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            pass  # e.g. EXDEV on old kernels; finish below
+
+    if remaining > 0 and hasattr(os, 'sendfile'):
+        try:
+            while remaining > 0:
+                copied = os.sendfile(target_fd, source_fd, None, remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            pass
+
+    while remaining > 0:
+        block = os.read(source_fd, min(CHUNK_SIZE, remaining))
+        if not block:
+            raise IOError('Chunk ended before its expected size')
+        os.write(target_fd, block)
+        remaining -= len(block)
+
+
+def _assemble(directory: str, manifest: Dict[str, Any]) -> str:
+    """Concatenate the chunks into one file in the staging directory and return its path"""
+    target_path = _assembled_path(directory, manifest)
+    target_fd = os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        for index in range(manifest['total_chunks']):
+            source_fd = os.open(_chunk_path(directory, index), os.O_RDONLY)
+            try:
+                _copy_fd(source_fd, target_fd, _chunk_length(manifest, index))
+            finally:
+                os.close(source_fd)
+    finally:
+        os.close(target_fd)
+
+    if os.path.getsize(target_path) != manifest['size']:
+        raise IOError('Assembled file size does not match the upload')
+    return target_path
+
+
+def _process_upload(upload_id: str) -> None:
+    """Background job: assemble the chunks, push the file to storage and record the media row"""
+    from supabase_tools import supabase
+
+    directory = _session_dir(upload_id)
+    manifest = _read_manifest(upload_id)
+    try:
+        # A re-queued job may find the chunks already assembled (and removed) by the last one
+        if len(_received_chunks(directory, manifest)) == manifest['total_chunks']:
+            path = _assemble(directory, manifest)
+            for index in range(manifest['total_chunks']):
+                os.unlink(_chunk_path(directory, index))
+        else:
+            path = _assembled_path(directory, manifest)
+            if not os.path.exists(path) or os.path.getsize(path) != manifest['size']:
+                raise IOError('Upload chunks are gone; send the file again')
+
+        # One sequential read for the content hash; a file already stored is not pushed again
+        content_hash = file_sha256(path)
+        extension = os.path.splitext(manifest['filename'])[1].lower()
+        result = upload_spooled(supabase, {
+            'path': path,
+            'filename': manifest['filename'],
+            'object_name': f"{content_hash}{extension}",
+            'sha256': content_hash,
+            'content_type': manifest['content_type'],
+            'media_type': manifest['media_type'],
+            'size': manifest['size']
+        })
+        if 'error' in result:
+            os.unlink(path)
+            raise IOError(result['error'])
+
+        media = record_uploads(supabase, manifest['routine_id'], [result], manifest['description'],
+                               upload_id=upload_id, status='done')
+        # 'done' before the file goes, so a crash in between is never retried into a second row
+        manifest.update({'status': 'done', 'media': media[0] if media else None})
+        _write_manifest(directory, manifest)
+        os.unlink(path)
+        logger.info(f"Upload {upload_id} stored as {result['object_name']}")
+
+    except Exception as e:
+        logger.error(f"Error processing upload {upload_id}: {e}")
+        manifest.update({'status': 'failed', 'error': str(e)})
+        _write_manifest(directory, manifest)
+        admin_events.publish('media', {
+            'action': 'upload_failed',
+            'routine_id': manifest['routine_id'],
+            'upload_id': upload_id,
+            'status': 'failed'
+        })
+    finally:
+        with _active_lock:
+            _active.discard(upload_id)
+
+
+def complete_upload(upload_id: str) -> Dict[str, Any]:
+    """Check that every chunk arrived and hand the upload to the background pool
+
+    Returns immediately with status 'processing'; the final status is published as a
+    'media' admin event and can also be read from get_upload_status.
+    """
+    manifest = _read_manifest(upload_id)
+    directory = _session_dir(upload_id)
+    if manifest['status'] != 'uploading':
+        return get_upload_status(upload_id)
+
+    missing = sorted(set(range(manifest['total_chunks'])) - set(_received_chunks(directory, manifest)))
+    if missing:
+        raise UploadError(f'Blocos ausentes: {missing[:20]}', 409)
+
+    # A repeated complete (retry, or another worker) must not push the file twice
+    try:
+        os.close(os.open(os.path.join(directory, 'complete.lock'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return get_upload_status(upload_id)
+
+    manifest['status'] = 'processing'
+    _write_manifest(directory, manifest)
+    _queue(upload_id)
+    return get_upload_status(upload_id)
+
+
+def get_upload_status(upload_id: str) -> Dict[str, Any]:
+    """Public view of an upload: status, progress and which chunks still have to be sent"""
+    manifest = _recover_stale(upload_id, _read_manifest(upload_id))
+    directory = _session_dir(upload_id)
+
+    status = {key: manifest.get(key) for key in (
+        'upload_id', 'routine_id', 'filename', 'media_type', 'size',
+        'chunk_size', 'total_chunks', 'status', 'error', 'media'
+    )}
+    if manifest['status'] == 'uploading':
+        received = _received_chunks(directory, manifest)
+        status['received'] = len(received)
+        status['missing'] = sorted(set(range(manifest['total_chunks'])) - set(received))
+    else:
+        status['received'] = manifest['total_chunks']
+        status['missing'] = []
+    return status
+
+
+def delete_upload(upload_id: str) -> None:
+    """Abort an upload and remove its staging directory"""
+    manifest = _recover_stale(upload_id, _read_manifest(upload_id))
+    if manifest['status'] == 'processing':
+        raise UploadError('Upload em processamento', 409)
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
@@ -0,0 +1,222 @@
+"""
+Content Search - Busca unificada da Anna (rotinas, mídias, memórias, banco de imagens, conversas e biblioteca)
+Todas as fontes são consultadas em paralelo sob um único prazo; os resultados entram numa só lista,
+ordenada por uma pontuação comum, com o tempo e o estado de cada fonte
+"""
+
+import os
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from knowledge_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DEADLINE = float(os.getenv('SEARCH_DEADLINE_MS', '1500')) / 1000
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '8'))
+MAX_ILIKE_WORDS = 5
+SNIPPET_CHARS = 200
+# Share of the common score given by query coverage; the rest is the source's own relevance
+COVERAGE_WEIGHT = 0.6
+
+# Queries outlive a missed deadline, so the pool is shared instead of one per call
+_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='content-search')
+
+
+def _snippet(text: Optional[str]) -> str:
+    text = ' '.join((text or '').split())
+    return text if len(text) <= SNIPPET_CHARS else text[:SNIPPET_CHARS - 1].rstrip() + '…'
+
+
+def _ilike_words(query: str) -> List[str]:
+    """Longest words of the query, as typed (ILIKE compares accented text as stored)"""
+    words = sorted(set(re.findall(r'\w{3,}', query or '', re.UNICODE)), key=len, reverse=True)
+    return [word.replace('%', '').replace(',', '') for word in words[:MAX_ILIKE_WORDS]]
+
+
+def _item(source: str, item_id, title: Optional[str], text: Optional[str],
+          relevance: Optional[float], data: Dict[str, Any]) -> Dict[str, Any]:
+    return {'source': source, 'id': item_id, 'title': title, 'snippet': _snippet(text),
+            'relevance': relevance, 'data': data}
+
+
+def _search_routines(query: str, limit: int) -> List[Dict[str, Any]]:
+    from routine_search import search_routines
+
+    return [_item('routine', r['id'], r['activity'],
+                  ' '.join(filter(None, [r['date'], r['location'], r['description']])), r['rank'], {
+                      'id': r['id'],
+                      'activity': r['activity'],
+                      'category': r['category'],
+                      'date': r['date'],
+                      'description': r['description'],
+                      'location': r['location']
+                  }) for r in search_routines(query, limit=limit)]
+
+
+def _search_media(query: str, limit: int) -> List[Dict[str, Any]]:
+    from supabase_tools import supabase
+    from media_derivatives import smallest_variant, CHAT_IMAGE_SIZE
+
+    words = _ilike_words(query)
+    if not words:
+        return []
+    rows = supabase.table('anna_routine_media').select('*').or_(
+        ','.join(f'description.ilike.%{word}%' for word in words)).limit(limit).execute().data or []
+    return [_item('media', m.get('id'), m.get('description'), m.get('description'), None, {
+        'id': m.get('id'),
+        'media_type': m.get('media_type'),
+        'media_url': smallest_variant(m, CHAT_IMAGE_SIZE) if m.get('media_type') == 'image' else m.get('media_url'),
+        'description': m.get('description'),
+        'routine_id': m.get('routine_id')
+    }) for m in rows]
+
+
+def _search_knowledge(kind: str, query: str, limit: int) -> List[Dict[str, Any]]:
+    from knowledge_index import knowledge_index
+    from media_derivatives import smallest_variant, CHAT_IMAGE_SIZE
+
+    results = []
+    for score, _, row in knowledge_index.search(query, limit=limit, kind=kind):
+        data = {key: row.get(key) for key in ('id', 'name', 'description', 'when_to_use', 'keywords')}
+        if kind == 'memory':
+            data['content'] = row.get('content')
+        else:
+            data['image_url'] = smallest_variant(row, CHAT_IMAGE_SIZE)
+        results.append(_item(kind, row.get('id'), row.get('name'),
+                             ' '.join(filter(None, [row.get('when_to_use'), row.get('description'), row.get('content')])),
+                             score, data))
+    return results
+
+
+def _search_conversations(query: str, limit: int) -> List[Dict[str, Any]]:
+    """Working set of the conversation memories (summaries and recent turns), see memory_consolidation.py"""
+    from routine_search import build_search_query, TS_CONFIG
+    from dual_database_sync import dual_sync
+
+    tsquery = build_search_query(query)
+    if not tsquery:
+        return []
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, memory_type, content, contact_id, importance_score,
+                   ts_rank_cd(to_tsvector(%(config)s, content), to_tsquery(%(config)s, %(tsquery)s))
+                       * (1 + COALESCE(decayed_importance, importance_score, 1) / 10.0) AS rank
+            FROM memories
+            WHERE archived_at IS NULL AND is_active
+              AND to_tsvector(%(config)s, content) @@ to_tsquery(%(config)s, %(tsquery)s)
+            ORDER BY rank DESC
+            LIMIT %(limit)s
+        """, {'config': TS_CONFIG, 'tsquery': tsquery, 'limit': limit})
+        rows = cursor.fetchall()
+
+    return [_item('conversation', memory_id, f"{memory_type} ({contact_id})" if contact_id else memory_type,
+                  content, float(rank), {
+                      'id': memory_id,
+                      'memory_type': memory_type,
+                      'content': content,
+                      'contact_id': contact_id,
+                      'importance_score': importance
+                  }) for memory_id, memory_type, content, contact_id, importance, rank in rows]
+
+
+def _search_library(query: str, limit: int) -> List[Dict[str, Any]]:
+    from supabase_tools import supabase
+
+    words = _ilike_words(query)
+    if not words:
+        return []
+    rows = supabase.table('conteudo').select('*').or_(','.join(
+        f'{column}.ilike.%{word}%' for word in words for column in ('titulo', 'descricao')
+    )).order('criado_em', desc=True).limit(limit).execute().data or []
+    return [_item('library', c.get('id'), c.get('titulo'), c.get('descricao'), None, {
+        'titulo': c.get('titulo'),
+        'descricao': c.get('descricao'),
+        'tipo': c.get('tipo_conteudo'),
+        'url': c.get('url')
+    }) for c in rows]
+
+
+# Source -> (search function, weight in the merged ranking)
+SOURCES: Dict[str, Tuple[Callable[[str, int], List[Dict[str, Any]]], float]] = {
+    'routine': (_search_routines, 1.0),
+    'memory': (lambda query, limit: _search_knowledge('memory', query, limit), 1.0),
+    'image': (lambda query, limit: _search_knowledge('image', query, limit), 0.9),
+    'media': (_search_media, 0.8),
+    'library': (_search_library, 0.8),
+    'conversation': (_search_conversations, 0.7)
+}
+
+
+def coverage(terms: List[str], item: Dict[str, Any]) -> float:
+    """Share of the query words found in the item's title and text (as words or word prefixes)"""
+    if not terms:
+        return 0.0
+    words = set(tokenize(f"{item['title'] or ''} {item['snippet']}"))
+    return sum(1 for term in terms if term in words or any(word.startswith(term) for word in words)) / len(terms)
+
+
+def _rank(query: str, results: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Give every item a common score in [0, 1]
+
+    score = source weight * (COVERAGE_WEIGHT * query coverage + rest * relevance), where
+    relevance is the source's own score over the best in that source's results. Sources
+    without a score of their own (ILIKE) use the coverage for both parts.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    merged = []
+    for source, items in results.items():
+        weight = SOURCES[source][1]
+        best = max((item['relevance'] or 0 for item in items), default=0)
+        for item in items:
+            covered = coverage(terms, item)
+            relevance = item['relevance'] / best if item['relevance'] is not None and best > 0 else covered
+            merged.append({**item, 'score': round(weight * (COVERAGE_WEIGHT * covered + (1 - COVERAGE_WEIGHT) * relevance), 4)})
+    merged.sort(key=lambda item: item['score'], reverse=True)
+    return merged
+
+
+def search_all(query: str, sources: Optional[List[str]] = None, limit: int = 10,
+               deadline: float = SEARCH_DEADLINE) -> Dict[str, Any]:
+    """Query the sources concurrently and merge what arrived within deadline seconds
+
+    Returns the ranked items (at most limit) and, per source, its status ('ok', 'error'
+    or 'timeout'), result count and time. A slow or failing source only loses its own
+    results.
+    """
+    selected = [name for name in (sources or SOURCES) if name in SOURCES]
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    def run(name: str):
+        source_started = time.perf_counter()
+        try:
+            return SOURCES[name][0](query, limit)
+        finally:
+            timings[name] = round((time.perf_counter() - source_started) * 1000, 1)
+
+    futures = {name: _pool.submit(run, name) for name in selected}
+    wait(futures.values(), timeout=deadline)
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            report[name] = {'status': 'timeout', 'count': 0, 'ms': round(deadline * 1000, 1)}
+            continue
+        try:
+            results[name] = future.result()
+            report[name] = {'status': 'ok', 'count': len(results[name]), 'ms': timings.get(name)}
+        except Exception as e:
+            logger.error(f"Content search source '{name}' failed: {e}")
+            report[name] = {'status': 'error', 'error': str(e), 'count': 0, 'ms': timings.get(name)}
+
+    ranked = _rank(query, results)[:limit]
+    duration = round((time.perf_counter() - started) * 1000, 1)
+    per_source = ', '.join(f"{name} {info['status']} {info['ms']} ms" for name, info in report.items())
+    logger.info(f"Content search '{query}': {len(ranked)} results in {duration} ms ({per_source})")
+    return {'results': ranked, 'sources': report, 'duration_ms': duration}
@@ -0,0 +1,205 @@
+"""
+Conversation Pipeline - Pipeline único de conversa da Anna
+Usado pelo /chat e pelo WhatsApp: sessão de chat, histórico, execução do agente e persistência
+Os turnos rodam em event loops de longa duração (threads em segundo plano): os Runners em cache
+e os clientes assíncronos que eles guardam ficam sempre no loop em que foram criados
+"""
+
+import os
+import zlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Callable
+from google.genai.types import Content, Part
+from google.adk.events import Event
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from anna_agent import create_anna_agent
+from chat_session_manager_postgres import chat_session_manager
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "anna_chat"
+DEFAULT_AGENT_KEY = "default"
+FALLBACK_RESPONSE = "Desculpe, não consegui processar sua mensagem no momento."
+ERROR_RESPONSE = "Desculpe, ocorreu um erro interno. Tente novamente em alguns instantes."
+# Event loops shared by all turns; a conversation's turns always run on the same one
+PIPELINE_LOOPS = int(os.getenv('CONVERSATION_LOOPS', '4'))
+
+
+class ConversationPipeline:
+    def __init__(self, max_sessions: int = 500, history_limit: int = 20):
+        """Inicializa o pipeline com um único session service e caches de agentes/sessões"""
+        self.max_sessions = max_sessions
+        self.history_limit = history_limit
+        self.session_service = InMemorySessionService()
+        self._runners: Dict[Tuple[asyncio.AbstractEventLoop, str], Runner] = {}
+        self._sessions: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loops: List[asyncio.AbstractEventLoop] = []
+
+    def _get_loops(self) -> List[asyncio.AbstractEventLoop]:
+        """Inicia os event loops em segundo plano (uma vez por processo)"""
+        if not self._loops:
+            with self._lock:
+                if not self._loops:
+                    loops = []
+                    for index in range(max(PIPELINE_LOOPS, 1)):
+                        loop = asyncio.new_event_loop()
+                        threading.Thread(target=loop.run_forever, daemon=True,
+                                         name=f'conversation-loop-{index}').start()
+                        loops.append(loop)
+                    self._loops = loops
+        return self._loops
+
+    def run_turn(self, **kwargs) -> Dict[str, Any]:
+        """Executa handle_turn num dos event loops do pipeline e aguarda o resultado
+
+        Para chamadas síncronas (rotas Flask, webhook do WhatsApp), no lugar de asyncio.run,
+        que criaria um loop novo a cada turno enquanto os Runners em cache ficam presos ao primeiro.
+        """
+        loops = self._get_loops()
+        conversation = kwargs.get('session_id') or f"{kwargs.get('channel', 'chat')}:{kwargs.get('contact_phone')}"
+        loop = loops[zlib.crc32(conversation.encode('utf-8')) % len(loops)]
+        return asyncio.run_coroutine_threadsafe(self.handle_turn(**kwargs), loop).result()
+
+    def get_runner(self, agent_id: Optional[str] = None) -> Runner:
+        """Retorna o Runner em cache para o agente no loop atual, criando o agente uma vez por loop"""
+        key = (asyncio.get_running_loop(), agent_id or DEFAULT_AGENT_KEY)
+        runner = self._runners.get(key)
+        if runner:
+            return runner
+
+        from supabase_tools import get_agent_config_by_id, get_active_agent_configuration
+
+        config = get_agent_config_by_id(agent_id) if agent_id else get_active_agent_configuration()
+        if not config:
+            raise Exception("Agent configuration not found")
+
+        agent = create_anna_agent(config)
+        runner = Runner(agent=agent, app_name=APP_NAME, session_service=self.session_service)
+        with self._lock:
+            self._runners[key] = runner
+        logger.info(f"Agent '{agent.name}' cached for key {key[1]}")
+        return runner
+
+    def invalidate_agents(self):
+        """Descarta os agentes em cache (ex.: após salvar nova configuração)"""
+        with self._lock:
+            self._runners.clear()
+        logger.info("Agent cache cleared")
+
+    async def _ensure_session(self, user_id: str, session_id: str, chat_session_id: str):
+        """Reutiliza a sessão ADK em memória ou cria uma nova carregando o histórico do banco"""
+        session_obj = await self.session_service.get_session(
+            app_name=APP_NAME, user_id=user_id, session_id=session_id
+        )
+
+        evicted = []
+        with self._lock:
+            key = (user_id, session_id)
+            if session_obj and key in self._sessions:
+                self._sessions.move_to_end(key)
+                return session_obj
+            self._sessions[key] = None
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[0])
+
+        for old_user_id, old_session_id in evicted:
+            await self.session_service.delete_session(
+                app_name=APP_NAME, user_id=old_user_id, session_id=old_session_id
+            )
+
+        if not session_obj:
+            session_obj = await self.session_service.create_session(
+                app_name=APP_NAME, user_id=user_id, session_id=session_id
+            )
+            await self._load_history(session_obj, chat_session_id)
+        return session_obj
+
+    async def _load_history(self, session_obj, chat_session_id: str):
+        """Carrega as últimas mensagens da sessão de chat no histórico da sessão ADK"""
+        try:
+            messages = await asyncio.to_thread(chat_session_manager.get_recent_session_messages,
+                                               chat_session_id, limit=self.history_limit)
+            for msg in messages:
+                role = 'model' if msg['is_from_bot'] else 'user'
+                content = Content(role=role, parts=[Part(text=msg['content'])])
+                await self.session_service.append_event(session_obj, Event(author=role, content=content))
+            logger.info(f"Loaded {len(messages)} messages for ADK session {session_obj.id}")
+        except Exception as e:
+            logger.error(f"Error loading conversation history: {e}")
+
+    async def run_agent(self, user_message: str, user_id: str, session_id: str,
+                        chat_session_id: str, agent_id: Optional[str] = None,
+                        on_partial: Optional[Callable[[str], None]] = None) -> str:
+        """Executa o agente na sessão ADK em cache e retorna a resposta final
+        
+        Com on_partial, o modelo é executado em modo streaming e cada trecho de texto
+        parcial é entregue ao callback assim que gerado.
+        """
+        try:
+            runner = self.get_runner(agent_id)
+            await self._ensure_session(user_id, session_id, chat_session_id)
+
+            content = Content(role='user', parts=[Part(text=user_message)])
+            run_config = RunConfig(streaming_mode=StreamingMode.SSE) if on_partial else RunConfig()
+            final_response = ""
+            async for event in runner.run_async(user_id=user_id, session_id=session_id,
+                                                new_message=content, run_config=run_config):
+                if on_partial and event.partial:
+                    if event.content and event.content.parts:
+                        text = ''.join(part.text or '' for part in event.content.parts)
+                        if text:
+                            # Delivery blocks on the network: keep the loop free for other turns
+                            await asyncio.to_thread(on_partial, text)
+                    continue
+                if event.is_final_response():
+                    if event.content and event.content.parts:
+                        final_response = event.content.parts[0].text or ""
+                    break
+
+            return final_response or FALLBACK_RESPONSE
+
+        except Exception as e:
+            logger.error(f"Error running Anna agent: {e}")
+            return ERROR_RESPONSE
+
+    async def handle_turn(self, user_message: str, contact_phone: str, contact_name: Optional[str] = None,
+                          channel: str = 'chat', session_id: Optional[str] = None,
+                          agent_id: Optional[str] = None,
+                          on_partial: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Processa um turno completo: sessão de chat, agente e gravação em lote da conversa"""
+        chat_session_id = await asyncio.to_thread(
+            chat_session_manager.get_or_create_session,
+            contact_phone=contact_phone,
+            contact_name=contact_name,
+            channel=channel
+        )
+        session_id = session_id or f"{channel}_{contact_phone}"
+
+        response = await self.run_agent(user_message, contact_phone, session_id, chat_session_id,
+                                        agent_id, on_partial=on_partial)
+
+        await asyncio.to_thread(
+            chat_session_manager.save_turn,
+            session_id=chat_session_id,
+            contact_phone=contact_phone,
+            contact_name=contact_name,
+            user_message=user_message,
+            bot_response=response,
+            channel=channel
+        )
+
+        return {
+            'response': response,
+            'session_id': session_id,
+            'chat_session_id': chat_session_id
+        }
+
+
+# Instância global compartilhada por /chat e WhatsApp
+conversation_pipeline = ConversationPipeline()
@@ -7,54 +7,53 @@ import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any
 
-def get_anna_routines(days_ahead: int = 7, status_filter: Optional[str] = None) -> Dict[str, Any]:
+def get_anna_routines(days_ahead: int = 7, status_filter: Optional[str] = None,
+                      search_text: Optional[str] = None) -> Dict[str, Any]:
     """
     Get Anna's routine activities for the specified number of days ahead.
     
     Args:
         days_ahead: Number of days to look ahead (default 7)
         status_filter: Filter by status ('upcoming', 'current', 'completed') or None for all
+        search_text: Words to search for in activity, description, location or category
+                     (results ordered by relevance), or None to list everything
     
     Returns:
         Dictionary with success status and data
     """
     try:
         from datetime import date
-        from app import db
-        from models import AnnaRoutine
+        from routine_search import search_routines
         
         today = date.today()
         end_date = today + timedelta(days=days_ahead)
         
-        # Build query
-        query = db.session.query(AnnaRoutine).filter(
-            AnnaRoutine.date >= today.strftime('%Y-%m-%d'),
-            AnnaRoutine.date <= end_date.strftime('%Y-%m-%d')
+        routine_data = search_routines(
+            search_text,
+            limit=100,
+            status=status_filter,
+            date_from=today,
+            date_to=end_date
         )
         
-        if status_filter:
-            query = query.filter(AnnaRoutine.status == status_filter)
-        
-        routines = query.order_by(AnnaRoutine.date, AnnaRoutine.time_start).all()
-        
-        # Convert to dictionaries
-        routine_data = []
-        for routine in routines:
-            routine_dict = {
-                'id': routine.id,
-                'activity': routine.activity,
-                'category': routine.category,
-                'date': routine.date,
-                'time_start': routine.time_start,
-                'time_end': routine.time_end,
-                'status': routine.status,
-                'description': routine.description,
-                'location': routine.location,
-                'has_images': routine.has_images,
-                'has_videos': routine.has_videos,
-                'created_at': routine.created_at.isoformat() if routine.created_at else None
-            }
-            routine_data.append(routine_dict)
+        # Recurring routines are expanded for the same window and merged before the limit:
+        # ranked like stored routines when searching, by date and time otherwise
+        from routine_recurrence import expand_occurrences, occurrence_to_dict
+        occurrences = [occurrence_to_dict(row) for row in expand_occurrences(
+            today, end_date, status=status_filter, search=search_text
+        )]
+        if occurrences:
+            if search_text:
+                from routine_search import rank_rows
+                for occurrence, rank in zip(occurrences, rank_rows(search_text, occurrences)):
+                    occurrence['rank'] = rank
+            routine_data += occurrences
+            routine_data.sort(key=lambda routine: (routine['date'], routine['time_start'] or ''))
+            if search_text:
+                # Stable: date and time still order equal ranks (newest date first, as in search_routines)
+                routine_data.sort(key=lambda routine: routine['date'], reverse=True)
+                routine_data.sort(key=lambda routine: routine.get('rank') or 0, reverse=True)
+            routine_data = routine_data[:100]
         
         logging.info(f"Retrieved {len(routine_data)} routines for {days_ahead} days ahead")
         return {'success': True, 'data': routine_data}
@@ -117,43 +116,51 @@ def get_anna_routine_media(routine_id: Optional[int] = None, media_type: Optiona
         logging.error(f"Error getting routine media: {e}")
         return {'success': False, 'error': str(e)}
 
+def _memory_result(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Tool result for a content_search item from the 'memory' or 'conversation' source"""
+    data = item['data']
+    if item['source'] == 'conversation':
+        return {
+            'source': 'conversation',
+            'id': data.get('id'),
+            'memory_type': data.get('memory_type'),
+            'contact_id': data.get('contact_id'),
+            'content': data.get('content'),
+            'score': item['score']
+        }
+    return {
+        'source': 'memory',
+        'id': data.get('id'),
+        'name': data.get('name'),
+        'description': data.get('description'),
+        'when_to_use': data.get('when_to_use'),
+        'content': data.get('content'),
+        'keywords': data.get('keywords'),
+        'score': item['score']
+    }
+
 def search_memories(query_text: str, limit: int = 10) -> Dict[str, Any]:
     """
     Search Anna's memories for relevant content.
     
+    Covers the curated memories (name, keywords, when_to_use, description, content) and
+    what Anna remembers from conversations (per-contact summaries and recent turns).
+    
     Args:
-        query_text: Search term to find in memory content
+        query_text: Words to search for (accents and case are ignored, results ordered by relevance)
         limit: Maximum number of results to return
     
     Returns:
-        Dictionary with success status and data
+        Dictionary with success status and data; each item has source 'memory' or 'conversation'
     """
     try:
-        # Search in memory content using ILIKE for case-insensitive search
-        memories = db.session.query(AnnaMemory).filter(
-            and_(
-                AnnaMemory.is_active == True,
-                or_(
-                    AnnaMemory.content.ilike(f'%{query_text}%'),
-                    AnnaMemory.context.ilike(f'%{query_text}%'),
-                    AnnaMemory.tags.ilike(f'%{query_text}%')
-                )
-            )
-        ).order_by(AnnaMemory.importance_score.desc(), AnnaMemory.created_at.desc()).limit(limit).all()
+        from content_search import search_all
+        from knowledge_index import knowledge_index
         
-        # Convert to dictionaries
-        memory_data = []
-        for memory in memories:
-            memory_dict = {
-                'id': memory.id,
-                'memory_type': memory.memory_type,
-                'content': memory.content,
-                'context': memory.context,
-                'importance_score': memory.importance_score,
-                'tags': memory.tags,
-                'created_at': memory.created_at.isoformat() if memory.created_at else None
-            }
-            memory_data.append(memory_dict)
+        # First load happens here, not against the search deadline
+        knowledge_index.ensure_loaded()
+        found = search_all(query_text, sources=['memory', 'conversation'], limit=limit)
+        memory_data = [_memory_result(item) for item in found['results']]
         
         logging.info(f"Found {len(memory_data)} memories for query: {query_text}")
         return {'success': True, 'data': memory_data}
@@ -162,6 +169,79 @@ def search_memories(query_text: str, limit: int = 10) -> Dict[str, Any]:
         logging.error(f"Error searching memories: {e}")
         return {'success': False, 'error': str(e)}
 
+def search_memories_semantic(query_text: str, limit: int = 5) -> Dict[str, Any]:
+    """
+    Search Anna's memories by meaning, for questions worded differently from the memory.
+    
+    Args:
+        query_text: What the user is talking about, in their own words
+        limit: Maximum number of results to return
+    
+    Returns:
+        Dictionary with success status, data (curated memories, most similar first) and
+        conversations (matching conversation summaries and recent turns)
+    """
+    try:
+        from memory_vectors import memory_vectors, vectors_available
+        from content_search import search_all
+        
+        if not vectors_available():
+            return search_memories(query_text, limit)
+        
+        # Conversation memories live in the local database, outside the vector index
+        conversations = [_memory_result(item) for item in
+                         search_all(query_text, sources=['conversation'], limit=limit)['results']]
+        
+        memory_data = [{
+            'id': memory.get('id'),
+            'name': memory.get('name'),
+            'description': memory.get('description'),
+            'when_to_use': memory.get('when_to_use'),
+            'content': memory.get('content'),
+            'keywords': memory.get('keywords'),
+            'similarity': round(score, 3)
+        } for score, memory in memory_vectors.search(query_text, limit=limit)]
+        
+        logging.info(f"Found {len(memory_data)} similar memories for query: {query_text}")
+        return {'success': True, 'data': memory_data, 'conversations': conversations}
+        
+    except Exception as e:
+        logging.error(f"Error searching memories by similarity: {e}")
+        return {'success': False, 'error': str(e)}
+
+def search_image_bank(query_text: str, limit: int = 5) -> Dict[str, Any]:
+    """
+    Search Anna's image bank for images to show in the conversation.
+    
+    Args:
+        query_text: Words to search for in image name, keywords, when_to_use and description
+                    (accents and case are ignored, results ordered by relevance)
+        limit: Maximum number of results to return
+    
+    Returns:
+        Dictionary with success status and data (image_url sized for chat)
+    """
+    try:
+        from knowledge_index import knowledge_index
+        from media_derivatives import smallest_variant, CHAT_IMAGE_SIZE
+        
+        image_data = [{
+            'id': image.get('id'),
+            'name': image.get('name'),
+            'description': image.get('description'),
+            'when_to_use': image.get('when_to_use'),
+            'keywords': image.get('keywords'),
+            'image_url': smallest_variant(image, CHAT_IMAGE_SIZE),
+            'score': round(score, 3)
+        } for score, _, image in knowledge_index.search(query_text, limit=limit, kind='image')]
+        
+        logging.info(f"Found {len(image_data)} images for query: {query_text}")
+        return {'success': True, 'data': image_data}
+        
+    except Exception as e:
+        logging.error(f"Error searching image bank: {e}")
+        return {'success': False, 'error': str(e)}
+
 def get_recent_conversations(limit: int = 5) -> Dict[str, Any]:
     """
     Get recent conversation messages.
@@ -237,75 +317,26 @@ def get_profile_info() -> Dict[str, Any]:
 
 def search_content(query_text: str, content_type: Optional[str] = None, limit: int = 10) -> Dict[str, Any]:
     """
-    Search content across routines, media, and memories.
+    Search content across routines, media, memories, the image bank, past conversations and the content library.
     
     Args:
         query_text: Search term
-        content_type: Filter by type ('routine', 'media', 'memory') or None for all
-        limit: Maximum number of results per type
+        content_type: Filter by source ('routine', 'media', 'memory', 'image', 'conversation', 'library')
+                      or None for all
+        limit: Maximum number of results
     
     Returns:
-        Dictionary with success status and combined search results
+        Dictionary with success status, one list of results ranked across sources (each with
+        source, score, title, snippet and data) and the status and time of each source
     """
     try:
-        results = {}
-        
-        if not content_type or content_type == 'routine':
-            # Search routines
-            routines = db.session.query(AnnaRoutine).filter(
-                or_(
-                    AnnaRoutine.activity.ilike(f'%{query_text}%'),
-                    AnnaRoutine.description.ilike(f'%{query_text}%'),
-                    AnnaRoutine.location.ilike(f'%{query_text}%')
-                )
-            ).limit(limit).all()
-            
-            results['routines'] = [{
-                'id': r.id,
-                'activity': r.activity,
-                'category': r.category,
-                'date': r.date,
-                'description': r.description,
-                'location': r.location
-            } for r in routines]
-        
-        if not content_type or content_type == 'media':
-            # Search media
-            media = db.session.query(AnnaRoutineMedia).filter(
-                AnnaRoutineMedia.description.ilike(f'%{query_text}%')
-            ).limit(limit).all()
-            
-            results['media'] = [{
-                'id': m.id,
-                'media_type': m.media_type,
-                'media_url': m.media_url,
-                'description': m.description,
-                'routine_id': m.routine_id
-            } for m in media]
-        
-        if not content_type or content_type == 'memory':
-            # Search memories
-            memories = db.session.query(AnnaMemory).filter(
-                and_(
-                    AnnaMemory.is_active == True,
-                    or_(
-                        AnnaMemory.content.ilike(f'%{query_text}%'),
-                        AnnaMemory.context.ilike(f'%{query_text}%')
-                    )
-                )
-            ).limit(limit).all()
-            
-            results['memories'] = [{
-                'id': m.id,
-                'memory_type': m.memory_type,
-                'content': m.content,
-                'context': m.context,
-                'importance_score': m.importance_score
-            } for m in memories]
-        
-        total_results = sum(len(v) for v in results.values())
-        logging.info(f"Content search found {total_results} results for: {query_text}")
-        return {'success': True, 'data': results}
+        from content_search import search_all
+        
+        search = search_all(query_text, sources=[content_type] if content_type else None, limit=limit)
+        
+        logging.info(f"Content search found {len(search['results'])} results for: {query_text}")
+        return {'success': True, 'data': search['results'], 'sources': search['sources'],
+                'duration_ms': search['duration_ms']}
         
     except Exception as e:
         logging.error(f"Error searching content: {e}")
@@ -326,24 +357,31 @@ def save_conversation_memory(user_id: str, session_id: str, user_message: str, a
         Dictionary with success status
     """
     try:
-        # Create memory entry
-        memory = AnnaMemory(
-            memory_type='conversation',
-            content=f"User: {user_message}\nAnna: {assistant_response}",
-            context=f"Session: {session_id}, User: {user_id}",
-            importance_score=importance,
-            tags=f'["conversation", "user_{user_id}", "session_{session_id}"]'
-        )
-        
-        db.session.add(memory)
-        db.session.commit()
+        from dual_database_sync import dual_sync
+        
+        # One row per turn; memory_consolidation.py later folds each contact's turns into summaries
+        with dual_sync.get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO memories (memory_type, content, context, importance_score, tags, is_active,
+                                      contact_id, decayed_importance, created_at, updated_at)
+                VALUES ('conversation', %s, %s, %s, %s, TRUE, %s, %s,
+                        NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
+                RETURNING id
+            """, (f"User: {user_message}\nAnna: {assistant_response}",
+                  f"Session: {session_id}, User: {user_id}",
+                  importance,
+                  f'["conversation", "user_{user_id}", "session_{session_id}"]',
+                  user_id,
+                  importance))
+            memory_id = cursor.fetchone()[0]
+            conn.commit()
         
         logging.info(f"Saved conversation memory for session {session_id}")
-        return {'success': True, 'memory_id': memory.id}
+        return {'success': True, 'memory_id': memory_id}
         
     except Exception as e:
         logging.error(f"Error saving conversation memory: {e}")
-        db.session.rollback()
         return {'success': False, 'error': str(e)}
 
 from flask import current_app
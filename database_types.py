@@ -30,6 +30,8 @@ class AnnaRoutineMedia:
     media_url: str
     routine_id: Optional[str] = None
     description: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
     created_at: Optional[str] = None
 
 @dataclass
@@ -5,15 +5,25 @@ Garante que todos os dados sejam salvos em ambos os bancos simultaneamente
 
 import os
 import logging
+import threading
 import psycopg2
+import psycopg2.pool
 from typing import Dict, Any, Optional, List
 from contextlib import contextmanager
 from supabase import create_client, Client
+from event_stream import admin_events
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Routine columns mirrored to Supabase (same as sync_routine, plus the id). The media
+# flags are left out: they are kept on the local table (media_upload.update_media_counts)
+SUPABASE_ROUTINE_COLUMNS = (
+    'id', 'activity', 'category', 'date', 'time_start', 'time_end',
+    'description', 'location', 'status'
+)
+
 class DualDatabaseSync:
     def __init__(self):
         """Initialize dual database synchronization"""
@@ -33,23 +43,47 @@ class DualDatabaseSync:
             logger.warning("DATABASE_URL not set, using fallback SQLite database")
             self.postgres_url = "sqlite:///fallback.db"
         
+        # Connection pool is created lazily on first use
+        self.pool_min = int(os.getenv("PG_POOL_MIN", "1"))
+        self.pool_max = int(os.getenv("PG_POOL_MAX", "10"))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        
         logger.info("DualDatabaseSync initialized successfully")
 
+    def _get_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        """Return the shared PostgreSQL connection pool, creating it if needed"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.pool_min, self.pool_max, self.postgres_url
+                    )
+                    logger.info(f"PostgreSQL pool created ({self.pool_min}-{self.pool_max} connections)")
+        return self._pool
+
     @contextmanager
     def get_postgres_connection(self):
-        """Context manager for PostgreSQL connections"""
+        """Context manager for pooled PostgreSQL connections"""
         conn = None
+        broken = False
         try:
-            conn = psycopg2.connect(self.postgres_url)
+            conn = self._get_pool().getconn()
             yield conn
         except Exception as e:
             if conn:
-                conn.rollback()
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
             logger.error(f"PostgreSQL connection error: {e}")
             raise
         finally:
             if conn:
-                conn.close()
+                if not broken and not conn.closed:
+                    # Never hand an open transaction back to the pool
+                    conn.rollback()
+                self._get_pool().putconn(conn, close=broken or bool(conn.closed))
 
     def sync_chat_session(self, session_data: Dict[str, Any]) -> str:
         """Sync chat session to both databases"""
@@ -89,6 +123,14 @@ class DualDatabaseSync:
                     session_id = str(cursor.fetchone()[0])
                     pg_conn.commit()
                     logger.info(f"New session created in PostgreSQL: {session_id}")
+                    admin_events.publish('chat_session', {
+                        'action': 'created',
+                        'id': session_id,
+                        'contact_phone': session_data['contact_phone'],
+                        'contact_name': session_data.get('contact_name', session_data['contact_phone']),
+                        'channel': session_data.get('channel', 'chat'),
+                        'messages': 0
+                    })
 
             # 2. Sync to Supabase
             try:
@@ -155,6 +197,12 @@ class DualDatabaseSync:
                     message_id = result[0]
                     pg_conn.commit()
                     logger.info(f"Message saved to PostgreSQL: {message_id}")
+                    admin_events.publish('chat_session', {
+                        'action': 'message',
+                        'id': str(message_data.get('chat_session_id')),
+                        'contact_phone': message_data.get('sender_phone'),
+                        'messages': 1
+                    })
                 else:
                     logger.error("Failed to save message to PostgreSQL")
 
@@ -214,6 +262,90 @@ class DualDatabaseSync:
             logger.error(f"Error syncing message: {e}")
             return False
 
+    def sync_messages(self, chat_session_id: str, contact_phone: str, channel: str,
+                      messages: List[Dict[str, Any]]) -> bool:
+        """Sync a batch of messages from one chat session in a single transaction per database"""
+        if not messages:
+            return True
+
+        try:
+            # 1. Save to PostgreSQL (messages + session timestamp in one transaction)
+            with self.get_postgres_connection() as pg_conn:
+                cursor = pg_conn.cursor()
+
+                cursor.executemany("""
+                    INSERT INTO messages (
+                        chat_session_id, sender_phone, sender_name, content,
+                        message_type, media_url, is_from_bot,
+                        session_id, user_id, user_message, created_at
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, clock_timestamp())
+                """, [(
+                    chat_session_id,
+                    message.get('sender_phone'),
+                    message.get('sender_name', message.get('sender_phone')),
+                    message.get('content'),
+                    message.get('message_type', 'text'),
+                    message.get('media_url'),
+                    message.get('is_from_bot', False),
+                    chat_session_id,
+                    message.get('sender_phone'),
+                    message.get('content')
+                ) for message in messages])
+
+                cursor.execute("""
+                    UPDATE chat_sessions SET updated_at = NOW() WHERE id = %s
+                """, (chat_session_id,))
+                pg_conn.commit()
+                logger.info(f"{len(messages)} messages saved to PostgreSQL for session {chat_session_id}")
+                admin_events.publish('chat_session', {
+                    'action': 'message',
+                    'id': str(chat_session_id),
+                    'contact_phone': contact_phone,
+                    'channel': channel,
+                    'messages': len(messages)
+                })
+
+            # 2. Sync to Supabase
+            try:
+                session_check = self.supabase.table('chat_sessions').select('id').eq(
+                    'contact_phone', contact_phone
+                ).eq('channel', channel).eq('status', 'active').limit(1).execute()
+
+                if session_check.data:
+                    supabase_session_id = session_check.data[0]['id']
+                else:
+                    session_result = self.supabase.table('chat_sessions').insert({
+                        'contact_phone': contact_phone,
+                        'contact_name': contact_phone,
+                        'channel': channel,
+                        'status': 'active'
+                    }).execute()
+                    supabase_session_id = session_result.data[0]['id'] if session_result.data else None
+
+                if supabase_session_id:
+                    self.supabase.table('messages').insert([{
+                        'chat_session_id': supabase_session_id,
+                        'sender_phone': message.get('sender_phone'),
+                        'sender_name': message.get('sender_name', message.get('sender_phone')),
+                        'content': message.get('content'),
+                        'message_type': message.get('message_type', 'text'),
+                        'media_url': message.get('media_url'),
+                        'is_from_bot': message.get('is_from_bot', False)
+                    } for message in messages]).execute()
+                    logger.info(f"{len(messages)} messages synced to Supabase")
+                else:
+                    logger.error("Could not create/find session in Supabase")
+
+            except Exception as e:
+                logger.error(f"Error syncing messages to Supabase: {e}")
+                # Continue even if Supabase sync fails
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Error syncing messages: {e}")
+            return False
+
     def sync_routine(self, routine_data: Dict[str, Any]) -> Optional[str]:
         """Sync routine/activity to both databases"""
         try:
@@ -240,6 +372,7 @@ class DualDatabaseSync:
             db.session.commit()
             routine_id = str(routine.id)
             logger.info(f"Routine saved to PostgreSQL: {routine_id}")
+            admin_events.publish('routine', {'action': 'created', 'id': routine_id})
 
             # 2. Sync to Supabase
             try:
@@ -284,6 +417,7 @@ class DualDatabaseSync:
                 
                 db.session.commit()
                 logger.info(f"Routine updated in PostgreSQL: {routine_id}")
+                admin_events.publish('routine', {'action': 'updated', 'id': str(routine_id)})
 
             # 2. Update in Supabase
             try:
@@ -306,6 +440,7 @@ class DualDatabaseSync:
             return True
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error updating routine: {e}")
             return False
 
@@ -321,6 +456,7 @@ class DualDatabaseSync:
                 db.session.delete(routine)
                 db.session.commit()
                 logger.info(f"Routine deleted from PostgreSQL: {routine_id}")
+                admin_events.publish('routine', {'action': 'deleted', 'id': str(routine_id)})
 
             # 2. Delete from Supabase
             try:
@@ -336,5 +472,188 @@ class DualDatabaseSync:
             logger.error(f"Error deleting routine: {e}")
             return False
 
+    def sync_routine_batch(self, operations: List[Dict[str, Any]], atomic: bool = False) -> List[Dict[str, Any]]:
+        """Apply create/update/delete operations in one PostgreSQL transaction and one Supabase round
+
+        Each operation is {'op': 'create'|'update'|'delete', 'id': ..., 'fields': {...}} with
+        fields already converted to Python types. Every operation runs in its own savepoint,
+        so a failing item does not undo the others unless atomic is set. Returns one result
+        per operation, in order.
+        """
+        from models import Routine
+        from app import db
+        from sqlalchemy.orm import selectinload
+
+        results = []
+        supabase_rows = {}
+        deleted_ids = []
+
+        try:
+            # 1. PostgreSQL: every referenced routine in one query, then one savepoint per item
+            ids = {op['id'] for op in operations if op.get('id')}
+            routines = {}
+            if ids:
+                query = db.session.query(Routine).options(selectinload(Routine.media)).filter(Routine.id.in_(ids))
+                routines = {str(routine.id): routine for routine in query}
+
+            for index, operation in enumerate(operations):
+                action = operation['op']
+                routine_id = operation.get('id')
+                try:
+                    with db.session.begin_nested():
+                        if action == 'create':
+                            routine = Routine(status='upcoming', has_images=False, has_videos=False,
+                                              **operation['fields'])
+                            db.session.add(routine)
+                            db.session.flush()
+                            routine_id = str(routine.id)
+                            routines[routine_id] = routine
+                        elif action == 'update':
+                            routine = routines.get(routine_id)
+                            if routine is None:
+                                raise LookupError('Activity not found')
+                            for key, value in operation['fields'].items():
+                                setattr(routine, key, value)
+                            db.session.flush()
+                        else:
+                            # Deleting a missing routine is a no-op, as in sync_routine_delete
+                            routine = routines.pop(routine_id, None)
+                            if routine is not None:
+                                db.session.delete(routine)
+                                db.session.flush()
+
+                    if action == 'delete':
+                        supabase_rows.pop(routine_id, None)
+                        deleted_ids.append(routine_id)
+                    else:
+                        supabase_rows[routine_id] = self._supabase_routine_row(
+                            {column: getattr(routine, column) for column in SUPABASE_ROUTINE_COLUMNS}
+                        )
+                    results.append({'index': index, 'op': action, 'id': routine_id, 'success': True})
+
+                except Exception as e:
+                    results.append({'index': index, 'op': action, 'id': routine_id, 'success': False, 'error': str(e)})
+
+            if atomic and not all(result['success'] for result in results):
+                db.session.rollback()
+                for result in results:
+                    if result['success']:
+                        result.update(success=False, skipped=True,
+                                      error='Rolled back: another operation in the batch failed')
+                logger.info(f"Routine batch rolled back ({len(operations)} operations)")
+                return results
+
+            db.session.commit()
+            changed_ids = [result['id'] for result in results if result['success']]
+            logger.info(f"Routine batch saved to PostgreSQL: {len(changed_ids)}/{len(operations)} operations")
+            if changed_ids:
+                admin_events.publish('routine', {'action': 'batch', 'ids': changed_ids})
+
+        except Exception as e:
+            logger.error(f"Error syncing routine batch: {e}")
+            db.session.rollback()
+            raise
+
+        # 2. Supabase: one bulk upsert and one bulk delete
+        try:
+            if supabase_rows:
+                self.supabase.table('routine').upsert(list(supabase_rows.values())).execute()
+            if deleted_ids:
+                self.supabase.table('routine').delete().in_('id', deleted_ids).execute()
+            logger.info(f"Routine batch synced to Supabase: {len(supabase_rows)} upserted, {len(deleted_ids)} deleted")
+
+        except Exception as e:
+            logger.error(f"Error syncing routine batch to Supabase: {e}")
+            # Continue even if Supabase sync fails
+
+        return results
+
+    def sync_routine_copy(self, source_start, source_end, target_start,
+                          categories: Optional[List[str]] = None, skip_existing: bool = True) -> Dict[str, Any]:
+        """Clone every routine dated source_start..source_end (inclusive) to target_start onwards
+
+        A single INSERT ... SELECT shifts the dates by the offset between the two ranges;
+        copies start as 'upcoming' without media. With skip_existing, a routine is not
+        copied when the target day already has one with the same activity and start time.
+        Supabase receives the copies in one bulk insert, whatever their number.
+        """
+        offset = (target_start - source_start).days
+        columns = ', '.join(SUPABASE_ROUTINE_COLUMNS)
+
+        conditions = ["date BETWEEN %(source_start)s AND %(source_end)s"]
+        params: Dict[str, Any] = {'source_start': source_start, 'source_end': source_end, 'offset': offset}
+        if categories:
+            conditions.append("category = ANY(%(categories)s)")
+            params['categories'] = list(categories)
+        conflict = """
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM routine existing
+                        WHERE existing.date = source.date + %(offset)s
+                          AND existing.time_start = source.time_start
+                          AND existing.activity = source.activity
+                    )""" if skip_existing else ""
+
+        try:
+            # 1. PostgreSQL: one statement reads the source range and writes the copies
+            with self.get_postgres_connection() as pg_conn:
+                cursor = pg_conn.cursor()
+                cursor.execute(f"""
+                    WITH source AS (
+                        SELECT activity, category, date, time_start, time_end, description, location
+                        FROM routine
+                        WHERE {' AND '.join(conditions)}
+                    ), copied AS (
+                        INSERT INTO routine (
+                            id, activity, category, date, time_start, time_end, description, location,
+                            status, has_images, has_videos, created_at, updated_at
+                        )
+                        SELECT gen_random_uuid(), activity, category, date + %(offset)s, time_start, time_end,
+                               description, location, 'upcoming', FALSE, FALSE, NOW(), NOW()
+                        FROM source{conflict}
+                        RETURNING {columns}
+                    )
+                    SELECT (SELECT COUNT(*) FROM source), copied.*
+                    FROM (SELECT 1) AS one LEFT JOIN copied ON TRUE
+                """, params)
+                rows = cursor.fetchall()
+                pg_conn.commit()
+
+            matched = rows[0][0]
+            copied = [dict(zip(SUPABASE_ROUTINE_COLUMNS, row[1:])) for row in rows if row[1] is not None]
+            logger.info(f"Routines copied in PostgreSQL: {len(copied)}/{matched} ({offset:+d} days)")
+            if copied:
+                admin_events.publish('routine', {'action': 'batch', 'ids': [str(row['id']) for row in copied]})
+
+        except Exception as e:
+            logger.error(f"Error copying routines: {e}")
+            raise
+
+        # 2. Supabase: one bulk insert
+        try:
+            if copied:
+                self.supabase.table('routine').insert([self._supabase_routine_row(row) for row in copied]).execute()
+                logger.info(f"Routine copies synced to Supabase: {len(copied)}")
+
+        except Exception as e:
+            logger.error(f"Error syncing routine copies to Supabase: {e}")
+            # Continue even if Supabase sync fails
+
+        return {
+            'copied': len(copied),
+            'skipped': matched - len(copied),
+            'offset_days': offset,
+            'ids': [str(row['id']) for row in copied]
+        }
+
+    @staticmethod
+    def _supabase_routine_row(values: Dict[str, Any]) -> Dict[str, Any]:
+        """Routine row as stored in Supabase, from SUPABASE_ROUTINE_COLUMNS values"""
+        row = dict(values)
+        row['id'] = str(row['id'])
+        row['date'] = row['date'].isoformat() if row['date'] else None
+        for key in ('time_start', 'time_end'):
+            row[key] = row[key].strftime('%H:%M:%S') if row[key] else None
+        return row
+
 # Global instance
 dual_sync = DualDatabaseSync()
\ No newline at end of file
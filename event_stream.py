@@ -0,0 +1,329 @@
+"""
+Event Stream - Difusão de eventos para Server-Sent Events (SSE)
+Cada evento recebe um número de sequência; clientes retomam a partir do último recebido.
+Com a tabela event_log (add_event_log.py), os eventos passam pelo PostgreSQL e chegam a todos
+os processos/workers (LISTEN/NOTIFY, com consulta periódica de reserva); sem ela, ficam no processo
+"""
+
+import os
+import json
+import time
+import select
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Generator, Callable
+
+logger = logging.getLogger(__name__)
+
+# Tempo máximo de uma conexão SSE: o cliente (EventSource) reconecta com Last-Event-ID,
+# então nenhuma thread do servidor fica presa por uma aba aberta indefinidamente
+STREAM_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', '300'))
+EVENT_LOG_POLL_SECONDS = 5.0  # Reserva caso uma notificação se perca
+EVENT_LOG_RETENTION = '1 day'
+EVENT_LOG_NOTIFY_CHANNEL = 'event_log'
+
+
+class EventLog:
+    """Log de eventos compartilhado entre processos (tabela event_log no PostgreSQL)
+
+    publish grava o evento sob um advisory lock de transação, então a ordem das sequências
+    é a ordem de commit e a leitura por `seq > cursor` nunca pula um evento. Um thread por
+    processo escuta NOTIFY e entrega os eventos novos aos difusores registrados.
+    """
+
+    def __init__(self):
+        self._broadcasters: Dict[str, 'EventBroadcaster'] = {}
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._available: Optional[bool] = None
+        self._listener: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+    def available(self) -> bool:
+        """True quando DATABASE_URL aponta para um PostgreSQL com a tabela event_log"""
+        if self._available is None:
+            with self._lock:
+                if self._available is None:
+                    self._available = self._probe()
+        return self._available
+
+    def _probe(self) -> bool:
+        if os.getenv('EVENT_LOG', 'postgres') != 'postgres':
+            return False
+        url = os.environ.get('DATABASE_URL', '')
+        if not url.startswith('postgres'):
+            return False
+        try:
+            from dual_database_sync import dual_sync
+            with dual_sync.get_postgres_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT to_regclass('event_log') IS NOT NULL")
+                found = cursor.fetchone()[0]
+            if not found:
+                logger.warning("event_log table missing (run add_event_log.py): events stay in this process")
+            return found
+        except Exception as e:
+            logger.warning(f"Event log unavailable, events stay in this process: {e}")
+            return False
+
+    def register(self, broadcaster: 'EventBroadcaster') -> None:
+        """Carrega o histórico recente do canal e passa a entregar seus eventos novos"""
+        from dual_database_sync import dual_sync
+
+        with dual_sync.get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT seq, event_type, data FROM event_log
+                WHERE channel = %s ORDER BY seq DESC LIMIT %s
+            """, (broadcaster.channel, broadcaster.history))
+            rows = cursor.fetchall()
+            cursor.execute("SELECT COALESCE(max(seq), 0) FROM event_log")
+            head = cursor.fetchone()[0]
+        broadcaster._load([{'seq': seq, 'type': event_type, 'data': data}
+                           for seq, event_type, data in reversed(rows)], head)
+
+        with self._lock:
+            self._broadcasters[broadcaster.channel] = broadcaster
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen_loop, daemon=True, name='event-log-listener')
+                self._listener.start()
+
+    def append(self, channel: str, event_type: str, data: Dict[str, Any]) -> int:
+        from dual_database_sync import dual_sync
+
+        with dual_sync.get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            # Serializes publishers until commit: sequence order == commit order
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('event_log'))")
+            cursor.execute("""
+                INSERT INTO event_log (channel, event_type, data)
+                VALUES (%s, %s, %s::jsonb) RETURNING seq
+            """, (channel, event_type, json.dumps(data, default=str)))
+            seq = cursor.fetchone()[0]
+            cursor.execute("SELECT pg_notify(%s, %s)", (EVENT_LOG_NOTIFY_CHANNEL, channel))
+            conn.commit()
+        return seq
+
+    def fetch(self) -> None:
+        """Entrega aos difusores registrados os eventos gravados depois do que já receberam"""
+        from dual_database_sync import dual_sync
+
+        with self._fetch_lock:
+            with self._lock:
+                broadcasters = dict(self._broadcasters)
+            if not broadcasters:
+                return
+            cursor_seq = min(broadcaster.last_seq for broadcaster in broadcasters.values())
+            with dual_sync.get_postgres_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT channel, seq, event_type, data FROM event_log
+                    WHERE seq > %s AND channel = ANY(%s)
+                    ORDER BY seq
+                """, (cursor_seq, list(broadcasters)))
+                rows = cursor.fetchall()
+            for channel, seq, event_type, data in rows:
+                broadcasters[channel]._deliver(seq, event_type, data)
+
+    def _prune(self) -> None:
+        from dual_database_sync import dual_sync
+
+        if time.monotonic() - self._last_prune < 600:
+            return
+        self._last_prune = time.monotonic()
+        with dual_sync.get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM event_log WHERE created_at < NOW() - INTERVAL '{EVENT_LOG_RETENTION}'")
+            conn.commit()
+
+    def _listen_loop(self) -> None:
+        import psycopg2
+
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(os.environ['DATABASE_URL'])
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {EVENT_LOG_NOTIFY_CHANNEL}")
+                while True:
+                    self.fetch()
+                    self._prune()
+                    if select.select([conn], [], [], EVENT_LOG_POLL_SECONDS)[0]:
+                        conn.poll()
+                        conn.notifies.clear()
+            except Exception as e:
+                logger.error(f"Event log listener error: {e}")
+                time.sleep(EVENT_LOG_POLL_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+event_log = EventLog()
+
+
+class EventBroadcaster:
+    def __init__(self, history: int = 500, channel: Optional[str] = None):
+        """Inicializa o difusor com um histórico limitado de eventos recentes
+
+        Com `channel`, os eventos são compartilhados entre processos pelo event_log
+        (quando disponível); sem ele, ficam só neste processo.
+        """
+        self.history = history
+        self.channel = channel
+        self._events = deque(maxlen=history)
+        self._seq = 0
+        self._floor = 0  # Todos os eventos com seq > _floor estão no histórico
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._shared: Optional[bool] = None
+        self._setup_lock = threading.Lock()
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def connect(self) -> bool:
+        """Passa a receber os eventos dos outros processos; True se o event_log está em uso
+
+        Chamado no primeiro publish/stream ou na inicialização da aplicação (para os ouvintes
+        de subscribe), nunca na importação do módulo.
+        """
+        return self._is_shared()
+
+    def _is_shared(self) -> bool:
+        if self._shared is None:
+            with self._setup_lock:
+                if self._shared is None:
+                    shared = False
+                    if self.channel and event_log.available():
+                        try:
+                            event_log.register(self)
+                            shared = True
+                        except Exception as e:
+                            logger.error(f"Could not register event channel '{self.channel}': {e}")
+                    self._shared = shared
+        return self._shared
+
+    def _load(self, events: List[Dict[str, Any]], head: int) -> None:
+        with self._cond:
+            self._events.extend(events)
+            self._seq = max(head, self._seq)
+            self._floor = events[0]['seq'] - 1 if events else self._seq
+
+    def subscribe(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Registra uma função chamada a cada evento entregue (inclusive os de outros processos)"""
+        self._listeners.append(listener)
+
+    def _deliver(self, seq: Optional[int], event_type: str, data: Dict[str, Any]) -> int:
+        """Guarda o evento e acorda os clientes; seq None numera o evento neste processo"""
+        with self._cond:
+            if seq is None:
+                seq = self._seq + 1
+            elif seq <= self._seq:
+                return seq  # Já entregue (o NOTIFY e a leitura após publish se sobrepõem)
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0]['seq']
+            self._events.append({'seq': seq, 'type': event_type, 'data': data})
+            self._seq = seq
+            self._cond.notify_all()
+
+        self._notify_listeners(event_type, data)
+        return seq
+
+    def _notify_listeners(self, event_type: str, data: Dict[str, Any]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event_type, data)
+            except Exception as e:
+                logger.error(f"Error in event listener for '{event_type}': {e}")
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Optional[int]:
+        """Publica um evento, acorda todos os clientes em espera e avisa os ouvintes"""
+        if self._is_shared():
+            try:
+                seq = event_log.append(self.channel, event_type, data)
+                event_log.fetch()  # Entrega já neste processo, sem esperar o NOTIFY
+                return seq
+            except Exception as e:
+                # Os clientes SSE recebem o estado na próxima sincronização; os ouvintes locais, já
+                logger.error(f"Could not publish '{event_type}' to the event log: {e}")
+                self._notify_listeners(event_type, data)
+                return None
+
+        return self._deliver(None, event_type, data)
+
+    def events_since(self, last_seq: int) -> List[Dict[str, Any]]:
+        """Retorna os eventos com sequência maior que last_seq ainda no histórico"""
+        self._is_shared()
+        with self._cond:
+            return [event for event in self._events if event['seq'] > last_seq]
+
+    def missed_events(self, last_seq: int) -> bool:
+        """Indica se há eventos após last_seq que não estão mais no histórico"""
+        self._is_shared()
+        with self._cond:
+            return last_seq > self._seq or last_seq < self._floor
+
+    def wait(self, last_seq: int, timeout: float) -> List[Dict[str, Any]]:
+        """Aguarda até haver eventos novos após last_seq ou até o timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > last_seq, timeout=timeout)
+            return [event for event in self._events if event['seq'] > last_seq]
+
+    def stream(self, last_seq: Optional[int] = None, heartbeat: float = 15.0,
+               initial: Optional[List[Dict[str, Any]]] = None,
+               max_duration: float = STREAM_MAX_SECONDS) -> Generator[str, None, None]:
+        """Gera o corpo de uma resposta text/event-stream
+
+        Sem last_seq, o cliente recebe apenas eventos novos (mais os eventos de `initial`,
+        usados para enviar o estado atual na conexão). Com last_seq (Last-Event-ID), os
+        eventos perdidos são reenviados ou, se já saíram do histórico, um evento `resync`.
+        A resposta termina após max_duration segundos; o EventSource reconecta sozinho.
+        """
+        if self._is_shared() and last_seq is not None and last_seq > self._seq:
+            # Client comes from another worker that is ahead of this one: catch up first
+            try:
+                event_log.fetch()
+            except Exception as e:
+                logger.error(f"Could not read the event log: {e}")
+        deadline = time.monotonic() + max_duration
+        yield "retry: 3000\n\n"
+
+        if last_seq is None:
+            last_seq = self._seq
+        elif self.missed_events(last_seq):
+            # Cliente perdeu eventos (histórico esgotado ou servidor reiniciado): recarga completa
+            last_seq = self._seq
+            yield format_sse({'seq': last_seq, 'type': 'resync', 'data': {}})
+
+        for event in initial or []:
+            yield format_sse(event)
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = self.wait(last_seq, min(heartbeat, remaining))
+            if not events:
+                # Comentário SSE mantém a conexão viva através de proxies
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                last_seq = event['seq']
+                yield format_sse(event)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Formata um evento no protocolo SSE"""
+    lines = []
+    if event.get('seq'):
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+# Instância global para o painel administrativo (rotinas, mídias, memórias, imagens e conversas)
+admin_events = EventBroadcaster(history=1000, channel='admin')
@@ -0,0 +1,17 @@
+"""
+Configuração do Gunicorn
+Workers com threads (gthread): as conexões SSE (/admin/api/events, /whatsapp/api/events)
+ocupam uma thread cada por até SSE_MAX_SECONDS, sem bloquear as demais requisições.
+Os eventos chegam a todos os workers pela tabela event_log (event_stream.py)
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+# gthread workers heartbeat from their main loop, so a long SSE response does not trip this timeout
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
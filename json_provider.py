@@ -0,0 +1,65 @@
+"""
+JSON Provider - Serialização JSON das respostas Flask via orjson, com fallback
+Registrado em app.json; sem orjson instalado, o provider padrão do Flask é usado
+"""
+
+import logging
+from typing import Any
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Declared in pyproject.toml; falls back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Dates go through Flask's own default (HTTP date format), so payloads decode to the
+# same values as with DefaultJSONProvider (orjson writes UTF-8 instead of \u escapes)
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+class OrjsonJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding/decoding
+
+    Keeps Flask's semantics: `sort_keys`, `compact` (pretty-printed in debug),
+    `mimetype` and the `default` hook. Calls with extra json.dumps keyword
+    arguments fall back to the stdlib implementation.
+    """
+
+    def _options(self, pretty: bool) -> int:
+        options = ORJSON_OPTIONS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options(False)).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(pretty))
+        if pretty:
+            body += b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json_provider(app) -> None:
+    """Install the orjson provider on the app when orjson is available"""
+    if orjson is None:
+        logger.info("orjson not installed; using Flask's default JSON provider")
+        return
+    app.json_provider_class = OrjsonJSONProvider
+    app.json = OrjsonJSONProvider(app)
+    logger.info("orjson JSON provider enabled")
+
@@ -0,0 +1,228 @@
+"""
+Knowledge Index - Índice invertido em memória (BM25) das memórias e do banco de imagens da Anna
+Tokens em minúsculas e sem acentos (português); o índice é carregado do Supabase na primeira busca
+e atualizado incrementalmente pelos eventos do admin, então uma busca não sai do processo
+"""
+
+import re
+import math
+import time
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+from event_stream import admin_events
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TABLE = 'memories'
+IMAGE_TABLE = 'image_bank'
+REFRESH_INTERVAL = 300  # Full reload, for writes made by other workers
+MAX_PREFIX_EXPANSION = 30
+
+# Field -> weight (BM25F-style: weighted term frequencies, one length per document)
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'keywords': 2.5,
+    'when_to_use': 2.0,
+    'description': 1.5,
+    'content': 1.0
+}
+# Older rows use the names of supabase_complete_schema.sql
+FIELD_ALIASES = {'name': 'title', 'keywords': 'tags'}
+
+STOPWORDS = frozenset("""
+    a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas
+    para pra com sem que e ou se ao aos como mais mas foi ser sao esta este isso isto ela ele
+    me te lhe nos voce eu tu meu minha seu sua the and of
+""".split())
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents ("Manhã" -> "manha")"""
+    return unicodedata.normalize('NFD', text or '').encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r'[a-z0-9]+', fold(text))
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def field_text(row: Dict[str, Any], field: str) -> str:
+    value = row.get(field)
+    if value is None and field in FIELD_ALIASES:
+        value = row.get(FIELD_ALIASES[field])
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(item) for item in value)
+    return str(value) if value is not None else ''
+
+
+class BM25Index:
+    """Inverted index with BM25 ranking; documents are keyed by (kind, id)"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Tuple[str, Any], float]] = defaultdict(dict)
+        self._docs: Dict[Tuple[str, Any], Tuple[float, Dict[str, Any], List[str]]] = {}
+        self._total_length = 0.0
+        self._vocabulary: Optional[List[str]] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def upsert(self, kind: str, doc_id, row: Dict[str, Any]) -> None:
+        """Index (or re-index) one row"""
+        key = (kind, doc_id)
+        frequencies: Dict[str, float] = defaultdict(float)
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(field_text(row, field)):
+                frequencies[token] += weight
+                length += weight
+
+        with self._lock:
+            self._remove(key)
+            for token, frequency in frequencies.items():
+                if token not in self._postings:
+                    self._vocabulary = None
+                self._postings[token][key] = frequency
+            self._docs[key] = (length, row, list(frequencies))
+            self._total_length += length
+
+    def remove(self, kind: str, doc_id) -> None:
+        with self._lock:
+            self._remove((kind, doc_id))
+
+    def _remove(self, key) -> None:
+        document = self._docs.pop(key, None)
+        if document is None:
+            return
+        length, _row, tokens = document
+        self._total_length -= length
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary = None
+
+    def _expand(self, term: str) -> List[str]:
+        """The term itself when indexed, otherwise indexed words starting with it ("corr" -> "corrida")"""
+        if term in self._postings:
+            return [term]
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        position = bisect_left(self._vocabulary, term)
+        expanded = []
+        while (position < len(self._vocabulary) and len(expanded) < MAX_PREFIX_EXPANSION
+               and self._vocabulary[position].startswith(term)):
+            expanded.append(self._vocabulary[position])
+            position += 1
+        return expanded
+
+    def search(self, query: str, limit: int = 10, kind: Optional[str] = None) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """Best matches first, as (score, kind, row); only documents matching some query term"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            count = len(self._docs)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[Tuple[str, Any], float] = defaultdict(float)
+
+            for term in dict.fromkeys(terms):
+                best: Dict[Tuple[str, Any], float] = {}
+                for word in self._expand(term):
+                    postings = self._postings[word]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, frequency in postings.items():
+                        if kind and key[0] != kind:
+                            continue
+                        length = self._docs[key][0]
+                        score = idf * frequency * (self.k1 + 1) / (
+                            frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+                        if score > best.get(key, 0.0):
+                            best[key] = score
+                # An expanded prefix counts once per document, with its best word
+                for key, score in best.items():
+                    scores[key] += score
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [(score, key[0], self._docs[key][1]) for key, score in ranked]
+
+
+class KnowledgeIndex:
+    """BM25 index of active memories and image bank entries, kept in sync with admin writes"""
+
+    def __init__(self):
+        self._index = BM25Index()
+        self._loaded_at: Optional[float] = None
+        self._reload_lock = threading.Lock()
+
+    def _fetch(self) -> BM25Index:
+        from supabase_tools import supabase
+
+        index = BM25Index()
+        for kind, table in (('memory', MEMORY_TABLE), ('image', IMAGE_TABLE)):
+            rows = supabase.table(table).select('*').eq('is_active', True).execute().data or []
+            for row in rows:
+                index.upsert(kind, row.get('id'), row)
+        return index
+
+    def reload(self) -> None:
+        """Rebuild from the database and swap the new index in"""
+        with self._reload_lock:
+            started = time.perf_counter()
+            index = self._fetch()
+            self._index = index
+            self._loaded_at = time.monotonic()
+            logger.info(f"Knowledge index loaded: {len(index)} documents in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _refresh_in_background(self) -> None:
+        if self._reload_lock.locked():
+            return
+
+        def run():
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error refreshing knowledge index: {e}")
+
+        threading.Thread(target=run, name='knowledge-index-refresh', daemon=True).start()
+
+    def ensure_loaded(self) -> None:
+        """Load on first use; later, stale indexes are refreshed without blocking searches"""
+        if self._loaded_at is None:
+            self.reload()
+        elif time.monotonic() - self._loaded_at > REFRESH_INTERVAL:
+            self._loaded_at = time.monotonic()  # One refresh at a time
+            self._refresh_in_background()
+
+    def search(self, query: str, limit: int = 10, kind: Optional[str] = None) -> List[Tuple[float, str, Dict[str, Any]]]:
+        self.ensure_loaded()
+        return self._index.search(query, limit=limit, kind=kind)
+
+    def apply_event(self, event_type: str, data: Dict[str, Any]) -> None:
+        """admin_events listener: memory/image events carry the written row, deletes only the id"""
+        if self._loaded_at is None or event_type not in ('memory', 'image'):
+            return
+
+        row = data.get(event_type)
+        doc_id = row.get('id', data.get('id')) if row else data.get('id')
+        if data.get('action') == 'deleted' or (row is not None and row.get('is_active') is False):
+            self._index.remove(event_type, doc_id)
+        elif row is not None:
+            self._index.upsert(event_type, doc_id, row)
+
+
+# Global instance; admin writes in this process update it as they are published
+knowledge_index = KnowledgeIndex()
+admin_events.subscribe(knowledge_index.apply_event)
@@ -0,0 +1,187 @@
+"""
+Media Derivatives - Miniaturas e prévias WebP das imagens (mídias das atividades e banco de imagens)
+O redimensionamento roda num pool de processos, fora da requisição, e as URLs geradas ficam na
+mesma linha do original (thumbnail_url / preview_url). Sem Pillow instalado, os originais são usados
+"""
+
+import io
+import os
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+from media_upload import MEDIA_BUCKET, CHUNK_SIZE, object_name
+from event_stream import admin_events
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Declared in pyproject.toml; a bare install still serves the originals
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+if Image is None:
+    logger.warning("Pillow is not installed: images are served without WebP thumbnails/previews")
+
+# Variant name -> (column, longest side in pixels), smallest first
+VARIANTS = {
+    'thumbnail': ('thumbnail_url', 320),
+    'preview': ('preview_url', 1280)
+}
+WEBP_QUALITY = 80
+CHAT_IMAGE_SIZE = 1024  # Longest side wanted when the agent shows an image in a conversation
+DERIVATIVE_PREFIX = 'derivatives'
+DERIVATIVE_WORKERS = int(os.getenv('DERIVATIVE_WORKERS', '2'))
+MAX_SOURCE_SIZE = 50 * 1024 * 1024  # Images downloaded from a URL (image bank)
+
+# Threads wait on storage and the database; the resizing itself goes to the process pool
+_jobs = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS, thread_name_prefix='media-derivatives')
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def _get_renderer() -> ProcessPoolExecutor:
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            # spawn: the web worker runs threads, so forking it is not safe
+            _renderer = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _renderer
+
+
+def render_variants(path: str) -> Dict[str, bytes]:
+    """Resize an image file to every variant and encode each one as WebP
+
+    Runs in the process pool. Variants are produced from the largest down, each one from
+    the previous, and JPEGs are decoded at reduced scale (draft) when they are much larger
+    than the biggest variant. Images are never upscaled.
+    """
+    sizes = sorted(VARIANTS.items(), key=lambda item: item[1][1], reverse=True)
+    largest = sizes[0][1][1]
+
+    with Image.open(path) as source:
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'PA', 'P') else 'RGB')
+
+        rendered = {}
+        for name, (_, size) in sizes:
+            image.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+            rendered[name] = buffer.getvalue()
+    return rendered
+
+
+def derivative_objects(row: Dict[str, Any]) -> List[str]:
+    """Bucket objects holding the derivatives of a media or image bank row"""
+    names = (object_name(row.get(column)) for column, _ in VARIANTS.values())
+    return [name for name in names if name]
+
+
+def smallest_variant(row: Dict[str, Any], min_size: int) -> Optional[str]:
+    """URL of the smallest derivative at least min_size pixels on its longest side
+
+    Falls back to the original (media_url or image_url) when no such derivative exists yet.
+    """
+    for column, size in VARIANTS.values():
+        if size >= min_size and row.get(column):
+            return row[column]
+    return row.get('media_url') or row.get('image_url')
+
+
+def _stage(path: str) -> str:
+    """Give the job its own name for the caller's file, so the caller can delete it right away"""
+    fd, job_path = tempfile.mkstemp(prefix='derivative-')
+    os.close(fd)
+    os.unlink(job_path)
+    try:
+        os.link(path, job_path)
+    except OSError:
+        shutil.copyfile(path, job_path)
+    return job_path
+
+
+def _download(url: str) -> str:
+    import requests
+
+    with requests.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        with tempfile.NamedTemporaryFile(prefix='derivative-', delete=False) as target:
+            size = 0
+            for block in response.iter_content(CHUNK_SIZE):
+                size += len(block)
+                if size > MAX_SOURCE_SIZE:
+                    target.close()
+                    os.unlink(target.name)
+                    raise IOError(f"Image larger than {MAX_SOURCE_SIZE} bytes")
+                target.write(block)
+    return target.name
+
+
+def _generate(table: str, row_id, path: Optional[str], url: Optional[str],
+              channel: str, event: Dict[str, Any]) -> None:
+    from supabase_tools import supabase
+
+    try:
+        if path is None:
+            path = _download(url)
+        rendered = _get_renderer().submit(render_variants, path).result()
+
+        bucket = supabase.storage.from_(MEDIA_BUCKET)
+        stem = uuid.uuid4()
+        urls = {}
+        for name, data in rendered.items():
+            name_in_bucket = f"{DERIVATIVE_PREFIX}/{stem}-{name}.webp"
+            bucket.upload(name_in_bucket, data, {'content-type': 'image/webp', 'upsert': 'true'})
+            urls[VARIANTS[name][0]] = bucket.get_public_url(name_in_bucket)
+
+        columns = ', '.join(column for column, _ in VARIANTS.values())
+        previous = supabase.table(table).select(columns).eq('id', row_id).execute().data
+        response = supabase.table(table).update(urls).eq('id', row_id).execute()
+
+        # Derivatives of an earlier original (image URL changed) are no longer referenced
+        stale = [name for name in derivative_objects(previous[0]) if name not in derivative_objects(urls)] if previous else []
+        if stale:
+            bucket.remove(stale)
+
+        row = response.data[0] if response.data else None
+        logger.info(f"Generated {len(rendered)} derivatives for {table} {row_id}")
+        payload = {**event, 'id': row_id, **urls}
+        if channel == 'image':
+            payload['image'] = row
+        admin_events.publish(channel, payload)
+
+    except Exception as e:
+        logger.error(f"Error generating derivatives for {table} {row_id}: {e}")
+    finally:
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def schedule_derivatives(table: str, row_id, path: Optional[str] = None, url: Optional[str] = None,
+                         channel: str = 'media', event: Optional[Dict[str, Any]] = None) -> bool:
+    """Queue WebP derivatives for an image row; returns False when Pillow is unavailable
+
+    The source is a local file (path, preferred) or the original's URL. When done, the row's
+    variant columns are updated and an admin event is published on channel.
+    """
+    if Image is None:
+        return False
+    if path and not os.path.exists(path):
+        path = None
+    if not path and not url:
+        return False
+
+    _jobs.submit(_generate, table, row_id, _stage(path) if path else None, url, channel,
+                 {'action': 'derivatives', **(event or {})})
+    return True
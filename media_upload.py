@@ -0,0 +1,400 @@
+"""
+Media Upload - Pipeline de upload das mídias das atividades para o Supabase Storage
+Cada arquivo é gravado em disco em blocos (memória constante mesmo para vídeos grandes),
+os envios rodam em paralelo num pool limitado e as linhas de mídia entram num único insert.
+Os objetos são endereçados pelo SHA-256 do conteúdo: um arquivo repetido reaproveita o objeto
+já armazenado (tabela media_objects, com contagem de referências)
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from event_stream import admin_events
+
+logger = logging.getLogger(__name__)
+
+MEDIA_BUCKET = 'conteudo'
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_WORKERS = int(os.getenv('MEDIA_UPLOAD_WORKERS', '4'))
+# Full recount of the routines' media counts, in seconds (0 disables it)
+MEDIA_RECONCILE_INTERVAL = int(os.getenv('MEDIA_RECONCILE_INTERVAL', '3600'))
+MEDIA_PAGE_SIZE = 1000
+
+
+def object_name(url: Optional[str]) -> Optional[str]:
+    """Object path inside MEDIA_BUCKET for one of its public URLs"""
+    if not url or f"/{MEDIA_BUCKET}/" not in url:
+        return None
+    return url.split(f"/{MEDIA_BUCKET}/", 1)[1].split('?')[0]
+
+
+def spool_upload(file) -> Dict[str, Any]:
+    """Copy an uploaded file (werkzeug FileStorage) to a temporary file, hashing it on the way
+
+    The file is read CHUNK_SIZE at a time; its SHA-256 names the object in the bucket.
+    """
+    extension = os.path.splitext(file.filename)[1].lower()
+    content_type = file.content_type or 'application/octet-stream'
+    digest = hashlib.sha256()
+
+    with tempfile.NamedTemporaryFile(prefix='media-', suffix=extension, delete=False) as spool:
+        while True:
+            block = file.stream.read(CHUNK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            spool.write(block)
+
+    content_hash = digest.hexdigest()
+    return {
+        'path': spool.name,
+        'filename': file.filename,
+        'object_name': f"{content_hash}{extension}",
+        'sha256': content_hash,
+        'content_type': content_type,
+        'media_type': 'video' if content_type.startswith('video/') else 'image',
+        'size': os.path.getsize(spool.name)
+    }
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file on disk, read CHUNK_SIZE at a time"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def claim_object(content_hash: str, name: str, content_type: str, size: int) -> Tuple[str, bool]:
+    """Take a reference on the stored object for content_hash
+
+    Returns the object's name and whether its content is known to be in the bucket. An
+    entry is only marked stored (mark_stored) once an upload of it finished, so a caller
+    that gets False uploads the file itself, even when another upload of the same content
+    is still running: the name is content-addressed, so both write the same bytes.
+    """
+    from dual_database_sync import dual_sync
+
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO media_objects (content_hash, object_name, content_type, size, ref_count, stored)
+            VALUES (%s, %s, %s, %s, 1, FALSE)
+            ON CONFLICT (content_hash) DO UPDATE SET ref_count = media_objects.ref_count + 1
+            RETURNING object_name, stored
+        """, (content_hash, name, content_type, size))
+        stored_name, stored = cursor.fetchone()
+        conn.commit()
+    return stored_name, stored
+
+
+def mark_stored(name: str) -> None:
+    """Record that an indexed object's content is in the bucket, so later claims reuse it"""
+    from dual_database_sync import dual_sync
+
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE media_objects SET stored = TRUE WHERE object_name = %s AND NOT stored", (name,))
+        conn.commit()
+
+
+def retain_object(name: Optional[str]) -> bool:
+    """Add a reference to an indexed object (a new row pointing at its URL); False if not indexed"""
+    from dual_database_sync import dual_sync
+
+    if not name:
+        return False
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE media_objects SET ref_count = ref_count + 1 WHERE object_name = %s", (name,))
+        retained = cursor.rowcount > 0
+        conn.commit()
+    return retained
+
+
+def release_object(supabase, name: Optional[str]) -> Optional[bool]:
+    """Drop one reference to an indexed object; the last one removes it from the bucket
+
+    Returns None when the object is not in the index (stored before deduplication, or
+    not ours), True when it was removed and False while other rows still use it. The
+    removal happens with the index row locked, so an upload of the same content waits
+    and then stores it again instead of reusing an object on its way out.
+    """
+    from dual_database_sync import dual_sync
+
+    if not name:
+        return None
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ref_count FROM media_objects WHERE object_name = %s FOR UPDATE", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        if row[0] > 1:
+            cursor.execute("UPDATE media_objects SET ref_count = ref_count - 1 WHERE object_name = %s", (name,))
+            conn.commit()
+            return False
+
+        supabase.storage.from_(MEDIA_BUCKET).remove([name])
+        cursor.execute("DELETE FROM media_objects WHERE object_name = %s", (name,))
+        conn.commit()
+    logger.info(f"Removed media object {name} (last reference)")
+    return True
+
+
+def discard_object(supabase, name: Optional[str]) -> None:
+    """Give back a reference taken for a row that will not exist after all"""
+    try:
+        if release_object(supabase, name) is None and name:
+            supabase.storage.from_(MEDIA_BUCKET).remove([name])
+    except Exception as e:
+        logger.error(f"Error discarding media object {name}: {e}")
+
+
+def upload_spooled(supabase, spooled: Dict[str, Any]) -> Dict[str, Any]:
+    """Stream one spooled file to the bucket, unless the same content is already stored
+
+    Files with a sha256 take a reference in media_objects first; when the content is
+    already stored its object is reused and nothing is uploaded ('reused': True).
+    Otherwise the open file handle is sent in chunks by httpx.
+    """
+    try:
+        bucket = supabase.storage.from_(MEDIA_BUCKET)
+        name, stored, indexed = spooled['object_name'], False, False
+        if spooled.get('sha256'):
+            try:
+                name, stored = claim_object(spooled['sha256'], name, spooled['content_type'], spooled['size'])
+                indexed = True
+            except Exception as e:
+                logger.warning(f"Media index unavailable, uploading {name} without deduplication: {e}")
+
+        if not stored:
+            try:
+                with open(spooled['path'], 'rb') as handle:
+                    # Content-addressed names: overwriting means writing the same bytes
+                    bucket.upload(name, handle, {'content-type': spooled['content_type'], 'upsert': 'true'})
+            except Exception:
+                discard_object(supabase, name)
+                raise
+            if indexed:
+                try:
+                    mark_stored(name)
+                except Exception as e:
+                    # The next upload of this content just stores it again
+                    logger.warning(f"Could not mark media object {name} as stored: {e}")
+        return {**spooled, 'object_name': name, 'url': bucket.get_public_url(name), 'reused': stored}
+    except Exception as e:
+        logger.error(f"Error uploading file {spooled['filename']}: {e}")
+        return {**spooled, 'error': str(e)}
+
+
+def upload_routine_media(files, routine_id: str, description: Optional[str] = None) -> Dict[str, Any]:
+    """Upload files for a routine and record them
+
+    Files are uploaded concurrently (at most UPLOAD_WORKERS at a time), so a batch takes
+    about as long as its largest file; successful ones are recorded with record_uploads.
+    Returns the inserted media rows and the per-file errors.
+    """
+    from supabase_tools import supabase
+
+    spooled = []
+    try:
+        for file in files:
+            if file and file.filename:
+                spooled.append(spool_upload(file))
+        if not spooled:
+            return {'media': [], 'errors': []}
+
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(spooled))) as pool:
+            results = list(pool.map(lambda item: upload_spooled(supabase, item), spooled))
+
+        # Recorded before the spooled files go away: image derivatives are made from them
+        uploaded = [result for result in results if 'url' in result]
+        media = record_uploads(supabase, routine_id, uploaded, description)
+    finally:
+        for item in spooled:
+            try:
+                os.unlink(item['path'])
+            except OSError:
+                pass
+
+    errors = [{'filename': result['filename'], 'error': result['error']} for result in results if 'error' in result]
+    return {'media': media, 'errors': errors}
+
+
+def update_media_counts(supabase, routine_id: str, images: int = 0, videos: int = 0) -> None:
+    """Apply a change in a routine's number of images/videos after its media rows were written
+
+    Media rows live in Supabase anna_routine_media while every reader (calendar, list
+    view, agent tools) takes the counts from the local routine table, so no trigger or
+    transaction can span both (see add_media_counters.py). One UPDATE adjusts the local
+    counts and derives has_images/has_videos. When it fails the routine is recounted
+    from its media rows, and media_count_reconciler recounts every routine
+    periodically, so a write lost in between only drifts until the next pass. Never raises.
+    """
+    from dual_database_sync import dual_sync
+
+    try:
+        with dual_sync.get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE routine
+                SET image_count = GREATEST(image_count + %(images)s, 0),
+                    video_count = GREATEST(video_count + %(videos)s, 0),
+                    has_images = image_count + %(images)s > 0,
+                    has_videos = video_count + %(videos)s > 0,
+                    updated_at = NOW()
+                WHERE id = %(id)s
+            """, {'id': routine_id, 'images': images, 'videos': videos})
+            conn.commit()
+        return
+    except Exception as e:
+        logger.error(f"Error updating media counts of routine {routine_id}, recounting: {e}")
+
+    try:
+        reconcile_media_counts(supabase, [routine_id])
+    except Exception as e:
+        logger.error(f"Error recounting media of routine {routine_id}: {e}")
+
+
+def count_media(supabase, routine_ids: Optional[List[str]] = None) -> Counter:
+    """(routine_id, media_type) -> rows in Supabase anna_routine_media, read page by page"""
+    counts = Counter()
+    start = 0
+    while True:
+        query = supabase.table('anna_routine_media').select('routine_id, media_type')
+        if routine_ids is not None:
+            query = query.in_('routine_id', routine_ids)
+        rows = query.order('id').range(start, start + MEDIA_PAGE_SIZE - 1).execute().data or []
+        for row in rows:
+            try:
+                counts[(str(uuid.UUID(str(row['routine_id']))), row['media_type'])] += 1
+            except ValueError:
+                pass  # Not a routine of the local table (ids are UUIDs there)
+        if len(rows) < MEDIA_PAGE_SIZE:
+            return counts
+        start += MEDIA_PAGE_SIZE
+
+
+def write_media_counts(cursor, counts: Counter, routine_ids: Optional[List[str]] = None) -> int:
+    """Set the local counts and flags from count_media (of routine_ids, or of every routine)
+
+    Only rows whose counts differ are written; returns how many were.
+    """
+    counted = sorted({routine_id for routine_id, _ in counts})
+    cursor.execute("""
+        UPDATE routine r
+        SET image_count = COALESCE(c.images, 0),
+            video_count = COALESCE(c.videos, 0),
+            has_images = COALESCE(c.images, 0) > 0,
+            has_videos = COALESCE(c.videos, 0) > 0
+        FROM routine base
+        LEFT JOIN unnest(%(counted)s::uuid[], %(images)s::int[], %(videos)s::int[]) AS c(routine_id, images, videos)
+            ON c.routine_id = base.id
+        WHERE r.id = base.id
+          AND (%(ids)s::uuid[] IS NULL OR base.id = ANY(%(ids)s::uuid[]))
+          AND (r.image_count, r.video_count) IS DISTINCT FROM (COALESCE(c.images, 0), COALESCE(c.videos, 0))
+    """, {
+        'counted': counted,
+        'images': [counts[(routine_id, 'image')] for routine_id in counted],
+        'videos': [counts[(routine_id, 'video')] for routine_id in counted],
+        'ids': [str(routine_id) for routine_id in routine_ids] if routine_ids is not None else None
+    })
+    return cursor.rowcount
+
+
+def reconcile_media_counts(supabase, routine_ids: Optional[List[str]] = None) -> int:
+    """Recount media rows into the local routine table; returns how many routines were corrected"""
+    from dual_database_sync import dual_sync
+
+    counts = count_media(supabase, routine_ids)
+    with dual_sync.get_postgres_connection() as conn:
+        corrected = write_media_counts(conn.cursor(), counts, routine_ids)
+        conn.commit()
+    if corrected:
+        logger.info(f"Corrected media counts of {corrected} routine(s)")
+    return corrected
+
+
+class MediaCountReconciler:
+    """Background recount of every routine's media, catching count updates that were lost"""
+
+    def __init__(self, interval: int = MEDIA_RECONCILE_INTERVAL):
+        self.interval = interval
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def ensure_worker(self) -> None:
+        """Start the background thread (once per process)"""
+        if self.interval <= 0 or (self._worker and self._worker.is_alive()):
+            return
+        with self._lock:
+            if self._worker and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._loop, daemon=True, name='media-count-reconcile')
+            self._worker.start()
+
+    def _loop(self) -> None:
+        from supabase_tools import supabase
+
+        while True:
+            time.sleep(self.interval)
+            try:
+                reconcile_media_counts(supabase)
+            except Exception as e:
+                logger.error(f"Error reconciling media counts: {e}")
+
+
+media_count_reconciler = MediaCountReconciler()
+
+
+def record_uploads(supabase, routine_id: str, uploaded: List[Dict[str, Any]],
+                   description: Optional[str] = None, **event) -> List[Dict[str, Any]]:
+    """Insert anna_routine_media rows for uploaded files in one call
+
+    The routine's image/video counts and has_images/has_videos flags follow with
+    update_media_counts. Extra keyword arguments are added to the published 'media'
+    event. Images get WebP derivatives in the background, made from the local file
+    when it still exists.
+    """
+    if not uploaded:
+        return []
+
+    rows = [{
+        'routine_id': routine_id,
+        'media_url': result['url'],
+        'media_type': result['media_type'],
+        'description': description
+    } for result in uploaded]
+    try:
+        inserted = supabase.table('anna_routine_media').insert(rows).execute().data or rows
+    except Exception:
+        # Do not leave unreferenced objects behind in the bucket
+        for result in uploaded:
+            discard_object(supabase, result['object_name'])
+        raise
+
+    update_media_counts(supabase, routine_id,
+                        images=sum(1 for result in uploaded if result['media_type'] == 'image'),
+                        videos=sum(1 for result in uploaded if result['media_type'] == 'video'))
+
+    from media_derivatives import schedule_derivatives
+    for row, result in zip(inserted, uploaded):
+        if result['media_type'] == 'image' and row.get('id'):
+            schedule_derivatives('anna_routine_media', row['id'], path=result.get('path'),
+                                 url=result['url'], event={'routine_id': routine_id})
+
+    total_size = sum(result['size'] for result in uploaded)
+    reused = sum(1 for result in uploaded if result.get('reused'))
+    logger.info(f"Recorded {len(uploaded)} media files ({total_size} bytes, {reused} already stored) for routine {routine_id}")
+    admin_events.publish('media', {'action': 'created', 'routine_id': routine_id, **event})
+    return inserted
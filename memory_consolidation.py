@@ -0,0 +1,264 @@
+"""
+Memory Consolidation - Consolidação das memórias de conversa da Anna
+Os turnos de cada contato (uma linha por mensagem) são agrupados em janelas de tempo e resumidos
+numa única memória de longo prazo, sem repetições e com importância; as linhas originais são
+arquivadas e a importância com decaimento no tempo é recalculada a cada execução
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from knowledge_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+WINDOW = timedelta(hours=int(os.getenv('MEMORY_WINDOW_HOURS', '24')))
+SETTLE_TIME = timedelta(hours=1)  # A window is only folded once it closed this long ago
+HALF_LIFE_DAYS = float(os.getenv('MEMORY_HALF_LIFE_DAYS', '30'))
+CONSOLIDATION_INTERVAL = int(os.getenv('MEMORY_CONSOLIDATION_INTERVAL', '3600'))
+WINDOWS_PER_RUN = 200
+MAX_SUMMARY_TURNS = 12
+MAX_TURN_CHARS = 240
+MAX_TAGS = 8
+DUPLICATE_SIMILARITY = 0.8  # Jaccard similarity of two user messages' words
+DECAYING_TYPES = ['conversation', 'summary']  # Facts and experiences keep their importance
+LOCK_KEY = 'memory_consolidation'
+
+
+def _split_turn(content: str) -> Tuple[str, str]:
+    """("User: ...\\nAnna: ...") -> (user message, Anna's response)"""
+    user, _, anna = (content or '').partition('\nAnna: ')
+    if user.startswith('User: '):
+        user = user[len('User: '):]
+    return user.strip(), anna.strip()
+
+
+def _clip(text: str) -> str:
+    text = ' '.join(text.split())
+    return text if len(text) <= MAX_TURN_CHARS else text[:MAX_TURN_CHARS - 1].rstrip() + '…'
+
+
+def decay(importance: float, age: timedelta) -> float:
+    """Importance halved every HALF_LIFE_DAYS"""
+    days = max(age.total_seconds(), 0) / 86400
+    return round(importance * 0.5 ** (days / HALF_LIFE_DAYS), 2)
+
+
+def summarize(contact_id: str, rows: List[Tuple[int, str, Optional[int], datetime]]) -> Dict[str, Any]:
+    """Fold one window of conversation rows (id, content, importance, created_at) into a summary
+
+    Repeated questions (same words, up to DUPLICATE_SIMILARITY) count once. When more than
+    MAX_SUMMARY_TURNS distinct turns remain, the most important and longest are kept, in
+    their original order. Tags are the contact and the most frequent words.
+    """
+    kept: List[Dict[str, Any]] = []
+    words = Counter()
+    for position, (_, content, importance, _) in enumerate(rows):
+        user, anna = _split_turn(content)
+        tokens = set(tokenize(user))
+        words.update(token for token in tokenize(user) if len(token) > 3)
+
+        duplicate = next((turn for turn in kept if tokens and turn['tokens'] and
+                          len(tokens & turn['tokens']) / len(tokens | turn['tokens']) >= DUPLICATE_SIMILARITY), None)
+        if duplicate is not None or (not tokens and any(turn['user'] == user for turn in kept)):
+            if duplicate is not None:
+                duplicate['importance'] = max(duplicate['importance'], importance or 1)
+                duplicate['repeats'] += 1
+            continue
+        kept.append({'position': position, 'user': user, 'anna': anna, 'tokens': tokens,
+                     'importance': importance or 1, 'repeats': 1})
+
+    shown = sorted(kept, key=lambda turn: (turn['importance'], turn['repeats'], len(turn['tokens'])),
+                   reverse=True)[:MAX_SUMMARY_TURNS]
+    shown.sort(key=lambda turn: turn['position'])
+
+    first, last = rows[0][3], rows[-1][3]
+    lines = [f"Conversa com {contact_id} ({first:%d/%m/%Y %H:%M} - {last:%H:%M}): "
+             f"{len(rows)} mensagens, {len(kept)} assuntos"]
+    for turn in shown:
+        repeats = f" (x{turn['repeats']})" if turn['repeats'] > 1 else ''
+        lines.append(f"- User: {_clip(turn['user'])}{repeats}")
+        if turn['anna']:
+            lines.append(f"  Anna: {_clip(turn['anna'])}")
+
+    base = max((importance or 1 for _, _, importance, _ in rows), default=1)
+    return {
+        'content': '\n'.join(lines),
+        'context': f"User: {contact_id}, {first:%Y-%m-%d %H:%M} - {last:%Y-%m-%d %H:%M}",
+        'importance': min(10, base + int(math.log2(len(kept) or 1))),
+        'tags': json.dumps(['conversation_summary', f'user_{contact_id}'] +
+                           [word for word, _ in words.most_common(MAX_TAGS)]),
+        'source_count': len(rows)
+    }
+
+
+def _pending_windows(cursor, closed_before: datetime) -> List[Tuple[str, datetime]]:
+    """(contact, window start) pairs with conversation rows not yet consolidated, oldest first"""
+    cursor.execute("""
+        SELECT contact_id,
+               to_timestamp(floor(extract(epoch FROM created_at) / %(window)s) * %(window)s)
+                   AT TIME ZONE 'UTC' AS window_start
+        FROM memories
+        WHERE memory_type = 'conversation' AND archived_at IS NULL
+          AND contact_id IS NOT NULL AND created_at < %(closed_before)s
+        GROUP BY 1, 2
+        ORDER BY 2
+        LIMIT %(limit)s
+    """, {'window': WINDOW.total_seconds(), 'closed_before': closed_before, 'limit': WINDOWS_PER_RUN})
+    return cursor.fetchall()
+
+
+def _consolidate_window(conn, contact_id: str, window_start: datetime, now: datetime) -> int:
+    """Write (or rewrite) the window's summary and archive its rows; returns how many were archived
+
+    Rows archived by an earlier run are read again, so turns that arrived late are folded
+    into the same summary instead of starting a second one.
+    """
+    window_end = window_start + WINDOW
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, content, importance_score, created_at
+        FROM memories
+        WHERE memory_type = 'conversation' AND contact_id = %s
+          AND created_at >= %s AND created_at < %s
+        ORDER BY created_at, id
+        FOR UPDATE
+    """, (contact_id, window_start, window_end))
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+
+    summary = summarize(contact_id, rows)
+    cursor.execute("""
+        INSERT INTO memories (memory_type, content, context, importance_score, tags, is_active,
+                              contact_id, window_start, window_end, source_count, decayed_importance,
+                              created_at, updated_at)
+        VALUES ('summary', %s, %s, %s, %s, TRUE, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (contact_id, window_start) WHERE memory_type = 'summary'
+        DO UPDATE SET content = EXCLUDED.content,
+                      context = EXCLUDED.context,
+                      importance_score = EXCLUDED.importance_score,
+                      tags = EXCLUDED.tags,
+                      source_count = EXCLUDED.source_count,
+                      decayed_importance = EXCLUDED.decayed_importance,
+                      updated_at = EXCLUDED.updated_at
+        RETURNING id
+    """, (summary['content'], summary['context'], summary['importance'], summary['tags'],
+          contact_id, window_start, window_end, summary['source_count'],
+          decay(summary['importance'], now - window_end), now, now))
+    summary_id = cursor.fetchone()[0]
+
+    cursor.execute("""
+        UPDATE memories
+        SET archived_at = %s, is_active = FALSE, consolidated_into = %s, updated_at = %s
+        WHERE id = ANY(%s) AND archived_at IS NULL
+    """, (now, summary_id, now, [row[0] for row in rows]))
+    archived = cursor.rowcount
+    conn.commit()
+    return archived
+
+
+def _update_decay(conn, now: datetime) -> int:
+    """Recompute decayed_importance for the working set; only changed values are written"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE memories m
+        SET decayed_importance = d.value
+        FROM (
+            SELECT id,
+                   CASE WHEN memory_type = ANY(%(types)s)
+                        THEN round((COALESCE(importance_score, 1) * power(0.5,
+                                GREATEST(extract(epoch FROM (%(now)s - COALESCE(window_end, created_at))), 0)
+                                / 86400 / %(half_life)s))::numeric, 2)::real
+                        ELSE COALESCE(importance_score, 1)::real
+                   END AS value
+            FROM memories
+            WHERE archived_at IS NULL AND is_active
+        ) d
+        WHERE m.id = d.id AND m.decayed_importance IS DISTINCT FROM d.value
+    """, {'types': DECAYING_TYPES, 'now': now, 'half_life': HALF_LIFE_DAYS})
+    updated = cursor.rowcount
+    conn.commit()
+    return updated
+
+
+def consolidate(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Run one consolidation pass: fold closed windows, then refresh decayed importance
+
+    Only one process runs it at a time (PostgreSQL advisory lock); others return
+    {'skipped': True}. At most WINDOWS_PER_RUN windows are folded per pass.
+    """
+    from dual_database_sync import dual_sync
+
+    now = now or datetime.utcnow()
+    # Start of the window holding now - SETTLE_TIME: every row before it is in a closed window
+    settled = (now - SETTLE_TIME - datetime(1970, 1, 1)).total_seconds()
+    closed_before = datetime(1970, 1, 1) + timedelta(seconds=settled - settled % WINDOW.total_seconds())
+
+    started = time.perf_counter()
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            return {'skipped': True}
+
+        try:
+            windows = _pending_windows(cursor, closed_before)
+            conn.commit()
+            archived = 0
+            for contact_id, window_start in windows:
+                archived += _consolidate_window(conn, contact_id, window_start, now)
+            decayed = _update_decay(conn, now)
+        finally:
+            try:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (LOCK_KEY,))
+                conn.commit()
+            except Exception as e:
+                # A broken connection is closed by the pool, which releases the lock as well
+                logger.error(f"Error releasing memory consolidation lock: {e}")
+
+    result = {'windows': len(windows), 'archived': archived, 'decayed': decayed,
+              'duration_ms': round((time.perf_counter() - started) * 1000)}
+    logger.info(f"Memory consolidation: {result}")
+    return result
+
+
+class MemoryConsolidator:
+    """Runs consolidate() every CONSOLIDATION_INTERVAL seconds in a background thread"""
+
+    def __init__(self, interval: int = CONSOLIDATION_INTERVAL):
+        self.interval = interval
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def ensure_worker(self) -> None:
+        """Start the background thread (once per process)"""
+        if self.interval <= 0 or (self._worker and self._worker.is_alive()):
+            return
+        with self._lock:
+            if self._worker and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._loop, daemon=True, name='memory-consolidation')
+            self._worker.start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                consolidate()
+            except Exception as e:
+                logger.error(f"Error consolidating memories: {e}")
+            time.sleep(self.interval)
+
+
+memory_consolidator = MemoryConsolidator()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(consolidate())
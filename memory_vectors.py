@@ -0,0 +1,294 @@
+"""
+Memory Vectors - Busca semântica local nas memórias da Anna (similaridade de cosseno com NumPy)
+Cada memória vira um vetor float32 por projeção com hash de n-gramas de caracteres (sem modelo
+externo); os vetores ficam numa matriz contígua e um snapshot em disco (mapeado em memória)
+deixa a busca pronta logo na partida. Sem NumPy instalado, a busca por palavras é usada
+"""
+
+import os
+import glob
+import json
+import time
+import uuid
+import zlib
+import math
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+from event_stream import admin_events
+from knowledge_index import MEMORY_TABLE, REFRESH_INTERVAL, FIELD_WEIGHTS, tokenize, field_text
+
+try:
+    import numpy as np
+except ImportError:  # Declared in pyproject.toml; without it the agent uses keyword search
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = int(os.getenv('MEMORY_VECTOR_DIMENSIONS', '1024'))
+NGRAM_SIZES = (3, 4, 5)
+EMBEDDING_VERSION = 1  # Bump when embed_features changes; older snapshots are then ignored
+SNAPSHOT_PATH = os.getenv('MEMORY_VECTOR_SNAPSHOT',
+                          os.path.join(tempfile.gettempdir(), 'anna-memory-vectors'))
+SNAPSHOT_DELAY = 5.0  # Seconds after a change before the snapshot is rewritten
+SNAPSHOT_GRACE = 60.0  # Replaced matrices are kept this long for readers that just opened the old .json
+
+
+def vectors_available() -> bool:
+    return np is not None
+
+
+def _features(text: str, weight: float, features: Dict[str, float]) -> None:
+    """Words plus their character n-grams, so inflections and typos still overlap ("malhar"/"malhação")"""
+    for token in tokenize(text):
+        features['w:' + token] += weight
+        padded = f" {token} "
+        for size in NGRAM_SIZES:
+            for start in range(len(padded) - size + 1):
+                features[padded[start:start + size]] += weight / size
+
+
+def embed_features(features: Dict[str, float]):
+    """Hash features into a unit-length float32 vector (signed hashing, damped frequencies)"""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for feature, weight in features.items():
+        code = zlib.crc32(feature.encode('utf-8'))
+        vector[code % DIMENSIONS] += (1.0 if code & 0x80000000 else -1.0) * math.log1p(weight)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_row(row: Dict[str, Any]):
+    features: Dict[str, float] = defaultdict(float)
+    for field, weight in FIELD_WEIGHTS.items():
+        _features(field_text(row, field), weight, features)
+    return embed_features(features)
+
+
+def embed_text(text: str):
+    features: Dict[str, float] = defaultdict(float)
+    _features(text, 1.0, features)
+    return embed_features(features)
+
+
+class VectorIndex:
+    """Rows of a contiguous float32 matrix, one per document; deletes move the last row into the gap"""
+
+    def __init__(self, matrix=None, ids: Optional[List] = None, rows: Optional[List[Dict[str, Any]]] = None):
+        self._matrix = matrix if matrix is not None else np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self._ids = list(ids or [])
+        self._rows = list(rows or [])
+        self._slots = {doc_id: slot for slot, doc_id in enumerate(self._ids)}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _grow(self) -> None:
+        # Also turns a memory-mapped snapshot into an ordinary array
+        matrix = np.zeros((max(64, len(self._matrix) * 2), DIMENSIONS), dtype=np.float32)
+        matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = matrix
+
+    def upsert(self, doc_id, row: Dict[str, Any], vector=None) -> None:
+        vector = embed_row(row) if vector is None else vector
+        with self._lock:
+            slot = self._slots.get(doc_id)
+            if slot is None:
+                if len(self._ids) == len(self._matrix):
+                    self._grow()
+                slot = len(self._ids)
+                self._slots[doc_id] = slot
+                self._ids.append(doc_id)
+                self._rows.append(row)
+            else:
+                self._rows[slot] = row
+            self._matrix[slot] = vector
+
+    def remove(self, doc_id) -> None:
+        with self._lock:
+            slot = self._slots.pop(doc_id, None)
+            if slot is None:
+                return
+            last = len(self._ids) - 1
+            if slot != last:
+                self._matrix[slot] = self._matrix[last]
+                self._ids[slot] = self._ids[last]
+                self._rows[slot] = self._rows[last]
+                self._slots[self._ids[slot]] = slot
+            self._ids.pop()
+            self._rows.pop()
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top documents by cosine similarity (vectors are unit length, so a dot product)"""
+        vector = embed_text(query)
+        if not vector.any():
+            return []
+
+        with self._lock:
+            count = len(self._ids)
+            if not count:
+                return []
+            scores = self._matrix[:count] @ vector
+            k = min(limit, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[slot]), self._rows[slot]) for slot in top if scores[slot] > min_score]
+
+    def save(self, path: str) -> None:
+        """Write the matrix to <path>.<generation>.npy, then point <path>.json (ids and rows) at it
+
+        Every write gets its own matrix file and the .json is replaced atomically, so a
+        reader always pairs the metadata with the matrix written alongside it, even when
+        several processes save the same path. Older matrices are removed after
+        SNAPSHOT_GRACE seconds.
+        """
+        with self._lock:
+            count = len(self._ids)
+            matrix = np.array(self._matrix[:count])
+            meta = {'version': EMBEDDING_VERSION, 'dimensions': DIMENSIONS, 'count': count,
+                    'ids': list(self._ids), 'rows': list(self._rows)}
+
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        matrix_path = f"{path}.{uuid.uuid4().hex}.npy"
+        meta['matrix'] = os.path.basename(matrix_path)
+        with open(matrix_path, 'wb') as handle:
+            np.save(handle, matrix)
+
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.memory-vectors-')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(json.dumps(meta, default=str).encode('utf-8'))
+            os.replace(temporary, path + '.json')
+        except Exception:
+            os.unlink(temporary)
+            os.unlink(matrix_path)
+            raise
+
+        cutoff = time.time() - SNAPSHOT_GRACE
+        for stale in glob.glob(glob.escape(path) + '.*.npy') + [path + '.npy']:  # Plus the pre-generation file
+            try:
+                if stale != matrix_path and os.path.getmtime(stale) < cutoff:
+                    os.unlink(stale)
+            except OSError:
+                pass
+
+    @classmethod
+    def load(cls, path: str) -> Optional['VectorIndex']:
+        """Open a snapshot without reading the matrix up front (copy-on-write memory map)
+
+        Returns None when there is no usable snapshot: missing, made by another embedding
+        version or dimension, or its matrix already removed by a newer write.
+        """
+        try:
+            with open(path + '.json', encoding='utf-8') as handle:
+                meta = json.load(handle)
+            if meta.get('version') != EMBEDDING_VERSION or meta.get('dimensions') != DIMENSIONS or not meta.get('matrix'):
+                return None
+            matrix = np.load(os.path.join(os.path.dirname(path), meta['matrix']), mmap_mode='c')
+        except (OSError, ValueError):
+            return None
+        if matrix.shape != (meta['count'], DIMENSIONS):
+            return None
+        return cls(matrix, meta['ids'], meta['rows'])
+
+
+class MemoryVectors:
+    """Vector index of active memories, kept in sync with admin writes and snapshotted to disk"""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._index: Optional[VectorIndex] = None
+        self._loaded_at: Optional[float] = None
+        self._reload_lock = threading.Lock()
+        self._snapshot_timer: Optional[threading.Timer] = None
+
+    def _fetch(self) -> VectorIndex:
+        from supabase_tools import supabase
+
+        rows = supabase.table(MEMORY_TABLE).select('*').eq('is_active', True).execute().data or []
+        if not rows:
+            return VectorIndex()
+        matrix = np.vstack([embed_row(row) for row in rows])
+        return VectorIndex(matrix, [row.get('id') for row in rows], rows)
+
+    def reload(self) -> None:
+        """Embed every active memory again, swap the new index in and rewrite the snapshot"""
+        with self._reload_lock:
+            started = time.perf_counter()
+            index = self._fetch()
+            self._index = index
+            self._loaded_at = time.monotonic()
+            logger.info(f"Memory vectors loaded: {len(index)} memories in {(time.perf_counter() - started) * 1000:.0f} ms")
+        self.save_snapshot()
+
+    def _refresh_in_background(self) -> None:
+        if self._reload_lock.locked():
+            return
+
+        def run():
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error refreshing memory vectors: {e}")
+
+        threading.Thread(target=run, name='memory-vectors-refresh', daemon=True).start()
+
+    def ensure_loaded(self) -> None:
+        """First use serves the snapshot right away and refreshes it from the database behind it"""
+        if self._loaded_at is None:
+            index = VectorIndex.load(self.path)
+            if index is None:
+                self.reload()
+                return
+            self._index = index
+            self._loaded_at = time.monotonic()
+            logger.info(f"Memory vectors opened from snapshot: {len(index)} memories")
+            self._refresh_in_background()
+        elif time.monotonic() - self._loaded_at > REFRESH_INTERVAL:
+            self._loaded_at = time.monotonic()  # One refresh at a time
+            self._refresh_in_background()
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        self.ensure_loaded()
+        return self._index.search(query, limit=limit)
+
+    def save_snapshot(self) -> None:
+        self._snapshot_timer = None
+        if self._index is None:
+            return
+        try:
+            self._index.save(self.path)
+        except Exception as e:
+            logger.error(f"Error saving memory vectors snapshot: {e}")
+
+    def _schedule_snapshot(self) -> None:
+        """Coalesce bursts of admin writes into one snapshot write"""
+        if self._snapshot_timer is None:
+            self._snapshot_timer = threading.Timer(SNAPSHOT_DELAY, self.save_snapshot)
+            self._snapshot_timer.daemon = True
+            self._snapshot_timer.start()
+
+    def apply_event(self, event_type: str, data: Dict[str, Any]) -> None:
+        """admin_events listener: memory events carry the written row, deletes only the id"""
+        if self._loaded_at is None or event_type != 'memory':
+            return
+
+        row = data.get('memory')
+        doc_id = row.get('id', data.get('id')) if row else data.get('id')
+        if data.get('action') == 'deleted' or (row is not None and row.get('is_active') is False):
+            self._index.remove(doc_id)
+        elif row is not None:
+            self._index.upsert(doc_id, row)
+        else:
+            return
+        self._schedule_snapshot()
+
+
+# Global instance; admin writes in this process update it as they are published
+memory_vectors = MemoryVectors()
+if np is not None:
+    admin_events.subscribe(memory_vectors.apply_event)
@@ -1,7 +1,7 @@
 from app import db
 from datetime import datetime
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 import uuid
 
 class Routine(db.Model):
@@ -11,19 +11,89 @@ class Routine(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     activity = db.Column(db.Text, nullable=False)
     category = db.Column(db.Text, nullable=False)
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
     time_start = db.Column(db.Time, nullable=False)
     time_end = db.Column(db.Time, nullable=False)
     status = db.Column(db.Text, default='upcoming', nullable=False)
     description = db.Column(db.Text)
     location = db.Column(db.Text)
-    has_images = db.Column(db.Boolean, default=False)
-    has_videos = db.Column(db.Boolean, default=False)
+    has_images = db.Column(db.Boolean, default=False)  # image_count > 0
+    has_videos = db.Column(db.Boolean, default=False)  # video_count > 0
+    # Maintained per media write by media_upload.update_media_counts, see add_media_counters.py
+    image_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    video_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, index=True)  # Set by trigger from routine_change_seq
+    change_txid = db.Column(db.BigInteger, nullable=False, default=0)  # Writing transaction, set by trigger
+    search_vector = deferred(db.Column(TSVECTOR))  # Set by trigger, see add_routine_search_index.py
     
     # Relationship with media
     media = relationship('RoutineMedia', back_populates='routine', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_routine_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_routine_change_txid', 'change_txid', 'change_seq'),
+    )
+
+# Matches the list view's keyset order (date DESC, time_start, id)
+db.Index('ix_routine_list_order', Routine.date.desc(), Routine.time_start, Routine.id)
+
+class RoutineTombstone(db.Model):
+    """Deleted routines, kept so delta-sync clients can drop them"""
+    __tablename__ = 'routine_tombstones'
+    
+    routine_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    change_seq = db.Column(db.BigInteger, nullable=False, index=True)
+    change_txid = db.Column(db.BigInteger, nullable=False, default=0)  # Deleting transaction
+    deleted_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_routine_tombstones_change_txid', 'change_txid', 'change_seq'),
+    )
+
+class RoutineRule(db.Model):
+    """Recurring routine: one row per series, occurrences expanded on read (routine_recurrence)"""
+    __tablename__ = 'routine_rules'
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    activity = db.Column(db.Text, nullable=False)
+    category = db.Column(db.Text, nullable=False)
+    time_start = db.Column(db.Time, nullable=False)
+    time_end = db.Column(db.Time, nullable=False)
+    status = db.Column(db.Text, default='upcoming', nullable=False)
+    description = db.Column(db.Text)
+    location = db.Column(db.Text)
+    rrule = db.Column(db.Text, nullable=False)  # e.g. FREQ=WEEKLY;BYDAY=MO,WE,FR
+    dtstart = db.Column(db.Date, nullable=False)
+    until = db.Column(db.Date)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    exceptions = relationship('RoutineRuleException', back_populates='rule', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_routine_rules_window', 'dtstart', 'until'),
+    )
+
+class RoutineRuleException(db.Model):
+    """Override or cancellation of one occurrence of a RoutineRule"""
+    __tablename__ = 'routine_rule_exceptions'
+
+    rule_id = db.Column(UUID(as_uuid=True), db.ForeignKey('routine_rules.id', ondelete='CASCADE'), primary_key=True)
+    occurrence_date = db.Column(db.Date, primary_key=True)  # Original date of the occurrence
+    cancelled = db.Column(db.Boolean, default=False, nullable=False)
+    # Overrides; NULL keeps the rule's value
+    date = db.Column(db.Date, index=True)
+    time_start = db.Column(db.Time)
+    time_end = db.Column(db.Time)
+    activity = db.Column(db.Text)
+    location = db.Column(db.Text)
+    description = db.Column(db.Text)
+    status = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    rule = relationship('RoutineRule', back_populates='exceptions')
 
 class RoutineMedia(db.Model):
     """Media associated with routines"""
@@ -34,11 +104,25 @@ class RoutineMedia(db.Model):
     media_url = db.Column(db.Text, nullable=False)
     routine_id = db.Column(UUID(as_uuid=True), db.ForeignKey('routine.id'))
     media_caption = db.Column(db.Text)
+    thumbnail_url = db.Column(db.Text)  # WebP derivatives, see media_derivatives.py
+    preview_url = db.Column(db.Text)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
     
     # Relationship with routine
     routine = relationship('Routine', back_populates='media')
 
+class MediaObject(db.Model):
+    """Stored file in the media bucket, shared by every row with the same content"""
+    __tablename__ = 'media_objects'
+    
+    content_hash = db.Column(db.Text, primary_key=True)  # SHA-256, hex
+    object_name = db.Column(db.Text, nullable=False, unique=True, index=True)
+    content_type = db.Column(db.Text)
+    size = db.Column(db.BigInteger)
+    ref_count = db.Column(db.Integer, nullable=False, default=1)  # See media_upload.release_object
+    stored = db.Column(db.Boolean, nullable=False, default=False)  # Upload finished; see media_upload.claim_object
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
 class ChatSession(db.Model):
     """Chat session data"""
     __tablename__ = 'chat_sessions'
@@ -79,12 +163,21 @@ class Memory(db.Model):
     __tablename__ = 'memories'
     
     id = db.Column(db.Integer, primary_key=True)
-    memory_type = db.Column(db.String(50), nullable=False)  # 'conversation', 'experience', 'fact'
+    memory_type = db.Column(db.String(50), nullable=False)  # 'conversation', 'summary', 'experience', 'fact'
     content = db.Column(db.Text, nullable=False)
     context = db.Column(db.Text)
     importance_score = db.Column(db.Integer, default=1)  # 1-10 scale
     tags = db.Column(db.Text)  # JSON array of tags
     is_active = db.Column(db.Boolean, default=True)
+    contact_id = db.Column(db.String(100))
+    # Consolidation (memory_consolidation.py): conversation rows are folded into one
+    # 'summary' per contact and window, then archived
+    archived_at = db.Column(db.DateTime)
+    consolidated_into = db.Column(db.Integer, db.ForeignKey('memories.id', ondelete='SET NULL'))
+    window_start = db.Column(db.DateTime)
+    window_end = db.Column(db.DateTime)
+    source_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    decayed_importance = db.Column(db.Float)  # importance_score with time decay, kept up to date by the job
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
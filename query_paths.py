@@ -0,0 +1,101 @@
+"""
+Query Paths - Inventário das consultas de busca textual feitas pelas ferramentas do agente
+Cada caminho liga uma ferramenta à tabela, à consulta SQL equivalente (as do PostgREST traduzidas)
+e ao índice de que depende; add_trigram_indexes.py cria os índices e check_query_indexes.py
+confere com EXPLAIN que nenhuma dessas consultas volta a varrer a tabela inteira
+"""
+
+from typing import Dict, Any, List, Tuple
+
+# Trigram indexes (pg_trgm, GIN): serve ILIKE '%term%' with a leading wildcard
+TRIGRAM_INDEXES: List[Tuple[str, str, str]] = [
+    # (index, table, column)
+    ('ix_messages_content_trgm', 'messages', 'content'),
+    ('ix_conteudo_titulo_trgm', 'conteudo', 'titulo'),
+    ('ix_conteudo_descricao_trgm', 'conteudo', 'descricao'),
+    ('ix_memories_content_trgm', 'memories', 'content'),
+    ('ix_memories_context_trgm', 'memories', 'context'),
+    ('ix_memories_tags_trgm', 'memories', 'tags'),
+    ('ix_anna_routine_media_description_trgm', 'anna_routine_media', 'description'),
+]
+
+# Full-text expression index for the conversation working set (content_search)
+CONVERSATION_FTS_INDEX = ('ix_memories_content_fts', 'memories', """
+    CREATE INDEX IF NOT EXISTS ix_memories_content_fts
+    ON memories USING GIN (to_tsvector('pt_unaccent', content))
+    WHERE archived_at IS NULL AND is_active;
+""")
+
+# Parameters: %(pattern)s = '%term%', %(tsquery)s = to_tsquery() text, %(limit)s
+# database: where the tool reads the table, 'local' (DATABASE_URL) or 'supabase' (the PostgREST tables)
+QUERY_PATHS: List[Dict[str, Any]] = [
+    {
+        'tool': 'supabase_tools.search_memories',
+        'database': 'supabase',
+        'table': 'messages',
+        'indexes': ['ix_messages_content_trgm'],
+        'sql': """
+            SELECT * FROM messages
+            WHERE content ILIKE %(pattern)s
+            ORDER BY created_at DESC LIMIT %(limit)s
+        """
+    },
+    {
+        'tool': 'supabase_tools.search_content, content_search (library)',
+        'database': 'supabase',
+        'table': 'conteudo',
+        'indexes': ['ix_conteudo_titulo_trgm', 'ix_conteudo_descricao_trgm'],
+        'sql': """
+            SELECT * FROM conteudo
+            WHERE titulo ILIKE %(pattern)s OR descricao ILIKE %(pattern)s
+            ORDER BY criado_em DESC LIMIT %(limit)s
+        """
+    },
+    {
+        'tool': 'content_search (media)',
+        'database': 'supabase',
+        'table': 'anna_routine_media',
+        'indexes': ['ix_anna_routine_media_description_trgm'],
+        'sql': """
+            SELECT * FROM anna_routine_media
+            WHERE description ILIKE %(pattern)s
+            LIMIT %(limit)s
+        """
+    },
+    {
+        'tool': 'database_tools_simple.search_memories (admin memory list)',
+        'database': 'local',
+        'table': 'memories',
+        'indexes': ['ix_memories_content_trgm', 'ix_memories_context_trgm', 'ix_memories_tags_trgm'],
+        'sql': """
+            SELECT * FROM memories
+            WHERE is_active AND (content ILIKE %(pattern)s OR context ILIKE %(pattern)s OR tags ILIKE %(pattern)s)
+            ORDER BY importance_score DESC, created_at DESC LIMIT %(limit)s
+        """
+    },
+    {
+        'tool': 'content_search (conversation)',
+        'database': 'local',
+        'table': 'memories',
+        'indexes': ['ix_memories_content_fts'],
+        'sql': """
+            SELECT id FROM memories
+            WHERE archived_at IS NULL AND is_active
+              AND to_tsvector('pt_unaccent', content) @@ to_tsquery('pt_unaccent', %(tsquery)s)
+            LIMIT %(limit)s
+        """
+    },
+    {
+        # routine.activity is no longer searched with ILIKE: every routine path uses the
+        # weighted full-text index (add_routine_search_index.py)
+        'tool': 'database_tools.get_anna_routines, supabase_tools.get_anna_routines, content_search (routine)',
+        'database': 'local',
+        'table': 'routine',
+        'indexes': ['ix_routine_search_vector'],
+        'sql': """
+            SELECT id FROM routine
+            WHERE search_vector @@ to_tsquery('pt_unaccent', %(tsquery)s)
+            LIMIT %(limit)s
+        """
+    },
+]
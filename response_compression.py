@@ -0,0 +1,94 @@
+"""
+Response Compression - Compressão gzip/brotli das respostas Flask acima de um tamanho mínimo
+Brotli é usado quando o pacote `brotli` está instalado e o cliente aceita `br`
+"""
+
+import os
+import gzip
+import logging
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Declared in pyproject.toml; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Dynamic responses: ratio close to gzip -9 at gzip -6 speed
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """Compress a response body with the given content-coding"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag of the encoded representation (must differ from the identity one)"""
+    return f"{etag}-{encoding}"
+
+
+def matching_etag(etag: str) -> Optional[str]:
+    """Return the If-None-Match tag that matches etag in any of its encodings, or None
+
+    Routes answering 304 should echo this tag so the client keeps the variant it has.
+    """
+    from flask import request
+
+    for candidate in (etag,) + tuple(encoded_etag(etag, encoding) for encoding in ENCODINGS):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def init_compression(app, min_size: Optional[int] = None) -> None:
+    """Register an after_request hook compressing eligible responses
+
+    Skipped: streamed or passthrough bodies (SSE, streamed JSON, send_file),
+    non-200 responses, bodies already encoded, non-text mimetypes and bodies
+    below COMPRESS_MIN_SIZE bytes. Every compressible mimetype gets
+    `Vary: Accept-Encoding`, compressed or not, so caches keep variants apart.
+    """
+    from flask import request
+
+    if min_size is None:
+        min_size = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers or request.method == 'HEAD'):
+            return response
+
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if not encoding:
+            return response
+
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        compressed = compress_body(body, encoding)
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak=weak)
+        return response
+
+    logger.info(f"Response compression enabled ({', '.join(ENCODINGS)}, min {min_size} bytes)")
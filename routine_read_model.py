@@ -0,0 +1,105 @@
+"""
+Routine Read Model - Leitura projetada de atividades para os endpoints do admin
+Seleciona só as colunas necessárias como tuplas (sem objetos ORM / identity map)
+e serializa tudo por um único caminho rápido
+"""
+
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is the fallback
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Column order shared by the ORM projection, raw SQL (routine_search) and the serializers
+ACTIVITY_FIELDS = (
+    'id', 'activity', 'category', 'date', 'time_start', 'time_end', 'status',
+    'location', 'description', 'has_images', 'has_videos', 'created_at',
+    'image_count', 'video_count'
+)
+ACTIVITY_SQL_COLUMNS = ', '.join(ACTIVITY_FIELDS)
+
+
+def activity_columns(*extra) -> List[Any]:
+    """Routine columns in ACTIVITY_FIELDS order, plus any extra columns appended at the end"""
+    from models import Routine
+    return [getattr(Routine, field) for field in ACTIVITY_FIELDS] + list(extra)
+
+
+def select_activities(*filters, order_by: Sequence[Any] = (), limit: Optional[int] = None,
+                      extra: Sequence[Any] = ()) -> List[tuple]:
+    """Run a column-projected Routine query and return plain row tuples"""
+    from app import db
+    from sqlalchemy import select
+
+    stmt = select(*activity_columns(*extra)).where(*filters).order_by(*order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).tuples().all()
+
+
+def activity_to_dict(row: Sequence[Any]) -> Dict[str, Any]:
+    """Serialize a row in ACTIVITY_FIELDS order (extra trailing columns are ignored)"""
+    (routine_id, activity, category, date, time_start, time_end, status,
+     location, description, has_images, has_videos, created_at,
+     image_count, video_count) = row[:14]
+    return {
+        'id': str(routine_id),
+        'date': date.isoformat() if date else None,
+        'time_start': time_start.isoformat('minutes') if time_start else None,
+        'time_end': time_end.isoformat('minutes') if time_end else None,
+        'activity': activity,
+        'category': category,
+        'location': location,
+        'description': description,
+        'status': status,
+        'has_images': has_images or False,
+        'has_videos': has_videos or False,
+        'image_count': image_count or 0,
+        'video_count': video_count or 0,
+        'created_at': created_at.isoformat() if created_at else None
+    }
+
+
+def activity_to_event(row: Sequence[Any]) -> Dict[str, Any]:
+    """Serialize a row in ACTIVITY_FIELDS order as a FullCalendar event"""
+    (routine_id, activity, category, date, time_start, time_end, status,
+     location, description, has_images, has_videos, _created_at,
+     image_count, video_count) = row[:14]
+    date_str = date.isoformat() if date else ''
+    return {
+        'id': str(routine_id),
+        'title': activity,
+        'start': f"{date_str}T{time_start.isoformat('seconds') if time_start else '00:00:00'}",
+        'end': f"{date_str}T{time_end.isoformat('seconds') if time_end else '23:59:59'}",
+        'className': f"fc-event-{category}",
+        'extendedProps': {
+            'category': category,
+            'status': status,
+            'location': location,
+            'description': description,
+            'has_images': has_images or False,
+            'has_videos': has_videos or False,
+            'image_count': image_count or 0,
+            'video_count': video_count or 0
+        }
+    }
+
+
+def activities_to_dicts(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    return [activity_to_dict(row) for row in rows]
+
+
+def activities_to_events(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    return [activity_to_event(row) for row in rows]
+
+
+def dumps(payload: Any) -> str:
+    """Encode already-serialized data as JSON, through orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
@@ -0,0 +1,285 @@
+"""
+Routine Recurrence - Atividades recorrentes descritas por regras (RRULE)
+Uma linha em routine_rules representa a série inteira; as ocorrências são geradas sob
+demanda só para a janela pedida, com ajustes/cancelamentos por ocorrência em
+routine_rule_exceptions (veja add_routine_rules.py)
+"""
+
+import re
+import logging
+import unicodedata
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from dual_database_sync import dual_sync
+from routine_read_model import activity_to_dict, activity_to_event
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+# How far ahead open-ended views (the admin list) show series without an end
+HORIZON_DAYS = 180
+# Fields an occurrence exception may override
+OVERRIDE_FIELDS = ('date', 'time_start', 'time_end', 'activity', 'location', 'description', 'status')
+RULE_SQL_COLUMNS = (
+    'id, activity, category, time_start, time_end, status, location, description, '
+    'rrule, dtstart, until, created_at'
+)
+
+
+def parse_rrule(text: str) -> Dict[str, Any]:
+    """Parse the supported RRULE subset: FREQ=DAILY|WEEKLY|MONTHLY, INTERVAL, BYDAY
+    (weekly), BYMONTHDAY (monthly, negative counts from the end), COUNT and UNTIL
+    (YYYYMMDD). Raises ValueError for anything else.
+    """
+    rule: Dict[str, Any] = {'freq': None, 'interval': 1, 'byday': (), 'bymonthday': (), 'count': None, 'until': None}
+    for part in (text or '').upper().removeprefix('RRULE:').split(';'):
+        if not part:
+            continue
+        key, _, value = part.partition('=')
+        try:
+            if key == 'FREQ' and value in FREQUENCIES:
+                rule['freq'] = value
+            elif key == 'INTERVAL' and int(value) >= 1:
+                rule['interval'] = int(value)
+            elif key == 'BYDAY':
+                rule['byday'] = tuple(sorted({WEEKDAYS.index(day) for day in value.split(',')}))
+            elif key == 'BYMONTHDAY':
+                days = {int(day) for day in value.split(',')}
+                if not all(1 <= abs(day) <= 31 for day in days):
+                    raise ValueError
+                rule['bymonthday'] = tuple(sorted(days))
+            elif key == 'COUNT' and int(value) >= 1:
+                rule['count'] = int(value)
+            elif key == 'UNTIL':
+                rule['until'] = date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+            else:
+                raise ValueError
+        except (ValueError, IndexError):
+            raise ValueError(f"Regra de recorrência não suportada: {part}")
+
+    if rule['freq'] is None:
+        raise ValueError('Regra de recorrência sem FREQ (DAILY, WEEKLY ou MONTHLY)')
+    if rule['byday'] and rule['freq'] != 'WEEKLY':
+        raise ValueError('BYDAY só é suportado com FREQ=WEEKLY')
+    if rule['bymonthday'] and rule['freq'] != 'MONTHLY':
+        raise ValueError('BYMONTHDAY só é suportado com FREQ=MONTHLY')
+    return rule
+
+
+def _iter_dates(rule: Dict[str, Any], dtstart: date, first: date, last: date):
+    """Candidate dates of the series in [first, last], ascending, jumping straight to first"""
+    interval = rule['interval']
+
+    if rule['freq'] == 'DAILY':
+        skip = max(0, -(-(first - dtstart).days // interval))
+        current = dtstart + timedelta(days=skip * interval)
+        while current <= last:
+            yield current
+            current += timedelta(days=interval)
+
+    elif rule['freq'] == 'WEEKLY':
+        weekdays = rule['byday'] or (dtstart.weekday(),)
+        first_week = dtstart - timedelta(days=dtstart.weekday())
+        skip = max(0, ((first - first_week).days // 7) // interval)
+        week = first_week + timedelta(weeks=skip * interval)
+        while week <= last:
+            for weekday in weekdays:
+                current = week + timedelta(days=weekday)
+                if dtstart <= current <= last and current >= first:
+                    yield current
+            week += timedelta(weeks=interval)
+
+    else:
+        monthdays = rule['bymonthday'] or (dtstart.day,)
+        start_index = dtstart.year * 12 + dtstart.month - 1
+        skip = max(0, ((first.year * 12 + first.month - 1) - start_index) // interval)
+        index = start_index + skip * interval
+        while date(index // 12, index % 12 + 1, 1) <= last:
+            year, month = index // 12, index % 12 + 1
+            month_days = ((date(year + month // 12, month % 12 + 1, 1)) - timedelta(days=1)).day
+            # Days the month does not have (e.g. 31 in April) are skipped, as in RFC 5545
+            for day in sorted({day if day > 0 else month_days + day + 1 for day in monthdays}):
+                if 1 <= day <= month_days:
+                    current = date(year, month, day)
+                    if dtstart <= current <= last and current >= first:
+                        yield current
+            index += interval
+
+
+def occurrence_dates(rrule, dtstart: date, start: date, end: date, until: Optional[date] = None) -> List[date]:
+    """Dates of the series falling in [start, end]
+
+    Cost is proportional to the occurrences in the window, except with COUNT, which
+    has to be counted from dtstart (and is bounded by COUNT itself).
+    """
+    rule = parse_rrule(rrule) if isinstance(rrule, str) else rrule
+    for limit in (until, rule['until']):
+        if limit:
+            end = min(end, limit)
+    if end < start or end < dtstart:
+        return []
+
+    if rule['count'] is None:
+        return list(_iter_dates(rule, dtstart, max(start, dtstart), end))
+
+    dates = []
+    for position, current in enumerate(_iter_dates(rule, dtstart, dtstart, end)):
+        if position >= rule['count']:
+            break
+        if current >= start:
+            dates.append(current)
+    return dates
+
+
+def is_occurrence(rrule, dtstart: date, day: date, until: Optional[date] = None) -> bool:
+    return day in occurrence_dates(rrule, dtstart, day, day, until)
+
+
+def occurrence_id(rule_id, day: date) -> str:
+    """Stable id of one occurrence: '<rule uuid>:<YYYY-MM-DD>'"""
+    return f"{rule_id}:{day.isoformat()}"
+
+
+def parse_occurrence_id(value: str) -> Optional[Tuple[str, date]]:
+    """(rule_id, occurrence date) for an occurrence id, None for a plain routine id"""
+    match = re.fullmatch(r'([0-9a-fA-F-]{36}):(\d{4}-\d{2}-\d{2})', value or '')
+    if not match:
+        return None
+    return match.group(1).lower(), date.fromisoformat(match.group(2))
+
+
+def _fold(text: str) -> str:
+    return unicodedata.normalize('NFD', text or '').encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def matches_search(values, term: str) -> bool:
+    """Word-prefix, accent-insensitive match: the rules routine_search applies in SQL"""
+    words = re.findall(r'\w+', _fold(' '.join(value or '' for value in values)))
+    return all(any(word.startswith(term_word) for word in words) for term_word in re.findall(r'\w+', _fold(term)))
+
+
+def expand_occurrences(start: date, end: date, category: Optional[str] = None, status: Optional[str] = None,
+                       search: Optional[str] = None, rule_id: Optional[str] = None) -> List[tuple]:
+    """Occurrences of every rule between start and end (inclusive), exceptions applied
+
+    Rows follow ACTIVITY_FIELDS (so routine_read_model serializes them) with rule_id and
+    the original occurrence date appended. Two queries per call, whatever the window.
+    """
+    params: Dict[str, Any] = {'start': start, 'end': end}
+    rule_filter = ""
+    if rule_id:
+        rule_filter = "AND id = %(rule_id)s"
+        params['rule_id'] = rule_id
+
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        # Rules active in the window, plus rules with an occurrence moved into it
+        cursor.execute(f"""
+            SELECT {RULE_SQL_COLUMNS}
+            FROM routine_rules
+            WHERE ((dtstart <= %(end)s AND (until IS NULL OR until >= %(start)s))
+                   OR id IN (SELECT rule_id FROM routine_rule_exceptions WHERE date BETWEEN %(start)s AND %(end)s))
+              {rule_filter}
+        """, params)
+        rules = cursor.fetchall()
+        if not rules:
+            return []
+
+        params['rule_ids'] = [rule[0] for rule in rules]
+        cursor.execute(f"""
+            SELECT rule_id, occurrence_date, cancelled, {', '.join(OVERRIDE_FIELDS)}
+            FROM routine_rule_exceptions
+            WHERE rule_id = ANY(%(rule_ids)s::uuid[])
+              AND (occurrence_date BETWEEN %(start)s AND %(end)s OR date BETWEEN %(start)s AND %(end)s)
+        """, params)
+        exceptions = {(str(row[0]), row[1]): row[2:] for row in cursor.fetchall()}
+
+    # Occurrences whose original date is outside the window but were moved into it
+    moved_in: Dict[str, List[date]] = {}
+    for (exception_rule, day), exception in exceptions.items():
+        if not start <= day <= end:
+            moved_in.setdefault(exception_rule, []).append(day)
+
+    rows = []
+    for rule in rules:
+        rule_key = str(rule[0])
+        try:
+            days = occurrence_dates(rule[8], rule[9], start, end, rule[10]) + moved_in.get(rule_key, [])
+        except ValueError as e:
+            logger.error(f"Skipping routine rule {rule_key}: {e}")
+            continue
+
+        for day in days:
+            row = _occurrence_row(rule, day, exceptions.get((rule_key, day)))
+            if row is None or not start <= row[3] <= end:
+                continue
+            if category and row[2] != category:
+                continue
+            if status and row[6] != status:
+                continue
+            if search and not matches_search((row[1], row[8], row[7], row[2]), search):
+                continue
+            rows.append(row)
+
+    rows.sort(key=lambda row: (row[3], row[4]))
+    return rows
+
+
+def _occurrence_row(rule: tuple, day: date, exception: Optional[tuple]) -> Optional[tuple]:
+    """One occurrence in ACTIVITY_FIELDS order (+ rule_id, original date); None if cancelled"""
+    (rule_uuid, activity, category, time_start, time_end, status, location, description,
+     _rrule, _dtstart, _until, created_at) = rule
+    values = {'date': day, 'time_start': time_start, 'time_end': time_end, 'activity': activity,
+              'location': location, 'description': description, 'status': status}
+    if exception:
+        if exception[0]:  # cancelled
+            return None
+        values.update({field: value for field, value in zip(OVERRIDE_FIELDS, exception[1:]) if value is not None})
+
+    return (
+        occurrence_id(rule_uuid, day), values['activity'], category, values['date'],
+        values['time_start'], values['time_end'], values['status'], values['location'],
+        values['description'], False, False, created_at, 0, 0, str(rule_uuid), day
+    )
+
+
+def get_occurrence(rule_id: str, day: date) -> Optional[tuple]:
+    """A single occurrence by rule and original date, wherever it was moved; None if it does not exist"""
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {RULE_SQL_COLUMNS} FROM routine_rules WHERE id = %s", (rule_id,))
+        rule = cursor.fetchone()
+        if not rule or not is_occurrence(rule[8], rule[9], day, rule[10]):
+            return None
+        cursor.execute(f"""
+            SELECT cancelled, {', '.join(OVERRIDE_FIELDS)}
+            FROM routine_rule_exceptions
+            WHERE rule_id = %s AND occurrence_date = %s
+        """, (rule_id, day))
+        return _occurrence_row(rule, day, cursor.fetchone())
+
+
+def occurrence_to_dict(row: tuple) -> Dict[str, Any]:
+    """activity_to_dict plus the recurrence fields"""
+    activity = activity_to_dict(row)
+    activity.update(recurring=True, rule_id=row[14], occurrence_date=row[15].isoformat())
+    return activity
+
+
+def occurrence_to_event(row: tuple) -> Dict[str, Any]:
+    """activity_to_event plus the recurrence fields"""
+    event = activity_to_event(row)
+    event['extendedProps'].update(recurring=True, rule_id=row[14], occurrence_date=row[15].isoformat())
+    return event
+
+
+def recurrence_fingerprint() -> str:
+    """Changes whenever any rule or exception is written or removed (for ETags)"""
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT (SELECT COUNT(*) FROM routine_rules), (SELECT MAX(updated_at) FROM routine_rules),
+                   (SELECT COUNT(*) FROM routine_rule_exceptions), (SELECT MAX(updated_at) FROM routine_rule_exceptions)
+        """)
+        return '|'.join(str(value) for value in cursor.fetchone())
@@ -0,0 +1,129 @@
+"""
+Routine Search - Busca textual ranqueada nas atividades da rotina
+Usa a coluna routine.search_vector (tsvector em português com unaccent, índice GIN)
+mantida por trigger; veja add_routine_search_index.py
+"""
+
+import re
+import logging
+from typing import Dict, Any, List, Optional
+from dual_database_sync import dual_sync
+from routine_read_model import ACTIVITY_SQL_COLUMNS, activity_to_dict
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration created by add_routine_search_index.py (portuguese + unaccent)
+TS_CONFIG = 'pt_unaccent'
+
+
+def build_search_query(term: Optional[str]) -> Optional[str]:
+    """Turn free text into a to_tsquery() string: every word must match, as a prefix
+
+    Prefix matching keeps as-you-type search working ("corr" finds "corrida").
+    Returns None when the text has no searchable words.
+    """
+    words = re.findall(r'\w+', term or '', re.UNICODE)
+    if not words:
+        return None
+    return ' & '.join(f"{word.lower()}:*" for word in words)
+
+
+def routine_search_filter(term: str):
+    """SQLAlchemy filter matching routines against the search index (same rules as search_routines)"""
+    from models import Routine
+    from sqlalchemy import func, false
+
+    tsquery = build_search_query(term)
+    if not tsquery:
+        return false()
+    return Routine.search_vector.op('@@')(func.to_tsquery(TS_CONFIG, tsquery))
+
+
+def search_routines(query: Optional[str] = None, limit: int = 20, category: Optional[str] = None,
+                    status: Optional[str] = None, date_from=None, date_to=None) -> List[Dict[str, Any]]:
+    """Search routines, best matches first
+
+    With a query, rows are ranked with ts_rank_cd over the weighted vector
+    (activity > description > location > category), newest date breaking ties.
+    Without one, the same filters return routines ordered by date and time.
+    Raises on database errors; callers decide how to report them.
+    """
+    conditions = []
+    params: Dict[str, Any] = {'limit': limit}
+
+    tsquery = build_search_query(query)
+    if query and not tsquery:
+        return []
+    if tsquery:
+        conditions.append("search_vector @@ to_tsquery(%(config)s, %(tsquery)s)")
+        params.update(config=TS_CONFIG, tsquery=tsquery)
+    if category:
+        conditions.append("category = %(category)s")
+        params['category'] = category
+    if status:
+        conditions.append("status = %(status)s")
+        params['status'] = status
+    if date_from:
+        conditions.append("date >= %(date_from)s")
+        params['date_from'] = date_from
+    if date_to:
+        conditions.append("date <= %(date_to)s")
+        params['date_to'] = date_to
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if tsquery:
+        rank = "ts_rank_cd(search_vector, to_tsquery(%(config)s, %(tsquery)s))"
+        order = f"{rank} DESC, date DESC, time_start ASC"
+        select = f"{ACTIVITY_SQL_COLUMNS}, {rank} AS rank"
+    else:
+        order = "date ASC, time_start ASC"
+        select = f"{ACTIVITY_SQL_COLUMNS}, NULL AS rank"
+
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {select}
+            FROM routine
+            {where}
+            ORDER BY {order}
+            LIMIT %(limit)s
+        """, params)
+        rows = cursor.fetchall()
+
+    results = []
+    for row in rows:
+        # Same serializer as the admin endpoints; rank is the trailing column
+        routine = activity_to_dict(row)
+        routine['rank'] = round(float(row[-1]), 4) if row[-1] is not None else None
+        results.append(routine)
+
+    logger.info(f"Routine search '{query}' returned {len(results)} rows")
+    return results
+
+
+def rank_rows(query: str, rows: List[Dict[str, Any]]) -> List[float]:
+    """ts_rank_cd of serialized activities (e.g. recurring occurrences, which have no
+    search_vector) against query, weighted like routine.search_vector; one query for all rows
+    """
+    tsquery = build_search_query(query)
+    if not tsquery or not rows:
+        return [0.0] * len(rows)
+
+    with dual_sync.get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT ts_rank_cd(
+                setweight(to_tsvector(%(config)s, COALESCE(r.activity, '')), 'A') ||
+                setweight(to_tsvector(%(config)s, COALESCE(r.description, '')), 'B') ||
+                setweight(to_tsvector(%(config)s, COALESCE(r.location, '')), 'C') ||
+                setweight(to_tsvector(%(config)s, COALESCE(r.category, '')), 'D'),
+                to_tsquery(%(config)s, %(tsquery)s))
+            FROM unnest(%(activity)s::text[], %(description)s::text[], %(location)s::text[], %(category)s::text[])
+                WITH ORDINALITY AS r(activity, description, location, category, position)
+            ORDER BY r.position
+        """, {
+            'config': TS_CONFIG,
+            'tsquery': tsquery,
+            **{field: [row.get(field) for row in rows] for field in ('activity', 'description', 'location', 'category')}
+        })
+        return [round(float(rank), 4) for rank, in cursor.fetchall()]
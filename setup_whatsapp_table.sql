@@ -28,9 +28,42 @@ CREATE TABLE IF NOT EXISTS whatsapp_config (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Criar tabela de eventos recebidos (deduplicação de webhooks)
+CREATE TABLE IF NOT EXISTS whatsapp_inbound_events (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    instance_name VARCHAR(100) NOT NULL,
+    remote_jid VARCHAR(100) NOT NULL,
+    message_id VARCHAR(100) NOT NULL,
+    received_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- processing -> done, ou failed (o reenvio da Evolution API é processado de novo)
+    status VARCHAR(20) NOT NULL DEFAULT 'processing',
+    attempts INTEGER NOT NULL DEFAULT 1,
+    claimed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT whatsapp_inbound_events_key_unique UNIQUE (instance_name, remote_jid, message_id)
+);
+
+-- Tabelas criadas antes das colunas de estado: as mensagens já registradas foram respondidas
+ALTER TABLE whatsapp_inbound_events ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'done';
+ALTER TABLE whatsapp_inbound_events ALTER COLUMN status SET DEFAULT 'processing';
+ALTER TABLE whatsapp_inbound_events ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE whatsapp_inbound_events ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_whatsapp_inbound_received ON whatsapp_inbound_events(received_at);
+
+-- Criar tabela de donas das conversas (instância que atende cada contato)
+CREATE TABLE IF NOT EXISTS whatsapp_conversation_owners (
+    phone_number VARCHAR(20) PRIMARY KEY,
+    instance_name VARCHAR(100) NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_whatsapp_owners_instance ON whatsapp_conversation_owners(instance_name);
+
 -- Comentários nas tabelas
 COMMENT ON TABLE whatsapp_conversations IS 'Armazena conversas entre usuários e Anna via WhatsApp';
 COMMENT ON TABLE whatsapp_config IS 'Configurações da integração WhatsApp Evolution API';
+COMMENT ON TABLE whatsapp_inbound_events IS 'Mensagens recebidas via webhook, uma linha por (instância, remoteJid, key.id)';
+COMMENT ON TABLE whatsapp_conversation_owners IS 'Instância dona de cada conversa, para as respostas saírem pelo mesmo número';
 
 -- Mostrar resultado
 SELECT 'Tabelas WhatsApp criadas com sucesso!' as resultado;
\ No newline at end of file
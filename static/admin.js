@@ -9,6 +9,21 @@ class AdminManager {
         this.currentActivityView = 'calendario';
         this.filterOptions = { categories: [], statuses: [] };
         this.currentFilters = {};
+        this.activitiesByDate = null;
+        this.listCursor = null;
+        this.listHasMore = false;
+        this.listLoading = false;
+        this.listRequestId = 0;
+        this.listObserver = null;
+        this.todayActivityIds = null;
+        this.changeCursor = null;
+        this.syncingChanges = null;
+        this.pendingOperations = [];
+        this.batchTimer = null;
+        this.uploadWaiters = new Map();
+        this.adminEvents = null;
+        this.memories = null;
+        this.images = null;
         
         this.initializeCalendar();
         this.initializeEventListeners();
@@ -37,6 +52,79 @@ class AdminManager {
                 console.error('Error during initialization:', error);
             }
         }, 500);
+        
+        // Other admins' edits are pushed over SSE; polling only covers a dropped stream
+        this.subscribeToAdminEvents();
+        setInterval(() => {
+            if (!document.hidden && !this.isStreaming()) this.syncChanges();
+        }, 30000);
+    }
+
+    isStreaming() {
+        return Boolean(this.adminEvents && this.adminEvents.readyState === EventSource.OPEN);
+    }
+
+    subscribeToAdminEvents() {
+        if (typeof EventSource === 'undefined') return;
+        
+        this.adminEvents = new EventSource('/admin/api/events');
+        
+        // Routine events carry only ids; the rows come from the delta endpoint.
+        // Recurring rules are expanded server-side per window, so those reload the views
+        this.adminEvents.addEventListener('routine', (e) => {
+            if (JSON.parse(e.data).action === 'rules') {
+                this.reloadActivityViews();
+            } else {
+                this.syncChanges();
+            }
+        });
+        this.adminEvents.addEventListener('media', (e) => this.applyMediaEvent(JSON.parse(e.data)));
+        this.adminEvents.addEventListener('memory', (e) => this.applyMemoryEvent(JSON.parse(e.data)));
+        this.adminEvents.addEventListener('image', (e) => this.applyImageEvent(JSON.parse(e.data)));
+        this.adminEvents.addEventListener('resync', () => {
+            this.syncChanges();
+            if (this.memories) this.loadMemories();
+            if (this.images) this.loadImages();
+        });
+    }
+
+    applyMediaEvent(event) {
+        // Media changes flip has_images/has_videos on the routine
+        this.syncChanges();
+        
+        if (event.upload_id && this.uploadWaiters.has(event.upload_id)) {
+            this.uploadWaiters.get(event.upload_id)();
+        }
+        
+        if (event.action === 'deleted' && event.id) {
+            const item = document.querySelector(`#mediaPreview [data-media-id="${event.id}"]`);
+            if (item) item.remove();
+        }
+        
+        if (event.action === 'derivatives' && event.thumbnail_url) {
+            const preview = document.querySelector(`#mediaPreview [data-media-id="${event.id}"] img`);
+            if (preview) preview.src = event.thumbnail_url;
+        }
+    }
+
+    applyMemoryEvent(event) {
+        if (!this.memories) return;
+        
+        this.memories = this.memories.filter(memory => memory.id !== event.id);
+        if (event.action !== 'deleted' && event.memory) {
+            this.memories.unshift(event.memory);
+        }
+        this.renderMemories(this.memories);
+    }
+
+    applyImageEvent(event) {
+        if (!this.images) return;
+        
+        this.images = this.images.filter(image => image.id !== event.id);
+        if (event.action !== 'deleted' && event.image) {
+            this.images.unshift(event.image);
+        }
+        this.renderImages(this.images);
     }
 
     // Missing method: initializeActivityTabHandlers
@@ -250,6 +338,19 @@ class AdminManager {
     loadActivitiesList() {
         console.log('Loading activities list');
         
+        // Start over from the first page; loadMoreActivities() fetches the rest on scroll
+        this.listRequestId += 1;
+        this.activitiesByDate = null;
+        this.listCursor = null;
+        this.listHasMore = false;
+        this.listLoading = false;
+        this.initializeListObserver();
+        return this.loadMoreActivities();
+    }
+
+    async loadMoreActivities() {
+        if (this.listLoading || (this.activitiesByDate && !this.listHasMore)) return;
+        
         // Build query parameters from current filters
         let queryParams = new URLSearchParams();
         if (this.currentFilters.category) queryParams.append('category', this.currentFilters.category);
@@ -257,18 +358,113 @@ class AdminManager {
         if (this.currentFilters.dateFrom) queryParams.append('date_from', this.currentFilters.dateFrom);
         if (this.currentFilters.dateTo) queryParams.append('date_to', this.currentFilters.dateTo);
         if (this.currentFilters.search) queryParams.append('search', this.currentFilters.search);
+        if (this.listCursor) queryParams.append('cursor', this.listCursor);
         
-        const url = '/admin/api/activities/list' + (queryParams.toString() ? '?' + queryParams.toString() : '');
+        const url = '/admin/api/activities/list?' + queryParams.toString();
+        const requestId = this.listRequestId;
+        this.listLoading = true;
+        this.setListLoadingIndicator(true);
         
-        fetch(url)
-            .then(response => response.json())
-            .then(data => {
-                console.log('Activities list data received:', data);
-                this.renderActivitiesList(data);
-            })
-            .catch(error => {
-                console.error('Error loading activities list:', error);
-            });
+        try {
+            const response = await fetch(url);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const page = await response.json();
+            // Filters changed while this page was in flight
+            if (requestId !== this.listRequestId) return;
+            
+            console.log('Activities list page received:', page);
+            this.listCursor = page.next_cursor;
+            this.listHasMore = page.has_more;
+            
+            if (!this.activitiesByDate) {
+                this.activitiesByDate = page.groups;
+                this.renderActivitiesList(this.activitiesByDate);
+            } else {
+                // Skip rows a delta-sync patch already placed on screen
+                const loadedIds = new Set(Object.values(this.activitiesByDate).flat().map(activity => activity.id));
+                const groups = {};
+                Object.entries(page.groups).forEach(([date, activities]) => {
+                    const fresh = activities.filter(activity => !loadedIds.has(activity.id));
+                    if (!fresh.length) return;
+                    groups[date] = fresh;
+                    // A date can continue from the previous page
+                    this.activitiesByDate[date] = (this.activitiesByDate[date] || []).concat(fresh);
+                });
+                this.appendActivityGroups(groups);
+            }
+        } catch (error) {
+            console.error('Error loading activities list:', error);
+        } finally {
+            if (requestId === this.listRequestId) {
+                this.listLoading = false;
+                this.setListLoadingIndicator(false);
+                this.fillListViewport();
+            }
+        }
+    }
+
+    initializeListObserver() {
+        const sentinel = document.getElementById('activitiesListMore');
+        if (!sentinel || this.listObserver || typeof IntersectionObserver === 'undefined') return;
+        
+        this.listObserver = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting) && this.currentActivityView === 'lista') {
+                this.loadMoreActivities();
+            }
+        }, { rootMargin: '400px' });
+        this.listObserver.observe(sentinel);
+    }
+
+    fillListViewport() {
+        // The observer only fires on changes, so keep loading while the sentinel is still on screen
+        const sentinel = document.getElementById('activitiesListMore');
+        if (!sentinel || !this.listHasMore || this.currentActivityView !== 'lista') return;
+        if (sentinel.getBoundingClientRect().top < window.innerHeight + 400) {
+            this.loadMoreActivities();
+        }
+    }
+
+    setListLoadingIndicator(loading) {
+        const sentinel = document.getElementById('activitiesListMore');
+        if (sentinel) {
+            sentinel.textContent = loading ? 'Carregando...' : '';
+        }
+    }
+
+    appendActivityGroups(groups) {
+        const container = document.getElementById('activitiesList');
+        if (!container) return;
+        
+        Object.entries(groups).forEach(([date, activities]) => {
+            const cardsHTML = activities.map(activity => this.createActivityCardHTML(activity)).join('');
+            const existing = container.querySelector(`.date-section[data-date="${date}"] .activities-for-date`);
+            if (existing) {
+                existing.insertAdjacentHTML('beforeend', cardsHTML);
+            } else {
+                container.appendChild(this.createDateSection(date, cardsHTML));
+            }
+        });
+        
+        this.initializeActivityCards();
+        if (typeof lucide !== 'undefined') {
+            lucide.createIcons();
+        }
+    }
+
+    createDateSection(date, cardsHTML) {
+        const dateSection = document.createElement('div');
+        dateSection.className = 'date-section mb-4';
+        dateSection.dataset.date = date;
+        
+        dateSection.innerHTML = `
+            <h5 class="date-header">${this.formatDateForDisplay(date)}</h5>
+            <div class="activities-for-date">
+                ${cardsHTML}
+            </div>
+        `;
+        return dateSection;
     }
 
     applyFilters() {
@@ -334,17 +530,8 @@ class AdminManager {
         }
         
         Object.entries(activitiesByDate).forEach(([date, activities]) => {
-            const dateSection = document.createElement('div');
-            dateSection.className = 'date-section mb-4';
-            
-            dateSection.innerHTML = `
-                <h5 class="date-header">${this.formatDateForDisplay(date)}</h5>
-                <div class="activities-for-date">
-                    ${activities.map(activity => this.createActivityCardHTML(activity)).join('')}
-                </div>
-            `;
-            
-            container.appendChild(dateSection);
+            const cardsHTML = activities.map(activity => this.createActivityCardHTML(activity)).join('');
+            container.appendChild(this.createDateSection(date, cardsHTML));
         });
         
         // Initialize activity card interactions
@@ -394,8 +581,9 @@ class AdminManager {
                 <div class="activity-card-footer">
                     <span class="activity-category-badge">${activity.category}</span>
                     ${statusBadge}
-                    ${activity.has_images ? '<i data-lucide="image" width="14" height="14" class="media-indicator"></i>' : ''}
-                    ${activity.has_videos ? '<i data-lucide="video" width="14" height="14" class="media-indicator"></i>' : ''}
+                    ${activity.has_images ? `<i data-lucide="image" width="14" height="14" class="media-indicator" title="${activity.image_count || ''} imagem(ns)"></i>` : ''}
+                    ${activity.has_videos ? `<i data-lucide="video" width="14" height="14" class="media-indicator" title="${activity.video_count || ''} vídeo(s)"></i>` : ''}
+                    ${activity.recurring ? '<i data-lucide="repeat" width="14" height="14" class="media-indicator"></i>' : ''}
                 </div>
             </div>
         `;
@@ -423,8 +611,9 @@ class AdminManager {
     }
 
     initializeActivityCards() {
-        // Add click handlers to activity cards
-        document.querySelectorAll('.activity-card').forEach(card => {
+        // Add click handlers to activity cards (only new ones when a page is appended)
+        document.querySelectorAll('.activity-card:not([data-bound])').forEach(card => {
+            card.dataset.bound = 'true';
             card.addEventListener('click', (e) => {
                 // Don't trigger if clicked on dropdown or its children
                 if (!e.target.closest('.activity-dropdown-container') && !e.target.closest('.activity-menu-btn')) {
@@ -435,6 +624,8 @@ class AdminManager {
         });
 
         // Close dropdowns when clicking outside
+        if (this.dropdownCloserBound) return;
+        this.dropdownCloserBound = true;
         document.addEventListener('click', (e) => {
             if (!e.target.closest('.activity-dropdown-container')) {
                 document.querySelectorAll('.activity-dropdown-container.active').forEach(dropdown => {
@@ -457,16 +648,8 @@ class AdminManager {
             if (response.ok) {
                 this.showAlert('Atividade excluída com sucesso', 'success');
                 
-                // Reload the activities list to reflect the changes
-                this.loadActivitiesList();
-                
-                // Also reload today's activities if visible
-                this.loadTodayActivities();
-                
-                // Refresh calendar if it's in calendar view
-                if (this.currentActivityView === 'calendario' && this.calendar) {
-                    this.calendar.refetchEvents();
-                }
+                // Patch calendar, list and today views with just this change
+                this.refreshAfterDelete(activityId);
             } else {
                 const error = await response.json();
                 this.showAlert(error.error || 'Erro ao excluir atividade', 'danger');
@@ -516,13 +699,34 @@ class AdminManager {
             headerToolbar: {
                 left: 'prev,next today',
                 center: 'title',
-                right: 'dayGridMonth,dayGridWeek'
+                right: 'duplicateWeek dayGridMonth,dayGridWeek'
+            },
+            customButtons: {
+                duplicateWeek: {
+                    text: 'Duplicar semana',
+                    click: () => this.duplicateVisibleWeek()
+                }
             },
             locale: 'pt-br',
             selectable: true,
             selectMirror: true,
             dayMaxEvents: true,
             weekends: true,
+            // Drag to reschedule; moves are sent together through the batch endpoint
+            editable: true,
+            eventDurationEditable: false,
+            
+            eventDrop: (dropInfo) => {
+                if (dropInfo.event.extendedProps.recurring) {
+                    this.moveOccurrence(dropInfo.event, dropInfo.revert);
+                    return;
+                }
+                this.queueActivityOperation({
+                    op: 'update',
+                    id: dropInfo.event.id,
+                    data: { date: this.toLocalDateString(dropInfo.event.start) }
+                }, dropInfo.revert);
+            },
             
             select: (selectInfo) => {
                 this.openActivityModal(null, selectInfo.startStr);
@@ -534,12 +738,19 @@ class AdminManager {
             
             events: async (info, successCallback, failureCallback) => {
                 try {
-                    const response = await fetch('/admin/api/activities');
+                    // Only the visible range; the browser revalidates it with If-None-Match
+                    const params = new URLSearchParams({ start: info.startStr, end: info.endStr });
+                    const response = await fetch(`/admin/api/activities?${params}`, { cache: 'no-cache' });
                     if (!response.ok) {
                         throw new Error(`HTTP ${response.status}`);
                     }
                     const events = await response.json();
                     console.log('Calendar events loaded:', events.length);
+                    // First load seeds the delta-sync cursor; later patches come from syncChanges()
+                    const cursor = response.headers.get('X-Change-Cursor');
+                    if (this.changeCursor === null && cursor !== null) {
+                        this.changeCursor = parseInt(cursor, 10);
+                    }
                     successCallback(events);
                 } catch (error) {
                     console.error('Error loading calendar events:', error);
@@ -551,6 +762,303 @@ class AdminManager {
         this.calendar.render();
     }
 
+    async moveOccurrence(event, revert) {
+        // Moving one occurrence stores an override; the rest of the series stays put
+        const { rule_id: ruleId, occurrence_date: occurrenceDate } = event.extendedProps;
+        try {
+            const response = await fetch(`/admin/api/routine-rules/${ruleId}/occurrences/${occurrenceDate}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ date: this.toLocalDateString(event.start) })
+            });
+            if (!response.ok) {
+                const result = await response.json();
+                throw new Error(result.error || `HTTP ${response.status}`);
+            }
+            this.refreshRecurringViews();
+        } catch (error) {
+            console.error('Error moving occurrence:', error);
+            this.showAlert('Erro ao reagendar ocorrência: ' + error.message, 'danger');
+            revert();
+        }
+    }
+
+    refreshRecurringViews() {
+        // With the stream open the 'rules' event triggers the reload instead
+        if (!this.isStreaming()) this.reloadActivityViews();
+    }
+
+    queueActivityOperation(operation, revert = null) {
+        // Repeated moves of the same activity collapse into its latest position
+        const pending = this.pendingOperations.find(item =>
+            item.operation.op === 'update' && operation.op === 'update' && item.operation.id === operation.id);
+        if (pending) {
+            Object.assign(pending.operation.data, operation.data);
+            if (revert) pending.reverts.push(revert);
+        } else {
+            this.pendingOperations.push({ operation, reverts: revert ? [revert] : [] });
+        }
+        
+        clearTimeout(this.batchTimer);
+        this.batchTimer = setTimeout(() => this.flushActivityOperations(), 400);
+    }
+
+    async flushActivityOperations() {
+        const pending = this.pendingOperations;
+        this.pendingOperations = [];
+        this.batchTimer = null;
+        if (!pending.length) return;
+        
+        const revertAll = () => pending.forEach(item => item.reverts.forEach(revert => revert()));
+        try {
+            const result = await this.sendActivityBatch(pending.map(item => item.operation));
+            if (!result) {
+                revertAll();
+                return;
+            }
+            result.results
+                .filter(item => !item.success)
+                .forEach(item => pending[item.index].reverts.forEach(revert => revert()));
+            if (result.failed) {
+                this.showAlert(`${result.failed} atividade(s) não puderam ser reagendadas`, 'warning');
+            }
+        } catch (error) {
+            console.error('Error rescheduling activities:', error);
+            this.showAlert('Erro ao reagendar atividades', 'danger');
+            revertAll();
+        }
+    }
+
+    async sendActivityBatch(operations, atomic = false) {
+        const response = await fetch('/admin/api/activities/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ operations, atomic })
+        });
+        const result = await response.json();
+        
+        if (result.results) {
+            // Both the calendar and the list are patched from the change feed
+            this.syncChanges();
+            return result;
+        }
+        this.showAlert('Erro ao salvar atividades: ' + (result.error || 'Erro desconhecido'), 'danger');
+        return null;
+    }
+
+    async duplicateVisibleWeek() {
+        const view = this.calendar.view;
+        if (view.type !== 'dayGridWeek') {
+            this.showAlert('Abra a visão semanal para duplicar a semana', 'info');
+            return;
+        }
+        
+        const events = this.calendar.getEvents().filter(event =>
+            event.start >= view.activeStart && event.start < view.activeEnd);
+        if (!events.length) {
+            this.showAlert('Nenhuma atividade nesta semana', 'info');
+            return;
+        }
+        if (!confirm(`Copiar ${events.length} atividade(s) para a próxima semana?`)) {
+            return;
+        }
+        
+        // One set-based copy on the server; activities already in next week are skipped
+        const lastDay = new Date(view.activeEnd);
+        lastDay.setDate(lastDay.getDate() - 1);
+        const nextWeek = new Date(view.activeStart);
+        nextWeek.setDate(nextWeek.getDate() + 7);
+        
+        try {
+            const response = await fetch('/admin/api/activities/copy', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    source_start: this.toLocalDateString(view.activeStart),
+                    source_end: this.toLocalDateString(lastDay),
+                    target_start: this.toLocalDateString(nextWeek),
+                    skip_existing: true
+                })
+            });
+            const result = await response.json();
+            
+            if (response.ok) {
+                const skipped = result.skipped ? ` (${result.skipped} já existiam)` : '';
+                this.showAlert(`${result.copied} atividade(s) copiadas para a próxima semana${skipped}`, 'success');
+                this.syncChanges();
+                this.calendar.next();
+            } else {
+                this.showAlert('Semana não duplicada: ' + (result.error || 'Erro desconhecido'), 'danger');
+            }
+        } catch (error) {
+            console.error('Error duplicating week:', error);
+            this.showAlert('Erro ao duplicar semana', 'danger');
+        }
+    }
+
+    toLocalDateString(date) {
+        const month = String(date.getMonth() + 1).padStart(2, '0');
+        const day = String(date.getDate()).padStart(2, '0');
+        return `${date.getFullYear()}-${month}-${day}`;
+    }
+
+    syncChanges() {
+        // Coalesce overlapping calls (e.g. a save while the poll is running)
+        if (this.syncingChanges) {
+            return this.syncingChanges.then(() => this.syncChanges());
+        }
+        this.syncingChanges = this.fetchChanges().finally(() => {
+            this.syncingChanges = null;
+        });
+        return this.syncingChanges;
+    }
+
+    async fetchChanges() {
+        try {
+            if (this.changeCursor === null) {
+                const response = await fetch('/admin/api/activities/changes');
+                const data = await response.json();
+                this.changeCursor = data.cursor;
+                this.reloadActivityViews();
+                return;
+            }
+            
+            let hasMore = true;
+            while (hasMore) {
+                const response = await fetch(`/admin/api/activities/changes?since=${this.changeCursor}`);
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                const data = await response.json();
+                this.changeCursor = data.cursor;
+                
+                if (data.reset) {
+                    this.reloadActivityViews();
+                    return;
+                }
+                if (data.changed.length || data.deleted.length) {
+                    this.applyActivityChanges(data.changed, data.deleted);
+                }
+                hasMore = data.has_more;
+            }
+        } catch (error) {
+            console.error('Error syncing activity changes:', error);
+        }
+    }
+
+    reloadActivityViews() {
+        if (this.calendar) this.calendar.refetchEvents();
+        if (this.currentActivityView === 'lista') this.loadActivitiesList();
+        this.loadTodayActivities();
+    }
+
+    applyActivityChanges(changed, deleted) {
+        const removedIds = new Set([...deleted, ...changed.map(activity => activity.id)]);
+        const today = new Date().toISOString().split('T')[0];
+        
+        // Calendar: replace events in place, inside the feed's source so navigation refetches them
+        if (this.calendar) {
+            removedIds.forEach(id => {
+                const event = this.calendar.getEventById(id);
+                if (event) event.remove();
+            });
+            
+            const source = this.calendar.getEventSources()[0];
+            const view = this.calendar.view;
+            changed.forEach(activity => {
+                const day = new Date(`${activity.date}T00:00:00`);
+                if (day >= view.activeStart && day < view.activeEnd) {
+                    this.calendar.addEvent(this.toCalendarEvent(activity), source);
+                }
+            });
+        }
+        
+        // List: drop old versions and re-insert the ones that still match the filters
+        if (this.activitiesByDate) {
+            // Activities past the last loaded page arrive with their own page later
+            const loadedUntil = this.listHasMore ? Object.keys(this.activitiesByDate).sort()[0] : null;
+            
+            const byDate = {};
+            Object.entries(this.activitiesByDate).forEach(([date, activities]) => {
+                const remaining = activities.filter(activity => !removedIds.has(activity.id));
+                if (remaining.length) byDate[date] = remaining;
+            });
+            changed
+                .filter(activity => this.matchesCurrentFilters(activity))
+                .filter(activity => !loadedUntil || (activity.date && activity.date >= loadedUntil))
+                .forEach(activity => {
+                    const date = activity.date || 'sem-data';
+                    byDate[date] = byDate[date] || [];
+                    byDate[date].push(activity);
+                    byDate[date].sort((a, b) => (a.time_start || '').localeCompare(b.time_start || ''));
+                });
+            
+            // Same ordering as the server: newest date first
+            this.activitiesByDate = {};
+            Object.keys(byDate).sort().reverse().forEach(date => {
+                this.activitiesByDate[date] = byDate[date];
+            });
+            if (this.currentActivityView === 'lista') {
+                this.renderActivitiesList(this.activitiesByDate);
+            }
+        }
+        
+        // Today: small enough to reload, but only when it is affected
+        const todayIds = this.todayActivityIds || new Set();
+        const touchesToday = changed.some(activity => activity.date === today) ||
+            [...removedIds].some(id => todayIds.has(id));
+        if (touchesToday) {
+            this.loadTodayActivities();
+        }
+    }
+
+    toCalendarEvent(activity) {
+        const timeStart = activity.time_start ? `${activity.time_start.substring(0, 5)}:00` : '00:00:00';
+        const timeEnd = activity.time_end ? `${activity.time_end.substring(0, 5)}:00` : '23:59:59';
+        
+        return {
+            id: activity.id,
+            title: activity.activity,
+            start: `${activity.date}T${timeStart}`,
+            end: `${activity.date}T${timeEnd}`,
+            className: `fc-event-${activity.category}`,
+            extendedProps: {
+                category: activity.category,
+                status: activity.status,
+                location: activity.location,
+                description: activity.description,
+                has_images: activity.has_images || false,
+                has_videos: activity.has_videos || false,
+                image_count: activity.image_count || 0,
+                video_count: activity.video_count || 0
+            }
+        };
+    }
+
+    matchesCurrentFilters(activity) {
+        const filters = this.currentFilters;
+        if (filters.category && activity.category !== filters.category) return false;
+        if (filters.status && activity.status !== filters.status) return false;
+        if (filters.dateFrom && (!activity.date || activity.date < filters.dateFrom)) return false;
+        if (filters.dateTo && (!activity.date || activity.date > filters.dateTo)) return false;
+        if (filters.search) {
+            // Approximates the server's full-text rules: accent-insensitive word prefixes
+            const words = this.searchWords([activity.activity, activity.description, activity.location, activity.category].join(' '));
+            const terms = this.searchWords(filters.search);
+            if (!terms.every(term => words.some(word => word.startsWith(term)))) return false;
+        }
+        return true;
+    }
+
+    searchWords(text) {
+        return (text || '')
+            .normalize('NFD')
+            .replace(/[\u0300-\u036f]/g, '')
+            .toLowerCase()
+            .split(/[^\p{L}\p{N}_]+/u)
+            .filter(word => word);
+    }
+
     initializeEventListeners() {
         // Media upload area - check if elements exist first
         const uploadArea = document.getElementById('mediaUploadArea');
@@ -654,7 +1162,9 @@ class AdminManager {
                 const activity = await response.json();
                 this.populateForm(activity);
                 this.currentActivity = activity;
-                document.getElementById('modalTitle').textContent = 'Editar Atividade';
+                document.getElementById('modalTitle').textContent = activity.recurring ? 'Editar Ocorrência' : 'Editar Atividade';
+                const recurrenceRow = document.getElementById('activityRecurrenceRow');
+                if (recurrenceRow) recurrenceRow.style.display = 'none';
                 document.getElementById('deleteActivity').style.display = 'inline-block';
             } catch (error) {
                 console.error('Error loading activity:', error);
@@ -718,7 +1228,8 @@ class AdminManager {
             mediaElement.controls = true;
         }
         
-        mediaElement.src = media.media_url;
+        // Images show the WebP thumbnail when it has been generated
+        mediaElement.src = isVideo ? media.media_url : (media.thumbnail_url || media.media_url);
         
         const removeBtn = document.createElement('button');
         removeBtn.className = 'media-remove';
@@ -773,50 +1284,17 @@ class AdminManager {
                 this.showErrorMessage('Categoria é obrigatória');
                 return;
             }
-
-            // Handle file uploads first if any
-            const fileInput = document.getElementById('activityMediaUpload');
-            const mediaUrls = [];
             
-            // Process uploaded files from new input
-            if (fileInput && fileInput.files.length > 0) {
-                for (const file of fileInput.files) {
-                    const formData = new FormData();
-                    formData.append('file', file);
-
-                    const uploadResponse = await fetch('/admin/api/upload-media', {
-                        method: 'POST',
-                        body: formData
-                    });
-
-                    if (uploadResponse.ok) {
-                        const uploadResult = await uploadResponse.json();
-                        mediaUrls.push(uploadResult.url);
-                    } else {
-                        console.error('Failed to upload file:', file.name);
-                    }
-                }
+            const recurrence = document.getElementById('activityRecurrence');
+            if (recurrence && recurrence.value && !this.currentActivity) {
+                await this.saveRecurringActivity(recurrence.value);
+                return;
             }
-            
-            // Also process existing media files from old system
-            if (this.mediaFiles && this.mediaFiles.length > 0) {
-                for (const file of this.mediaFiles) {
-                    const formData = new FormData();
-                    formData.append('file', file);
-
-                    const uploadResponse = await fetch('/admin/api/upload-media', {
-                        method: 'POST',
-                        body: formData
-                    });
 
-                    if (uploadResponse.ok) {
-                        const uploadResult = await uploadResponse.json();
-                        mediaUrls.push(uploadResult.url);
-                    } else {
-                        console.error('Failed to upload file:', file.name);
-                    }
-                }
-            }
+            // Files are uploaded after the activity exists (chunked, see uploadActivityMedia)
+            const fileInput = document.getElementById('activityMediaUpload');
+            const files = [...(fileInput ? fileInput.files : []), ...(this.mediaFiles || [])];
+            const mediaUrls = [];
             
             // Process URLs from textarea
             const urlInputElement = document.getElementById('activityMediaUrls');
@@ -855,8 +1333,10 @@ class AdminManager {
             if (response.ok) {
                 this.showSuccessMessage('Atividade criada com sucesso!');
                 bootstrap.Modal.getInstance(document.getElementById('activityModal')).hide();
-                if (this.calendar) this.calendar.refetchEvents();
-                if (this.loadTodayActivities) this.loadTodayActivities();
+                this.syncChanges();
+                if (files.length > 0) {
+                    this.uploadActivityMedia(result.activity_id, files);
+                }
             } else {
                 console.error('Server response:', response.status, result);
                 this.showErrorMessage(this.getErrorMessage(result.error || 'Erro desconhecido'));
@@ -871,6 +1351,155 @@ class AdminManager {
         }
     }
     
+    async uploadActivityMedia(routineId, files) {
+        // Runs after the modal closes; the server finishes each file in the background
+        const results = await Promise.allSettled(files.map(file => this.uploadFileResumable(routineId, file)));
+        const failed = results.filter(result => result.status === 'rejected' || result.value.status === 'failed');
+        
+        if (failed.length > 0) {
+            console.error('Media upload errors:', failed.map(result => result.reason || result.value.error));
+            this.showErrorMessage(`Falha ao enviar ${failed.length} arquivo(s)`);
+        } else {
+            this.showSuccessMessage('Mídias enviadas com sucesso!');
+        }
+    }
+    
+    async uploadFileResumable(routineId, file) {
+        // The upload id is kept per file, so picking the same file again resumes it
+        const resumeKey = `upload:${routineId}:${file.name}:${file.size}:${file.lastModified}`;
+        let upload = null;
+        
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            const response = await fetch(`/admin/api/uploads/${savedId}`);
+            if (response.ok) upload = await response.json();
+            if (upload && upload.status === 'failed') upload = null;
+        }
+        
+        if (!upload) {
+            const response = await fetch('/admin/api/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    routine_id: routineId,
+                    filename: file.name,
+                    size: file.size,
+                    content_type: file.type
+                })
+            });
+            upload = await response.json();
+            if (!response.ok) throw new Error(upload.error || 'Falha ao iniciar upload');
+            localStorage.setItem(resumeKey, upload.upload_id);
+        }
+        
+        if (upload.status === 'uploading') {
+            for (const index of upload.missing) {
+                const start = index * upload.chunk_size;
+                await this.putUploadChunk(upload.upload_id, index, file.slice(start, start + upload.chunk_size));
+            }
+            
+            const response = await fetch(`/admin/api/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error || 'Falha ao finalizar upload');
+        }
+        
+        const status = await this.waitForUpload(upload.upload_id);
+        localStorage.removeItem(resumeKey);
+        return status;
+    }
+    
+    async putUploadChunk(uploadId, index, blob, attempts = 3) {
+        const body = await blob.arrayBuffer();
+        const digest = await crypto.subtle.digest('SHA-256', body);
+        const hash = Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+        let lastError = null;
+        
+        for (let attempt = 1; attempt <= attempts; attempt++) {
+            try {
+                const response = await fetch(`/admin/api/uploads/${uploadId}/chunks/${index}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': hash },
+                    body: body
+                });
+                if (response.ok) return;
+                
+                const result = await response.json().catch(() => ({}));
+                lastError = new Error(result.error || `Falha ao enviar bloco ${index}`);
+                // Only network errors, server errors and corrupted chunks are worth retrying
+                if (response.status < 500 && response.status !== 422) break;
+            } catch (error) {
+                lastError = error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+        throw lastError;
+    }
+    
+    waitForUpload(uploadId, interval = 2000) {
+        // Polls the status; the 'media' event for this upload triggers an immediate check
+        return new Promise((resolve, reject) => {
+            let timer = null;
+            let checking = false;
+            
+            const finish = (callback, value) => {
+                clearTimeout(timer);
+                this.uploadWaiters.delete(uploadId);
+                callback(value);
+            };
+            
+            const check = async () => {
+                if (checking) return;
+                checking = true;
+                clearTimeout(timer);
+                try {
+                    const response = await fetch(`/admin/api/uploads/${uploadId}`);
+                    const status = await response.json();
+                    if (!response.ok) return finish(reject, new Error(status.error || 'Upload não encontrado'));
+                    if (status.status === 'done' || status.status === 'failed') return finish(resolve, status);
+                    timer = setTimeout(check, interval);
+                } catch (error) {
+                    timer = setTimeout(check, interval);
+                } finally {
+                    checking = false;
+                }
+            };
+            
+            this.uploadWaiters.set(uploadId, check);
+            check();
+        });
+    }
+    
+    async saveRecurringActivity(rrule) {
+        // One rule for the whole series; occurrences are generated per calendar window
+        const until = document.getElementById('activityRecurrenceUntil').value;
+        const ruleData = {
+            activity: document.getElementById('activityName').value,
+            category: document.getElementById('activityCategory').value,
+            dtstart: document.getElementById('activityDate').value,
+            time_start: document.getElementById('activityStartTime').value || '09:00',
+            time_end: document.getElementById('activityEndTime').value || '10:00',
+            description: document.getElementById('activityDescription').value,
+            location: document.getElementById('activityLocation').value,
+            rrule: rrule,
+            until: until || null
+        };
+        
+        const response = await fetch('/admin/api/routine-rules', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(ruleData)
+        });
+        const result = await response.json();
+        
+        if (response.ok) {
+            this.showSuccessMessage('Atividade recorrente criada com sucesso!');
+            bootstrap.Modal.getInstance(document.getElementById('activityModal')).hide();
+            this.refreshRecurringViews();
+        } else {
+            this.showErrorMessage(this.getErrorMessage(result.error || 'Erro desconhecido'));
+        }
+    }
+    
     showErrorMessage(message) {
         // Create or update error alert
         let alertDiv = document.getElementById('errorAlert');
@@ -926,16 +1555,16 @@ class AdminManager {
             return;
         }
         
+        const activityId = this.currentActivity.id;
         try {
-            const response = await fetch(`/admin/api/activities/${this.currentActivity.id}`, {
+            const response = await fetch(`/admin/api/activities/${activityId}`, {
                 method: 'DELETE'
             });
             
             if (response.ok) {
                 this.showAlert('Atividade excluída com sucesso', 'success');
                 bootstrap.Modal.getInstance(document.getElementById('activityModal')).hide();
-                this.calendar.refetchEvents();
-                this.loadTodayActivities();
+                this.refreshAfterDelete(activityId);
             }
         } catch (error) {
             console.error('Error deleting activity:', error);
@@ -943,6 +1572,15 @@ class AdminManager {
         }
     }
 
+    refreshAfterDelete(activityId) {
+        // Occurrence ids ('<rule>:<date>') are not in the change feed
+        if (String(activityId).includes(':')) {
+            this.refreshRecurringViews();
+        } else {
+            this.syncChanges();
+        }
+    }
+
     async deleteActivityById(activityId) {
         try {
             const response = await fetch(`/admin/api/activities/${activityId}`, {
@@ -953,9 +1591,7 @@ class AdminManager {
             
             if (response.ok) {
                 this.showAlert('Atividade excluída com sucesso!', 'success');
-                if (this.calendar) this.calendar.refetchEvents();
-                this.loadTodayActivities();
-                this.loadActivitiesList();
+                this.refreshAfterDelete(activityId);
             } else {
                 this.showAlert('Erro ao excluir atividade: ' + (result.error || 'Erro desconhecido'), 'danger');
             }
@@ -975,6 +1611,7 @@ class AdminManager {
             }
             const activities = await response.json();
             
+            this.todayActivityIds = new Set(activities.map(activity => activity.id));
             this.renderTodayActivities(activities);
         } catch (error) {
             console.error('Error loading today activities:', error);
@@ -1011,6 +1648,7 @@ class AdminManager {
                     <span class="badge bg-success" style="font-size: 11px;">${activity.status || 'upcoming'}</span>
                     ${activity.has_images ? '<i data-lucide="image" style="width: 14px; height: 14px;"></i>' : ''}
                     ${activity.has_videos ? '<i data-lucide="video" style="width: 14px; height: 14px;"></i>' : ''}
+                    ${activity.recurring ? '<i data-lucide="repeat" style="width: 14px; height: 14px;"></i>' : ''}
                 </div>
             </div>
         `).join('');
@@ -1061,6 +1699,9 @@ class AdminManager {
         this.existingMedia = [];
         this.currentActivity = null;
         
+        // Repetition is chosen when creating; existing activities and occurrences are edited one by one
+        const recurrenceRow = document.getElementById('activityRecurrenceRow');
+        if (recurrenceRow) recurrenceRow.style.display = 'grid';
 
     }
 
@@ -1174,6 +1815,7 @@ class AdminManager {
     }
 
     renderMemories(memories) {
+        this.memories = memories;
         const container = document.getElementById('memories-list');
         container.innerHTML = '';
         
@@ -1276,7 +1918,7 @@ class AdminManager {
             
             if (result.success) {
                 bootstrap.Modal.getInstance(document.getElementById('memoryModal')).hide();
-                this.loadMemories();
+                if (!this.isStreaming()) this.loadMemories();
             } else {
                 alert('Erro ao salvar memória: ' + result.error);
             }
@@ -1311,6 +1953,7 @@ class AdminManager {
     }
 
     renderImages(images) {
+        this.images = images;
         const container = document.getElementById('images-list');
         container.innerHTML = '';
         
@@ -1322,7 +1965,7 @@ class AdminManager {
             imageCard.className = 'col-md-6 col-lg-4 mb-4';
             imageCard.innerHTML = `
                 <div class="card">
-                    <img src="${image.image_url}" class="card-img-top" style="height: 200px; object-fit: cover;" alt="${image.name}">
+                    <img src="${image.thumbnail_url || image.image_url}" class="card-img-top" style="height: 200px; object-fit: cover;" alt="${image.name}">
                     <div class="card-body">
                         <h6 class="card-title">${image.name}</h6>
                         <p class="card-text text-muted small">${image.description}</p>
@@ -1429,7 +2072,7 @@ class AdminManager {
             
             if (result.success) {
                 bootstrap.Modal.getInstance(document.getElementById('imageModal')).hide();
-                this.loadImages();
+                if (!this.isStreaming()) this.loadImages();
             } else {
                 alert('Erro ao salvar imagem: ' + result.error);
             }
@@ -1474,7 +2117,7 @@ class AdminManager {
             const result = await response.json();
             
             if (result.success) {
-                this.loadMemories();
+                if (!this.isStreaming()) this.loadMemories();
             } else {
                 alert('Erro ao excluir memória: ' + result.error);
             }
@@ -1498,7 +2141,7 @@ class AdminManager {
             const result = await response.json();
             
             if (result.success) {
-                this.loadImages();
+                if (!this.isStreaming()) this.loadImages();
             } else {
                 alert('Erro ao excluir imagem: ' + result.error);
             }
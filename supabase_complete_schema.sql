@@ -4,6 +4,7 @@
 
 -- Habilitar extensões necessárias
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm; -- Buscas ILIKE '%termo%' (veja query_paths.py)
 
 -- =====================================================
 -- 1. TABELA: routine (Rotinas/Atividades)
@@ -41,6 +42,8 @@ CREATE TABLE public.routine_media (
     media_type TEXT NOT NULL DEFAULT 'image',
     media_url TEXT NOT NULL,
     media_caption TEXT NULL,
+    thumbnail_url TEXT NULL,
+    preview_url TEXT NULL,
     created_at TIMESTAMP WITH TIME ZONE NULL DEFAULT NOW(),
     CONSTRAINT routine_media_pkey PRIMARY KEY (id),
     CONSTRAINT routine_media_routine_id_fkey FOREIGN KEY (routine_id) REFERENCES routine (id) ON DELETE CASCADE,
@@ -98,6 +101,7 @@ CREATE TABLE public.messages (
 CREATE INDEX IF NOT EXISTS idx_messages_chat_session_id ON public.messages USING btree (chat_session_id);
 CREATE INDEX IF NOT EXISTS idx_messages_created_at ON public.messages USING btree (created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_messages_sender_phone ON public.messages USING btree (sender_phone);
+CREATE INDEX IF NOT EXISTS ix_messages_content_trgm ON public.messages USING GIN (content gin_trgm_ops);
 
 -- =====================================================
 -- 5. TABELA: agents (Configurações dos Agentes)
@@ -227,6 +231,7 @@ CREATE INDEX IF NOT EXISTS idx_memories_category ON public.memories USING btree
 CREATE INDEX IF NOT EXISTS idx_memories_is_active ON public.memories USING btree (is_active);
 CREATE INDEX IF NOT EXISTS idx_memories_importance ON public.memories USING btree (importance_level DESC);
 CREATE INDEX IF NOT EXISTS idx_memories_date ON public.memories USING btree (date_referenced DESC);
+CREATE INDEX IF NOT EXISTS ix_memories_content_trgm ON public.memories USING GIN (content gin_trgm_ops);
 
 -- =====================================================
 -- 10. TABELA: image_bank (Banco de Imagens)
@@ -236,6 +241,8 @@ CREATE TABLE public.image_bank (
     title TEXT NOT NULL,
     description TEXT NULL,
     image_url TEXT NOT NULL,
+    thumbnail_url TEXT NULL,
+    preview_url TEXT NULL,
     category TEXT NULL DEFAULT 'geral',
     tags TEXT[] NULL,
     is_active BOOLEAN DEFAULT TRUE,
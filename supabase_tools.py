@@ -37,17 +37,33 @@ def get_routines(days: int,
         start_date = end_date - timedelta(days=days)
         current_time = datetime.now().time()
 
-        query = supabase.table('routine').select('*').gte(
-            'date',
-            start_date.isoformat()).lte('date', end_date.isoformat()).order(
-                'date', desc=True).order('time_start', desc=False)
-
-        if activity_filter:
-            query = query.ilike('activity', f'%{activity_filter}%')
-
-        response = query.execute()
-
-        activities = response.data
+        # Both branches read the local routine table (the one recurring routines, change
+        # tracking and the media counts live in): ranked full-text search with a filter,
+        # the whole period without one
+        from routine_search import search_routines
+        activities = [{
+            **routine,
+            'time_start': f"{routine['time_start']}:00" if routine['time_start'] else '00:00:00',
+            'time_end': f"{routine['time_end']}:00" if routine['time_end'] else '23:59:59'
+        } for routine in search_routines(activity_filter, limit=100 if activity_filter else 1000,
+                                         date_from=start_date, date_to=end_date)]
+        if not activity_filter:
+            activities.sort(key=lambda activity: activity['date'], reverse=True)
+
+        # Recurring routines are not stored per day: expand them for the period
+        try:
+            from routine_recurrence import expand_occurrences, occurrence_to_dict
+            occurrences = [{
+                **occurrence,
+                'time_start': f"{occurrence['time_start']}:00",
+                'time_end': f"{occurrence['time_end']}:00"
+            } for occurrence in map(occurrence_to_dict, expand_occurrences(
+                start_date, end_date, search=activity_filter))]
+            if occurrences:
+                activities = sorted(activities + occurrences, key=lambda activity: activity['time_start'])
+                activities.sort(key=lambda activity: activity['date'], reverse=True)
+        except Exception as e:
+            logging.error(f"Error expanding recurring routines: {e}")
 
         # Update status based on current time for today's activities
         today = datetime.now().date()
@@ -139,11 +155,15 @@ def get_routine_media(routine_id: Optional[str],
 
         media_items = response.data
 
+        # Images point at the smallest derivative that still looks good in a chat
+        from media_derivatives import smallest_variant, CHAT_IMAGE_SIZE
+
         formatted_media = []
         for item in media_items:
             routine_info = item.get('routine', {})
             formatted_media.append({
-                'media_url': item['media_url'],
+                'media_url': smallest_variant(item, CHAT_IMAGE_SIZE),
+                'url_original': item['media_url'],
                 'tipo': item['media_type'],
                 'descricao': item.get('description'),
                 'atividade': routine_info.get('activity'),
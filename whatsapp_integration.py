@@ -6,10 +6,18 @@ Sistema completo de integração WhatsApp com Anna Agent
 import requests
 import logging
 import json
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import re
+import queue
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+from datetime import datetime, timedelta
 import os
-from anna_agent import create_anna_agent
+import time
+from conversation_pipeline import conversation_pipeline
+from event_stream import EventBroadcaster
 
 class EvolutionAPIClient:
     """Cliente para interação com Evolution API v2"""
@@ -132,6 +140,26 @@ class EvolutionAPIClient:
             logging.error(f"Erro ao enviar mídia: {e}")
             raise
     
+    def send_presence(self, phone_number: str, presence: str = "composing", delay: int = 1200) -> Dict[str, Any]:
+        """Envia status de presença (ex.: "digitando...")"""
+        url = f"{self.base_url}/chat/sendPresence/{self.instance_name}"
+        
+        clean_number = ''.join(filter(str.isdigit, phone_number))
+        
+        payload = {
+            "number": clean_number,
+            "presence": presence,
+            "delay": delay
+        }
+        
+        try:
+            response = requests.post(url, json=payload, headers=self.headers)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Erro ao enviar presença: {e}")
+            raise
+    
     def setup_webhook(self, webhook_url: str) -> Dict[str, Any]:
         """Configura webhook para receber eventos"""
         url = f"{self.base_url}/webhook/set/{self.instance_name}"
@@ -158,24 +186,266 @@ class EvolutionAPIClient:
             logging.error(f"Erro ao configurar webhook: {e}")
             raise
 
-class WhatsAppMessageProcessor:
-    """Processador de mensagens WhatsApp com Anna Agent"""
+# Limite prático de uma mensagem de texto no WhatsApp
+WHATSAPP_MAX_CHUNK = 3900
+# Reivindicação 'processing' mais antiga que isso pertence a um worker que morreu no meio do turno
+CLAIM_TIMEOUT = int(os.getenv('WHATSAPP_CLAIM_TIMEOUT', '300'))
+# Tentativas de um turno antes de responder com a mensagem de erro
+MAX_TURN_ATTEMPTS = 3
+TURN_ERROR_REPLY = "Ops! Tive um problema para processar sua mensagem. Pode tentar de novo?"
+SENTENCE_END = re.compile(r'[.!?…](?=\s)')
+
+def split_reply_chunks(text: str, min_chars: int, max_chars: int = WHATSAPP_MAX_CHUNK,
+                       final: bool = False) -> Tuple[List[str], str]:
+    """Divide o texto em blocos prontos para envio em limites de parágrafo ou frase
     
-    def __init__(self, evolution_client: EvolutionAPIClient):
+    Retorna (blocos, resto). O resto ainda não tem um limite natural e aguarda mais
+    texto; com final=True tudo é devolvido em blocos.
+    """
+    chunks = []
+    while text:
+        window = text[:max_chars]
+        cut = -1
+        
+        paragraph = window.rfind('\n\n')
+        if paragraph >= min_chars:
+            cut = paragraph + 2
+        else:
+            sentences = [m.end() for m in SENTENCE_END.finditer(window) if m.end() >= min_chars]
+            if sentences:
+                cut = sentences[-1]
+        
+        if cut < 0:
+            if len(text) > max_chars:
+                space = window.rfind(' ')
+                cut = space + 1 if space > 0 else max_chars
+            elif final:
+                cut = len(text)
+            else:
+                break
+        
+        chunk = text[:cut].strip()
+        if chunk:
+            chunks.append(chunk)
+        text = text[cut:].lstrip() if cut < len(text) else ''
+    
+    return chunks, text
+
+class ProgressiveReplySender:
+    """Envia a resposta da Anna em blocos à medida que o modelo gera o texto
+    
+    O texto parcial é acumulado e cortado em limites de parágrafo/frase; os blocos são
+    enviados em ordem por uma thread própria, com presença "digitando" entre eles, para
+    que o envio não atrase a geração.
+    """
+    
+    def __init__(self, evolution_client: EvolutionAPIClient, phone_number: str,
+                 first_chunk_chars: int = 40, chunk_chars: int = 400):
         self.evolution_client = evolution_client
-        self.anna_agent = None
-        self.initialize_anna()
+        self.phone_number = phone_number
+        self.first_chunk_chars = first_chunk_chars
+        self.chunk_chars = chunk_chars
+        self.buffer = ''
+        self.chunks_sent = 0
+        self._queued = 0
+        self._done = False
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._send_loop, daemon=True)
+        self._worker.start()
+    
+    def _send_loop(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            try:
+                self.evolution_client.send_text_message(self.phone_number, chunk)
+                self.chunks_sent += 1
+                # Ainda há texto por vir: mostrar "digitando..." até o próximo bloco
+                if not self._done or self._queue.qsize() > 1:
+                    self.evolution_client.send_presence(self.phone_number, "composing")
+            except Exception as e:
+                logging.error(f"Erro ao enviar bloco da resposta: {e}")
+            finally:
+                self._queue.task_done()
+    
+    def _enqueue(self, chunks: List[str]):
+        for chunk in chunks:
+            self._queued += 1
+            self._queue.put(chunk)
+    
+    def feed(self, text: str):
+        """Recebe um trecho parcial da resposta e enfileira os blocos completos"""
+        self.buffer += text
+        min_chars = self.first_chunk_chars if self._queued == 0 else self.chunk_chars
+        chunks, self.buffer = split_reply_chunks(self.buffer, min_chars)
+        self._enqueue(chunks)
+    
+    def finish(self, full_response: Optional[str] = None) -> int:
+        """Envia o restante e aguarda a entrega; retorna o número de blocos enviados
+        
+        Se nada foi transmitido em streaming (ex.: falha do modelo), a resposta completa
+        é enviada em blocos.
+        """
+        if self._queued == 0 and not self.buffer and full_response:
+            self.buffer = full_response
+        chunks, self.buffer = split_reply_chunks(self.buffer, self.chunk_chars, final=True)
+        self._enqueue(chunks)
+        self._done = True
+        self._queue.put(None)
+        self._worker.join()
+        return self.chunks_sent
+    
+    def abort(self):
+        """Descarta o texto ainda não enviado e encerra a thread de envio (turno que falhou)"""
+        self.buffer = ''
+        self._done = True
+        self._queue.put(None)
+        self._worker.join()
+
+class WhatsAppTurnError(Exception):
+    """Turno que não terminou; o webhook responde com erro para a Evolution API reenviar"""
+
+class WebhookDeduplicator:
+    """Deduplicação de webhooks reenviados pela Evolution API
+    
+    A chave de uma mensagem é (instance, remoteJid, key.id). Cada mensagem passa de
+    'processing' a 'done' quando o turno termina, ou a 'failed' quando ele falha, e
+    então o reenvio da Evolution API é processado de novo. Uma reivindicação
+    'processing' mais antiga que claim_timeout (worker que morreu no meio do turno)
+    também pode ser retomada. Um LRU limitado em memória responde sem tocar o banco;
+    a tabela whatsapp_inbound_events (UNIQUE na mesma chave) vale entre workers e
+    reinícios.
+    """
+    
+    CLAIMED = 'claimed'
+    DUPLICATE = 'duplicate'  # Já respondida
+    IN_PROGRESS = 'in_progress'  # Outro turno está cuidando dela
+    
+    def __init__(self, max_keys: int = 10000, claim_timeout: int = CLAIM_TIMEOUT):
+        self.max_keys = max_keys
+        self.claim_timeout = claim_timeout
+        # chave -> [status, tentativas]
+        self._seen: "OrderedDict[Tuple[str, str, str], List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _remember(self, key: Tuple[str, str, str], status: str, attempts: int):
+        with self._lock:
+            self._seen[key] = [status, attempts]
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_keys:
+                self._seen.popitem(last=False)
+    
+    def _claim_in_memory(self, key: Tuple[str, str, str]) -> Tuple[str, int]:
+        """Reivindicação só com o LRU local; usada antes do banco e quando ele falha"""
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry and entry[0] == 'done':
+                return self.DUPLICATE, entry[1]
+            if entry and entry[0] == 'processing':
+                return self.IN_PROGRESS, entry[1]
+            attempts = entry[1] + 1 if entry else 1
+        self._remember(key, 'processing', attempts)
+        return self.CLAIMED, attempts
+    
+    def claim(self, instance: str, remote_jid: str, message_id: str) -> Tuple[str, int]:
+        """Reivindica o processamento da mensagem; retorna (resultado, número da tentativa)"""
+        if not message_id:
+            return self.CLAIMED, 1
+        
+        key = (instance or '', remote_jid or '', message_id)
+        result, attempts = self._claim_in_memory(key)
+        if result != self.CLAIMED:
+            logging.info(f"Webhook duplicado ignorado (memória, {result}): {message_id}")
+            return result, attempts
+        
+        try:
+            from supabase_tools import supabase
+            
+            now = datetime.utcnow()
+            table = supabase.table('whatsapp_inbound_events')
+            response = table.upsert({
+                'instance_name': key[0],
+                'remote_jid': key[1],
+                'message_id': key[2],
+                'received_at': now.isoformat(),
+                'claimed_at': now.isoformat(),
+                'status': 'processing',
+                'attempts': 1
+            }, on_conflict='instance_name,remote_jid,message_id', ignore_duplicates=True).execute()
+            if response.data:
+                self._remember(key, 'processing', 1)
+                return self.CLAIMED, 1
+            
+            rows = table.select('status, attempts').eq('instance_name', key[0]).eq(
+                'remote_jid', key[1]).eq('message_id', key[2]).limit(1).execute().data
+            status, attempts = (rows[0]['status'], rows[0]['attempts']) if rows else ('failed', 0)
+            if status != 'done':
+                # Falhou, ou ficou parada em 'processing': só um worker retoma (attempts não mudou)
+                cutoff = (now - timedelta(seconds=self.claim_timeout)).isoformat()
+                taken = table.update({
+                    'status': 'processing',
+                    'claimed_at': now.isoformat(),
+                    'attempts': attempts + 1
+                }).eq('instance_name', key[0]).eq('remote_jid', key[1]).eq('message_id', key[2]).eq(
+                    'attempts', attempts).or_(f"status.eq.failed,claimed_at.lt.{cutoff}").execute().data
+                if taken:
+                    self._remember(key, 'processing', attempts + 1)
+                    return self.CLAIMED, attempts + 1
+            
+            if status == 'done':
+                result = self.DUPLICATE
+                self._remember(key, 'done', attempts)
+            else:
+                # Estado de outro worker: o próximo reenvio consulta o banco de novo
+                result = self.IN_PROGRESS
+                with self._lock:
+                    self._seen.pop(key, None)
+            logging.info(f"Webhook duplicado ignorado (banco, {result}): {message_id}")
+            return result, attempts
+        except Exception as e:
+            # Sem o banco, a deduplicação em memória continua valendo
+            logging.error(f"Erro ao registrar evento recebido: {e}")
+            return self.CLAIMED, attempts
     
-    def initialize_anna(self):
-        """Inicializa o agente Anna"""
+    def _finish(self, instance: str, remote_jid: str, message_id: str, status: str):
+        if not message_id:
+            return
+        key = (instance or '', remote_jid or '', message_id)
+        with self._lock:
+            attempts = self._seen[key][1] if key in self._seen else 1
+        self._remember(key, status, attempts)
         try:
-            self.anna_agent = create_anna_agent()
-            logging.info("Anna agent inicializada para WhatsApp")
+            from supabase_tools import supabase
+            
+            supabase.table('whatsapp_inbound_events').update({'status': status}).eq(
+                'instance_name', key[0]).eq('remote_jid', key[1]).eq('message_id', key[2]).execute()
         except Exception as e:
-            logging.error(f"Erro ao inicializar Anna: {e}")
+            logging.error(f"Erro ao marcar evento recebido como {status}: {e}")
+    
+    def complete(self, instance: str, remote_jid: str, message_id: str):
+        """Marca a mensagem como respondida: reenvios passam a ser descartados"""
+        self._finish(instance, remote_jid, message_id, 'done')
+    
+    def release(self, instance: str, remote_jid: str, message_id: str):
+        """Libera a mensagem depois de um turno que falhou, para o reenvio ser processado"""
+        self._finish(instance, remote_jid, message_id, 'failed')
+
+class WhatsAppMessageProcessor:
+    """Processador de mensagens WhatsApp com Anna Agent"""
+    
+    def __init__(self, evolution_client: EvolutionAPIClient):
+        self.evolution_client = evolution_client
+        self.deduplicator = WebhookDeduplicator()
+        # Entrega progressiva: envia a resposta em blocos enquanto o modelo gera o texto
+        self.progressive_delivery = os.getenv('WHATSAPP_PROGRESSIVE_DELIVERY', 'true').lower() == 'true'
     
     def process_incoming_message(self, webhook_data: Dict[str, Any]) -> Optional[str]:
-        """Processa mensagem recebida via webhook"""
+        """Processa mensagem recebida via webhook
+        
+        Levanta WhatsAppTurnError quando a mensagem deve ser reenviada: o turno falhou
+        (antes da última tentativa) ou outro worker ainda está processando a mensagem.
+        """
         try:
             event_type = webhook_data.get('event')
             
@@ -184,30 +454,50 @@ class WhatsAppMessageProcessor:
             
             data = webhook_data.get('data', {})
             messages = data.get('messages', [])
+            instance = webhook_data.get('instance') or self.evolution_client.instance_name
             
             for message in messages:
+                key = message.get('key', {})
+                
                 # Ignorar mensagens próprias
-                if message.get('key', {}).get('fromMe'):
+                if key.get('fromMe'):
+                    continue
+                
+                # Ignorar reenvios do mesmo evento antes de qualquer processamento
+                message_key = (instance, key.get('remoteJid'), key.get('id'))
+                claim, attempt = self.deduplicator.claim(*message_key)
+                if claim == WebhookDeduplicator.IN_PROGRESS:
+                    raise WhatsAppTurnError(f"Mensagem {key.get('id')} ainda em processamento")
+                if claim != WebhookDeduplicator.CLAIMED:
                     continue
                 
                 phone_number = self.extract_phone_number(message)
                 message_text = self.extract_message_text(message)
                 
                 if not message_text or not phone_number:
+                    self.deduplicator.complete(*message_key)
                     continue
                 
-                # Processar com Anna
-                response = self.get_anna_response(message_text, phone_number)
-                
-                if response:
-                    # Enviar resposta
-                    self.evolution_client.send_text_message(phone_number, response)
-                    
-                    # Salvar conversa
-                    self.save_conversation(phone_number, message_text, response)
+                # Processar com Anna (sessão, histórico e gravação no pipeline compartilhado)
+                try:
+                    response = self.answer(message_text, phone_number, message.get('pushName'))
+                except Exception as e:
+                    if attempt < MAX_TURN_ATTEMPTS:
+                        # Sem resposta ao contato: o reenvio da Evolution API tenta de novo
+                        self.deduplicator.release(*message_key)
+                        raise WhatsAppTurnError(f"Turno falhou (tentativa {attempt}): {e}") from e
+                    logging.error(f"Turno falhou na última tentativa ({attempt}): {e}")
+                    response = TURN_ERROR_REPLY
+                    try:
+                        self.evolution_client.send_text_message(phone_number, response)
+                    except Exception as send_error:
+                        logging.error(f"Erro ao enviar aviso de falha para {phone_number}: {send_error}")
                 
+                self.deduplicator.complete(*message_key)
                 return response
                 
+        except WhatsAppTurnError:
+            raise
         except Exception as e:
             logging.error(f"Erro ao processar mensagem: {e}")
             return None
@@ -248,97 +538,357 @@ class WhatsAppMessageProcessor:
             logging.error(f"Erro ao extrair texto: {e}")
             return None
     
-    def get_anna_response(self, message: str, phone_number: str) -> Optional[str]:
-        """Obtém resposta da Anna para a mensagem"""
+    def answer(self, message: str, phone_number: str, contact_name: Optional[str] = None) -> Optional[str]:
+        """Gera e envia a resposta da Anna (em streaming ou de uma vez); levanta se o turno falhar"""
+        if self.progressive_delivery:
+            return self.deliver_progressive_response(message, phone_number, contact_name)
+        
+        response = self.get_anna_response(message, phone_number, contact_name)
+        if response:
+            # Enviar resposta em blocos do tamanho permitido pelo WhatsApp
+            chunks, _ = split_reply_chunks(response, WHATSAPP_MAX_CHUNK // 2, final=True)
+            for chunk in chunks:
+                self.evolution_client.send_text_message(phone_number, chunk)
+        return response
+    
+    def deliver_progressive_response(self, message: str, phone_number: str,
+                                     contact_name: Optional[str] = None) -> Optional[str]:
+        """Gera a resposta da Anna em streaming e a envia em blocos conforme é produzida"""
         try:
-            if not self.anna_agent:
-                self.initialize_anna()
-            
-            if not self.anna_agent:
-                return "Desculpe, estou com problemas técnicos no momento. Tente novamente em alguns minutos."
-            
-            # Adicionar contexto do WhatsApp
-            contextual_message = f"[WhatsApp - {phone_number}] {message}"
-            
-            # Processar com Anna usando o método correto
-            import asyncio
-            from google.adk.runners import Runner
-            from google.adk.sessions import InMemorySessionService
-            
-            # Executar agent de forma assíncrona
-            async def run_agent():
-                session_service = InMemorySessionService()
-                session = await session_service.create_session(
-                    app_name="whatsapp_anna", 
-                    user_id=phone_number, 
-                    session_id=f"whatsapp_{phone_number}"
-                )
-                
-                runner = Runner(agent=self.anna_agent, session=session)
-                response = await runner.run(contextual_message)
-                return response.get('response', 'Não consegui processar sua mensagem.')
-            
-            # Executar de forma síncrona
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                response = loop.run_until_complete(run_agent())
-            finally:
-                loop.close()
-            
-            # Limitar tamanho da resposta (WhatsApp tem limite)
-            if response and len(response) > 4000:
-                response = response[:3900] + "...\n\n(mensagem truncada)"
-            
-            return response or "Ops! Não consegui processar sua mensagem."
-            
+            self.evolution_client.send_presence(phone_number, "composing")
+        except Exception:
+            pass  # Presença é apenas indicativa
+        
+        sender = ProgressiveReplySender(self.evolution_client, phone_number)
+        try:
+            response = self.get_anna_response(message, phone_number, contact_name, on_partial=sender.feed)
+        except Exception:
+            sender.abort()
+            raise
+        chunks_sent = sender.finish(response)
+        logging.info(f"Resposta enviada para {phone_number} em {chunks_sent} blocos")
+        return response
+    
+    def get_anna_response(self, message: str, phone_number: str, contact_name: Optional[str] = None,
+                          on_partial=None) -> Optional[str]:
+        """Obtém resposta da Anna pelo mesmo pipeline de sessão e histórico do /chat
+        
+        Erros do turno são registrados e propagados, para a mensagem poder ser reprocessada.
+        """
+        try:
+            result = conversation_pipeline.run_turn(
+                user_message=message,
+                contact_phone=phone_number,
+                contact_name=contact_name or phone_number,
+                channel='whatsapp',
+                on_partial=on_partial
+            )
         except Exception as e:
             logging.error(f"Erro ao obter resposta da Anna: {e}")
-            return "Ops! Tive um problema para processar sua mensagem. Pode tentar de novo?"
+            raise
+        
+        return result.get('response') or "Ops! Não consegui processar sua mensagem."
+
+class WhatsAppConnectionCache:
+    """Cache em memória do status da conexão e do último QR Code
+    
+    Atualizado pelos eventos CONNECTION_UPDATE/QRCODE_UPDATED do webhook e por um
+    poller em segundo plano que só consulta a Evolution API quando o estado fica
+    desatualizado. Os endpoints de admin leem daqui, e as mudanças são publicadas
+    em `events` para o SSE da página de configuração. Com `channel`, os eventos
+    passam pelo event_log e o estado chega aos caches dos outros workers.
+    """
+    
+    # Intervalo mínimo entre consultas pedidas pelo endpoint de QR Code (sem QR em cache)
+    QR_REFRESH_MIN_SECONDS = 5
     
-    def save_conversation(self, phone_number: str, user_message: str, anna_response: str):
-        """Salva conversa no banco de dados"""
+    def __init__(self, poll_interval: int = 30, channel: Optional[str] = None):
+        self.poll_interval = poll_interval
+        self.evolution_client: Optional[EvolutionAPIClient] = None
+        self.events = EventBroadcaster(history=50, channel=channel)
+        self.events.subscribe(self._apply_event)
+        self.state: Dict[str, Any] = {'status': 'not_configured', 'qr_code': None, 'updated_at': None}
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+    
+    def attach(self, evolution_client: Optional[EvolutionAPIClient]):
+        """Associa o cliente Evolution e força uma nova leitura do estado
+        
+        Não publica evento: o estado inicial ('unknown') não deve sobrescrever o que
+        outros workers já sabem, e o cache é criado antes de qualquer cliente SSE.
+        """
+        self.evolution_client = evolution_client
+        self._last_refresh = 0.0
+        with self._lock:
+            self.state = {'status': 'unknown' if evolution_client else 'not_configured', 'qr_code': None, 'updated_at': None}
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.state)
+    
+    def update(self, **fields):
+        """Atualiza o estado e publica o evento apenas se algo mudou"""
+        with self._lock:
+            changed = {k: v for k, v in fields.items() if self.state.get(k) != v}
+            if not changed:
+                return
+            self.state.update(changed)
+            # QR Code deixa de ser útil quando a conexão abre
+            if self.state.get('status') == 'open':
+                self.state['qr_code'] = None
+            self.state['updated_at'] = datetime.utcnow().isoformat()
+            state = dict(self.state)
+        self.events.publish('whatsapp_status', state)
+    
+    def _apply_event(self, event_type: str, data: Dict[str, Any]):
+        """Ouvinte de `events`: adota o estado publicado por outro worker, se mais recente"""
+        if event_type != 'whatsapp_status':
+            return
+        with self._lock:
+            if (data.get('updated_at') or '') > (self.state.get('updated_at') or ''):
+                self.state = dict(data)
+                self._last_refresh = time.monotonic()
+    
+    def handle_webhook_event(self, webhook_data: Dict[str, Any]) -> bool:
+        """Consome eventos de conexão/QR Code do webhook; retorna True se tratado"""
+        event_type = (webhook_data.get('event') or '').lower().replace('_', '.')
+        data = webhook_data.get('data') or {}
+        
+        if event_type == 'connection.update':
+            self.update(status=data.get('state') or data.get('status') or 'unknown')
+            self._last_refresh = time.monotonic()
+            return True
+        
+        if event_type == 'qrcode.updated':
+            qrcode = data.get('qrcode') or {}
+            base64_data = qrcode.get('base64') if isinstance(qrcode, dict) else None
+            if base64_data:
+                self.update(qr_code=base64_data, status='connecting')
+                self._last_refresh = time.monotonic()
+            return True
+        
+        return False
+    
+    def refresh(self, max_age: Optional[float] = None):
+        """Consulta a Evolution API se o estado em cache tiver mais de max_age segundos
+        
+        max_age padrão é o intervalo do poller. Chamadas simultâneas não se somam:
+        enquanto uma consulta está em andamento, as demais retornam sem esperar.
+        """
+        client = self.evolution_client
+        if not client:
+            return
+        if max_age is None:
+            max_age = self.poll_interval
+        if time.monotonic() - self._last_refresh < max_age:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        
         try:
-            from supabase_tools import supabase
-            
-            conversation_data = {
-                'phone_number': phone_number,
-                'user_message': user_message,
-                'anna_response': anna_response,
-                'created_at': datetime.utcnow().isoformat(),
-                'platform': 'whatsapp'
-            }
-            
-            supabase.table('whatsapp_conversations').insert(conversation_data).execute()
-            logging.info(f"Conversa salva: {phone_number}")
+            self._last_refresh = time.monotonic()
+            result = client.check_connection_status()
+            instance = result.get('instance', result)
+            status = instance.get('state') or instance.get('status') or 'unknown'
+            self.update(status=status, error=None)
             
+            # Sem webhook de QRCODE_UPDATED o QR Code expira; renova a cada ciclo
+            if status != 'open':
+                qr_result = client.get_qr_code()
+                if qr_result.get('base64'):
+                    self.update(qr_code=qr_result['base64'])
         except Exception as e:
-            logging.error(f"Erro ao salvar conversa: {e}")
+            self.update(status='error', error=str(e))
+        finally:
+            self._refresh_lock.release()
+    
+    def ensure_poller(self):
+        """Inicia o poller em segundo plano (uma vez por processo)"""
+        if self._poller and self._poller.is_alive():
+            return
+        self.events.connect()
+        with self._lock:
+            if self._poller and self._poller.is_alive():
+                return
+            self._poller = threading.Thread(target=self._poll_loop, daemon=True, name='whatsapp-status-poller')
+            self._poller.start()
+    
+    def _poll_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Erro no poller de status WhatsApp: {e}")
+            time.sleep(self.poll_interval)
+
+class WhatsAppInstance:
+    """Uma instância (número) da Evolution API com processador, cache de status e estatísticas"""
+    
+    def __init__(self, evolution_client: EvolutionAPIClient, poll_interval: int = 30):
+        self.name = evolution_client.instance_name
+        self.evolution_client = evolution_client
+        self.message_processor = WhatsAppMessageProcessor(evolution_client)
+        self.connection_cache = WhatsAppConnectionCache(poll_interval=poll_interval, channel=f"whatsapp:{self.name}")
+        self.connection_cache.attach(evolution_client)
+        self.stats = {
+            'webhooks_received': 0,
+            'messages_replied': 0,
+            'messages_sent': 0,
+            'errors': 0,
+            'total_processing_ms': 0.0,
+            'last_activity': None
+        }
+        self._stats_lock = threading.Lock()
+    
+    def record(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+            self.stats['last_activity'] = datetime.utcnow().isoformat()
+    
+    def is_healthy(self) -> bool:
+        return self.connection_cache.snapshot().get('status') in ('open', 'unknown')
+    
+    def describe(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        replied = stats['messages_replied']
+        stats['avg_processing_ms'] = round(stats.pop('total_processing_ms') / replied, 1) if replied else None
+        state = self.connection_cache.snapshot()
+        return {
+            'instance_name': self.name,
+            'status': state.get('status'),
+            'healthy': self.is_healthy(),
+            'updated_at': state.get('updated_at'),
+            'stats': stats
+        }
+
+class ConsistentHashRing:
+    """Anel de hash consistente (com nós virtuais) para distribuir contatos entre instâncias"""
+    
+    def __init__(self, replicas: int = 100):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._nodes: Dict[int, str] = {}
+    
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+    
+    def add(self, node: str):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if h not in self._nodes:
+                bisect.insort(self._keys, h)
+                self._nodes[h] = node
+    
+    def remove(self, node: str):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if self._nodes.get(h) == node:
+                del self._nodes[h]
+                self._keys.remove(h)
+    
+    def lookup(self, key: str, accept=None) -> Optional[str]:
+        """Primeiro nó no sentido horário a partir da chave que satisfaz `accept`"""
+        if not self._keys:
+            return None
+        start = bisect.bisect(self._keys, self._hash(key))
+        seen = set()
+        for offset in range(len(self._keys)):
+            node = self._nodes[self._keys[(start + offset) % len(self._keys)]]
+            if node in seen:
+                continue
+            seen.add(node)
+            if accept is None or accept(node):
+                return node
+        return None
 
 class WhatsAppIntegrationManager:
-    """Gerenciador principal da integração WhatsApp"""
+    """Gerenciador principal da integração WhatsApp
+    
+    Mantém um registro de instâncias (números) da Evolution API. Webhooks são
+    roteados pelo nome da instância; envios vão para a instância dona da conversa
+    e contatos novos são distribuídos por hash consistente entre as instâncias
+    saudáveis. A dona de cada conversa fica na tabela whatsapp_conversation_owners,
+    compartilhada entre workers e reinícios; o mapa em memória só é usado quando o
+    banco não responde.
+    """
     
-    def __init__(self):
-        self.evolution_client = None
-        self.message_processor = None
+    def __init__(self, max_owners: int = 50000):
+        self.instances: Dict[str, WhatsAppInstance] = {}
+        self.default_instance: Optional[str] = None
+        self.ring = ConsistentHashRing()
+        self.max_owners = max_owners
+        self._owners: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.poll_interval = int(os.getenv('WHATSAPP_STATUS_POLL_SECONDS', '30'))
+        # Cache vazio usado enquanto nenhuma instância estiver configurada
+        self._unconfigured_cache = WhatsAppConnectionCache(poll_interval=self.poll_interval)
         self.load_config()
     
+    # Compatibilidade: atributos da instância padrão
+    @property
+    def evolution_client(self) -> Optional[EvolutionAPIClient]:
+        instance = self.get_instance()
+        return instance.evolution_client if instance else None
+    
+    @property
+    def message_processor(self) -> Optional[WhatsAppMessageProcessor]:
+        instance = self.get_instance()
+        return instance.message_processor if instance else None
+    
+    @property
+    def connection_cache(self) -> WhatsAppConnectionCache:
+        instance = self.get_instance()
+        return instance.connection_cache if instance else self._unconfigured_cache
+    
+    def get_instance(self, instance_name: Optional[str] = None) -> Optional[WhatsAppInstance]:
+        """Retorna a instância pelo nome, ou a padrão"""
+        return self.instances.get(instance_name or self.default_instance or '')
+    
+    def register_instance(self, evolution_client: EvolutionAPIClient, make_default: bool = False) -> WhatsAppInstance:
+        """Adiciona (ou substitui) uma instância no registro"""
+        instance = WhatsAppInstance(evolution_client, poll_interval=self.poll_interval)
+        with self._lock:
+            if instance.name not in self.instances:
+                self.ring.add(instance.name)
+            self.instances[instance.name] = instance
+            if make_default or not self.default_instance:
+                self.default_instance = instance.name
+        logging.info(f"Instância WhatsApp registrada: {instance.name} ({len(self.instances)} no total)")
+        return instance
+    
+    def remove_instance(self, instance_name: str) -> bool:
+        """Remove uma instância do registro; suas conversas migram pelo hash consistente"""
+        with self._lock:
+            if instance_name not in self.instances:
+                return False
+            del self.instances[instance_name]
+            self.ring.remove(instance_name)
+            for phone in [p for p, owner in self._owners.items() if owner == instance_name]:
+                del self._owners[phone]
+            if self.default_instance == instance_name:
+                self.default_instance = next(iter(self.instances), None)
+        return True
+    
     def load_config(self):
         """Carrega configuração da integração"""
         try:
             # Buscar configuração do arquivo ou variáveis de ambiente
             evolution_url = os.getenv('EVOLUTION_API_URL', '')
             evolution_key = os.getenv('EVOLUTION_API_KEY', '')
-            instance_name = os.getenv('EVOLUTION_INSTANCE_NAME', 'anna_bot')
+            instance_names = os.getenv('EVOLUTION_INSTANCE_NAMES') or os.getenv('EVOLUTION_INSTANCE_NAME', 'anna_bot')
             
             if evolution_url and evolution_key:
-                self.evolution_client = EvolutionAPIClient(
-                    base_url=evolution_url,
-                    api_key=evolution_key,
-                    instance_name=instance_name
-                )
-                
-                self.message_processor = WhatsAppMessageProcessor(self.evolution_client)
+                for instance_name in [name.strip() for name in instance_names.split(',') if name.strip()]:
+                    self.register_instance(EvolutionAPIClient(
+                        base_url=evolution_url,
+                        api_key=evolution_key,
+                        instance_name=instance_name
+                    ))
                 logging.info("Integração WhatsApp configurada a partir de variáveis de ambiente.")
             else:
                 logging.info("Variáveis de ambiente do WhatsApp não encontradas. A configuração pode ser feita pela UI.")
@@ -348,20 +898,23 @@ class WhatsAppIntegrationManager:
     
     def initialize_integration(self, evolution_url: str, evolution_key: str, 
                             instance_name: str = "anna_bot", webhook_url: str = None) -> Dict[str, Any]:
-        """Inicializa a integração completa"""
+        """Inicializa a integração completa de uma instância e a adiciona ao registro"""
         try:
             # Configurar cliente
-            self.evolution_client = EvolutionAPIClient(evolution_url, evolution_key, instance_name)
-            self.message_processor = WhatsAppMessageProcessor(self.evolution_client)
+            instance = self.register_instance(
+                EvolutionAPIClient(evolution_url, evolution_key, instance_name), make_default=True
+            )
+            client = instance.evolution_client
             
             result = {
                 'status': 'success',
+                'instance_name': instance.name,
                 'steps': []
             }
             
             # 1. Criar instância
             try:
-                instance_result = self.evolution_client.create_instance()
+                instance_result = client.create_instance()
                 result['steps'].append({'step': 'create_instance', 'status': 'success', 'data': instance_result})
             except Exception as e:
                 result['steps'].append({'step': 'create_instance', 'status': 'error', 'error': str(e)})
@@ -369,16 +922,18 @@ class WhatsAppIntegrationManager:
             # 2. Configurar webhook se fornecido
             if webhook_url:
                 try:
-                    webhook_result = self.evolution_client.setup_webhook(webhook_url)
+                    webhook_result = client.setup_webhook(webhook_url)
                     result['steps'].append({'step': 'setup_webhook', 'status': 'success', 'data': webhook_result})
                 except Exception as e:
                     result['steps'].append({'step': 'setup_webhook', 'status': 'error', 'error': str(e)})
             
             # 3. Obter QR Code
             try:
-                qr_result = self.evolution_client.get_qr_code()
+                qr_result = client.get_qr_code()
                 result['steps'].append({'step': 'get_qr_code', 'status': 'success', 'data': qr_result})
                 result['qr_code'] = qr_result.get('base64')
+                if result['qr_code']:
+                    instance.connection_cache.update(qr_code=result['qr_code'])
             except Exception as e:
                 result['steps'].append({'step': 'get_qr_code', 'status': 'error', 'error': str(e)})
             
@@ -391,42 +946,170 @@ class WhatsAppIntegrationManager:
                 'error': str(e)
             }
     
-    def get_connection_status(self) -> Dict[str, Any]:
-        """Verifica status da conexão"""
-        if not self.evolution_client:
+    def get_connection_status(self, instance_name: Optional[str] = None) -> Dict[str, Any]:
+        """Retorna o status da conexão a partir do cache (sem chamada à Evolution API)"""
+        instance = self.get_instance(instance_name)
+        if not instance:
             return {'status': 'not_configured'}
         
+        cache = instance.connection_cache
+        cache.ensure_poller()
+        if cache.snapshot().get('status') == 'unknown':
+            cache.refresh()
+        state = cache.snapshot()
+        state.pop('qr_code', None)
+        state['instance_name'] = instance.name
+        return state
+    
+    def get_qr_code(self, instance_name: Optional[str] = None) -> Optional[str]:
+        """Retorna o último QR Code em cache, consultando a Evolution API só se não houver nenhum"""
+        instance = self.get_instance(instance_name)
+        if not instance:
+            return None
+        
+        cache = instance.connection_cache
+        cache.ensure_poller()
+        state = cache.snapshot()
+        if not state.get('qr_code') and state.get('status') != 'open':
+            cache.refresh(max_age=cache.QR_REFRESH_MIN_SECONDS)
+            state = cache.snapshot()
+        return state.get('qr_code')
+    
+    def get_instances_overview(self) -> List[Dict[str, Any]]:
+        """Saúde e vazão de cada instância registrada"""
+        overview = []
+        for instance in list(self.instances.values()):
+            instance.connection_cache.ensure_poller()
+            info = instance.describe()
+            info['is_default'] = instance.name == self.default_instance
+            info['owned_conversations'] = self._count_owned(instance.name)
+            overview.append(info)
+        return overview
+    
+    def _remember_owner(self, phone_number: str, instance_name: str):
+        with self._lock:
+            self._owners[phone_number] = instance_name
+            self._owners.move_to_end(phone_number)
+            while len(self._owners) > self.max_owners:
+                self._owners.popitem(last=False)
+    
+    def _set_owner(self, phone_number: str, instance_name: str):
+        """Registra a dona da conversa no banco (e na memória, para quando o banco falhar)"""
+        self._remember_owner(phone_number, instance_name)
+        try:
+            from supabase_tools import supabase
+            
+            supabase.table('whatsapp_conversation_owners').upsert({
+                'phone_number': phone_number,
+                'instance_name': instance_name,
+                'updated_at': datetime.utcnow().isoformat()
+            }, on_conflict='phone_number').execute()
+        except Exception as e:
+            logging.error(f"Erro ao registrar dona da conversa {phone_number}: {e}")
+    
+    def _get_owner(self, phone_number: str) -> Optional[str]:
+        """Dona da conversa registrada no banco; sem banco, a última conhecida por este processo"""
+        try:
+            from supabase_tools import supabase
+            
+            rows = supabase.table('whatsapp_conversation_owners').select('instance_name').eq(
+                'phone_number', phone_number).limit(1).execute().data
+        except Exception as e:
+            logging.error(f"Erro ao consultar dona da conversa {phone_number}: {e}")
+            return self._owners.get(phone_number)
+        
+        owner = rows[0]['instance_name'] if rows else None
+        if owner:
+            self._remember_owner(phone_number, owner)
+        return owner
+    
+    def _count_owned(self, instance_name: str) -> int:
         try:
-            return self.evolution_client.check_connection_status()
+            from supabase_tools import supabase
+            
+            return supabase.table('whatsapp_conversation_owners').select('phone_number', count='exact').eq(
+                'instance_name', instance_name).limit(1).execute().count or 0
         except Exception as e:
-            return {'status': 'error', 'error': str(e)}
+            logging.error(f"Erro ao contar conversas da instância {instance_name}: {e}")
+            with self._lock:
+                return sum(1 for owner in self._owners.values() if owner == instance_name)
+    
+    def route_outbound(self, phone_number: str) -> Optional[WhatsAppInstance]:
+        """Instância dona da conversa; contatos novos vão por hash consistente às instâncias saudáveis"""
+        clean_number = ''.join(filter(str.isdigit, phone_number))
+        owner = self._get_owner(clean_number)
+        if owner in self.instances and self.instances[owner].is_healthy():
+            return self.instances[owner]
+        
+        for instance in self.instances.values():
+            instance.connection_cache.ensure_poller()
+        
+        name = self.ring.lookup(clean_number, accept=lambda n: n in self.instances and self.instances[n].is_healthy())
+        if not name:
+            # Nenhuma instância saudável: usa o hash mesmo assim (ou a padrão)
+            name = self.ring.lookup(clean_number) or self.default_instance
+        instance = self.instances.get(name) if name else None
+        if instance:
+            self._set_owner(clean_number, instance.name)
+        return instance
     
-    def send_message(self, phone_number: str, message: str) -> Dict[str, Any]:
-        """Envia mensagem via WhatsApp"""
-        if not self.evolution_client:
+    def send_message(self, phone_number: str, message: str, instance_name: Optional[str] = None) -> Dict[str, Any]:
+        """Envia mensagem via WhatsApp pela instância dona da conversa"""
+        instance = self.get_instance(instance_name) if instance_name else self.route_outbound(phone_number)
+        if not instance:
             return {'status': 'error', 'error': 'WhatsApp not configured'}
         
         try:
-            return self.evolution_client.send_text_message(phone_number, message)
+            result = instance.evolution_client.send_text_message(phone_number, message)
+            instance.record(messages_sent=1)
+            return result
         except Exception as e:
+            instance.record(errors=1)
             return {'status': 'error', 'error': str(e)}
     
     def process_webhook(self, webhook_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Processa webhook recebido"""
-        if not self.message_processor:
+        """Processa webhook recebido, roteando pelo nome da instância"""
+        instance_name = webhook_data.get('instance')
+        instance = self.get_instance(instance_name) or self.get_instance()
+        if not instance:
             return {'status': 'error', 'error': 'Message processor not initialized'}
+        if instance_name and instance.name != instance_name:
+            logging.warning(f"Webhook de instância desconhecida '{instance_name}', usando {instance.name}")
+        
+        instance.record(webhooks_received=1)
+        
+        # Eventos de conexão/QR Code só atualizam o cache de status
+        if instance.connection_cache.handle_webhook_event(webhook_data):
+            return {'status': 'success', 'processed': True, 'response_sent': False}
+        
+        # A instância que recebeu a mensagem passa a ser dona da conversa
+        if webhook_data.get('event') == 'messages.upsert':
+            for message in (webhook_data.get('data') or {}).get('messages', []):
+                if not message.get('key', {}).get('fromMe'):
+                    phone_number = instance.message_processor.extract_phone_number(message)
+                    if phone_number:
+                        self._set_owner(phone_number, instance.name)
         
         try:
-            response = self.message_processor.process_incoming_message(webhook_data)
+            started = time.monotonic()
+            response = instance.message_processor.process_incoming_message(webhook_data)
+            if response is not None:
+                instance.record(messages_replied=1, total_processing_ms=(time.monotonic() - started) * 1000)
             return {
                 'status': 'success',
                 'processed': True,
+                'instance_name': instance.name,
                 'response_sent': response is not None,
                 'response': response
             }
+        except WhatsAppTurnError as e:
+            instance.record(errors=1)
+            logging.warning(f"Webhook será reenviado: {e}")
+            return {'status': 'error', 'error': str(e), 'retry': True}
         except Exception as e:
+            instance.record(errors=1)
             logging.error(f"Erro ao processar webhook: {e}")
             return {'status': 'error', 'error': str(e)}
 
 # Instância global
-whatsapp_manager = WhatsAppIntegrationManager()
\ No newline at end of file
+whatsapp_manager = WhatsAppIntegrationManager()